@@ -0,0 +1,120 @@
+import sys
+import json
+import numpy as np
+from score_store import get_store
+from scoring import SCALE, topic_metrics
+from topic_configs import TOPIC_CONFIG
+from tracing import span
+
+# ────────────────────────────────────────────────
+# Weights & polarity
+# ────────────────────────────────────────────────
+# Scale labels -> 0..1 ("very poor" 0.0 ... "excellent" 1.0)
+SCALE_VALUES = {label: i / (len(SCALE) - 1) for i, label in enumerate(SCALE)}
+# Score of a district without a single usable metric
+NEUTRAL_SCORE = 0.5
+
+
+def metric_weights(topic, weights=None, polarity=None):
+    """
+    Returns (names, weights, polarity) arrays for a topic's metrics.
+    Weights default to 1 and come from TOPIC_CONFIG[topic]['weights']. Polarity
+    defaults to 1, since the prompt rates every metric on the same quality scale
+    ("excellent" is always good); TOPIC_CONFIG[topic]['polarity'] sets -1 for a
+    metric whose prompt asks for a severity instead. The weights/polarity
+    arguments override the config, e.g. to try out a weighting without editing it.
+    """
+    config = TOPIC_CONFIG.get(topic, {})
+    weights = {**config.get("weights", {}), **(weights or {})}
+    polarity = {**config.get("polarity", {}), **(polarity or {})}
+    names = [name for name, _ in topic_metrics(topic)]
+    return (
+        names,
+        np.array([float(weights.get(name, 1.0)) for name in names]),
+        np.array([polarity.get(name, 1) for name in names], dtype=float),
+    )
+
+
+# ────────────────────────────────────────────────
+# Vectorized aggregation
+# ────────────────────────────────────────────────
+
+def metrics_matrix(metrics_rows, names):
+    """
+    Dense (districts x metrics) float array of scale values from a list of
+    {metric: label} dicts. Missing metrics and labels outside SCALE are NaN.
+    """
+    values = np.full((len(metrics_rows), len(names)), np.nan)
+    columns = {name: j for j, name in enumerate(names)}
+    for i, metrics in enumerate(metrics_rows):
+        for name, label in (metrics or {}).items():
+            j = columns.get(name)
+            if j is not None and isinstance(label, str):
+                values[i, j] = SCALE_VALUES.get(label.strip().lower(), np.nan)
+    return values
+
+
+def aggregate(values, weights, polarity):
+    """
+    Weighted mean of each row in one pass. Metrics with polarity < 0 count as
+    1 - value; NaN (unknown) values are left out of both the sum and the weights.
+    Rows without any known metric get NEUTRAL_SCORE. Scores are rounded to 2 decimals.
+    """
+    oriented = np.where(polarity < 0, 1.0 - values, values)
+    known = ~np.isnan(values)
+    weight = np.where(known, weights, 0.0)
+    total = (np.where(known, oriented, 0.0) * weight).sum(axis=1)
+    weight_sum = weight.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.where(weight_sum > 0, total / weight_sum, NEUTRAL_SCORE)
+    return np.round(scores, 2)
+
+
+def score_metrics(metrics, topic):
+    """0–1 score of one district's metrics with the topic's weights and polarity."""
+    names, weights, polarity = metric_weights(topic)
+    if not names:
+        # Topic without a metric list: equal weights over whatever metrics were returned
+        names = list(metrics or {})
+        weights, polarity = np.ones(len(names)), np.ones(len(names))
+    return float(aggregate(metrics_matrix([metrics], names), weights, polarity)[0])
+
+
+def rescore(country, topic, city=None, weights=None, polarity=None, store=None, save=True):
+    """
+    Recomputes the scores of every stored district of a country (or one city)
+    from their stored metrics in one vectorized pass, without any LLM calls.
+    Returns {(city, district): score}; with save=True the scores are written back
+    (updated_at is kept, since the evidence did not change). Rows without a single
+    known metric (e.g. legacy {district: score} imports) keep their stored score.
+    """
+    store = store or get_store()
+    names, weight_array, polarity_array = metric_weights(topic, weights, polarity)
+    with span("rescore", country=country, topic=topic, city=city) as rescore_span:
+        rows = store.get_metrics(country, topic, city=city)
+        values = metrics_matrix([metrics for _, _, metrics in rows], names)
+        scores = aggregate(values, weight_array, polarity_array)
+        has_metrics = ~np.isnan(values).all(axis=1)
+        results = {(row_city, district): float(score)
+                   for (row_city, district, _), score, known in zip(rows, scores, has_metrics) if known}
+        if save:
+            store.update_scores(country, topic, [(c, d, s) for (c, d), s in results.items()])
+        rescore_span.set(districts=len(results), without_metrics=len(rows) - len(results))
+    return results
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if len(args) < 2:
+        print("Usage: python aggregation.py <Country> <topic> [City] [--weights '{\"metric\": 2}'] [--dry-run]")
+        sys.exit(1)
+    weights = None
+    if "--weights" in sys.argv:
+        weights = json.loads(sys.argv[sys.argv.index("--weights") + 1])
+        args = [arg for arg in args if arg != sys.argv[sys.argv.index("--weights") + 1]]
+    results = rescore(args[0], args[1], city=args[2] if len(args) > 2 else None,
+                      weights=weights, save="--dry-run" not in sys.argv)
+    ranked = sorted(results.items(), key=lambda item: item[1], reverse=True)
+    for i, ((city, district), score) in enumerate(ranked[:20], 1):
+        print(f"{i}. {district}, {city} — {score:.2f}")
+    print(f"✅ Re-scored {len(results)} districts of {args[0]} for {args[1]}")
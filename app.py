@@ -2,14 +2,29 @@
 import streamlit as st
 import os
 import json
+import time
 import folium
+import dotenv
 from streamlit_folium import st_folium
-from map_tool import create_base_map, add_geojson_layer, get_country_subareas, ensure_geojson
-from main import score_district
+from map_tool import (create_base_map, add_geojson_layer, get_country_subareas, ensure_geojson, city_layer_files,
+                      diff_scores, score_delta_layer)
+from geometry import geometry_exists, pyramid_file_for_zoom
+from jobs import get_queue, ensure_workers
+from layer_registry import get_registry
+from score_store import get_store, is_fresh, topic_ttl_days, freshness_label
+from tiles import add_tile_layer, build_tiles, read_manifest
+from spatial_index import get_country_index
 from country_configs import COUNTRY_CONFIGS
+from tracing import span, recent_traces, stage_summary, flatten
 
 # ─────────────────────────────────────
 st.set_page_config(layout="wide")
+dotenv.load_dotenv()
+# APP_MODE=viewer serves already-scored maps read-only: the scoring pipeline
+# (LangChain, search tools, LLM client) is never imported
+VIEWER_MODE = os.getenv("APP_MODE", "full").lower() == "viewer"
+# Changed districts sent as restyle deltas before the base map (with geometry) is rebuilt
+REBASE_AFTER = 200
 # ─────────────────────────────────────
 # Session State Defaults for Multi-Layer Maps
 # ─────────────────────────────────────
@@ -21,70 +36,110 @@ if "selected_topic" not in st.session_state:
     st.session_state.selected_topic = "cleanliness-dirtiness"
 if "force_refresh" not in st.session_state:
     st.session_state.force_refresh = False
+if "retrieval_mode" not in st.session_state:
+    st.session_state.retrieval_mode = "agent"
+if "render_mode" not in st.session_state:
+    st.session_state.render_mode = "City layers"
 # Initialize map position once
 if "map_center" not in st.session_state:
     config = COUNTRY_CONFIGS.get(st.session_state.selected_country, {})
     st.session_state.map_center = config.get("map_center", [23.7, 121])
     st.session_state.map_zoom = config.get("map_zoom", 7)
 
-# State for triggering AI runs
-if "district_to_process" not in st.session_state:
-    st.session_state.district_to_process = None
-if "layer_to_process" not in st.session_state:
-    st.session_state.layer_to_process = None
+# Scoring runs in background worker processes (jobs.py); the session only enqueues and polls
+if "jobs_polled_at" not in st.session_state:
+    st.session_state.jobs_polled_at = time.time()
 
-# ─────────────────────────────────────
-# Layer-Aware AI Processing Block
-# ─────────────────────────────────────
-if st.session_state.district_to_process and st.session_state.layer_to_process:
-    layer_id = st.session_state.layer_to_process
-    district = st.session_state.district_to_process
-    
-    if layer_id in st.session_state.map_layers:
-        layer = st.session_state.map_layers[layer_id]
-        city, topic, country = layer["city"], layer["topic"], layer["country"]
-        with st.spinner(f"Running AI for {district} ({topic})..."):
-            try:
-                score_file = st.session_state.map_layers[layer_id]["score_file"]
-                result = score_district(data_file=score_file, city=city, country=country, topic=topic, district=district, logger=st.write, force_refresh=st.session_state.force_refresh)
-                score=result.get('score')
-                st.session_state.map_layers[layer_id]["scores"][district] = score
-                st.success(f"{district} ({topic}) scored: {score:.2f}")
-
-                # Save updated scores for the specific layer
-                with open(score_file, "w") as f:
-                    json.dump(st.session_state.map_layers[layer_id]["scores"], f, indent=2)
-
-            except Exception as e:
-                st.error(f"AI failed for {district}: {e}")
-                print(f"AI failed for {district}: {e}")
-            finally:
-                st.session_state.district_to_process = None
-                st.session_state.layer_to_process = None
-                st.rerun()
+def enqueue_districts(layer_id, districts, force_refresh=None):
+    """Queues scoring jobs for districts of a layer, starting the local workers if needed."""
+    layer = st.session_state.map_layers[layer_id]
+    ensure_workers()
+    return get_queue().enqueue_many(
+        layer["country"], layer["city"], layer["topic"], districts,
+        data_file=layer["score_file"],
+        retrieval_mode=st.session_state.retrieval_mode,
+        force_refresh=st.session_state.force_refresh if force_refresh is None else force_refresh,
+    )
+
+@st.fragment(run_every=2)
+def job_status():
+    """Folds finished jobs into the layer scores and shows queue progress."""
+    queue = get_queue()
+    layers = {(layer["country"], layer["city"], layer["topic"]): layer_id
+              for layer_id, layer in st.session_state.map_layers.items()}
+    changed = False
+    for job in queue.finished_since(st.session_state.jobs_polled_at):
+        st.session_state.jobs_polled_at = job["finished_at"]
+        layer_id = layers.get((job["country"], job["city"], job["topic"]))
+        if layer_id is None:
+            continue
+        if job["status"] == "done" and job["score"] is not None:
+            st.session_state.map_layers[layer_id]["scores"][job["district"]] = job["score"]
+            st.toast(f"{job['district']} ({job['topic']}) scored: {job['score']:.2f}")
+            changed = True
+        elif job["status"] == "failed":
+            st.toast(f"❌ AI failed for {job['district']}: {job['error']}")
+
+    counts = queue.active_counts(list(layers))
+    if counts["queued"] or counts["running"]:
+        st.caption(f"⏳ {counts['running']} scoring, {counts['queued']} queued")
+        for job in queue.running_jobs(list(layers)):
+            st.caption(f"🔎 {job['district']} ({job['topic']}): {job['progress'] or 'starting'}")
+    if changed:
+        st.rerun()  # sends the new scores to the map as restyle deltas
 
 # ─────────────────────────────────────
 # Main View: Map Rendering
 # ─────────────────────────────────────
-m, colormap= create_base_map(st.session_state.map_center, st.session_state.map_zoom, (st.session_state.district_to_process is None))
-if not st.session_state.map_layers:
-    map_data = st_folium(m, width=1200, height=800, key="map_output_initial")
-else:
-    for layer_id, layer_data in st.session_state.map_layers.items():
-        # Robustly check if the item is a valid layer dictionary
-        if isinstance(layer_data, dict) and "city" in layer_data:
+with span("render_map", mode=st.session_state.render_mode, layers=len(st.session_state.map_layers)):
+    # One base map per rerun, built in the branch that renders it
+    if st.session_state.render_mode == "Country tiles":
+        # Country-wide heatmap from pre-rendered vector tiles; the browser only loads tiles in view
+        m, colormap = create_base_map(st.session_state.map_center, st.session_state.map_zoom)
+        add_tile_layer(m, st.session_state.selected_country, st.session_state.selected_topic)
+        folium.LayerControl().add_to(m)
+        map_data = st_folium(m, width=1200, height=800, key="map_output_tiles")
+    elif not st.session_state.map_layers:
+        m, colormap = create_base_map(st.session_state.map_center, st.session_state.map_zoom)
+        map_data = st_folium(m, width=1200, height=800, key="map_output_initial")
+    else:
+        # The base map embeds the geometry with a snapshot of the scores and stays mounted in the
+        # browser while it is unchanged; newer scores are sent as small restyle deltas
+        layers = {layer_id: layer_data for layer_id, layer_data in st.session_state.map_layers.items()
+                  if isinstance(layer_data, dict) and "city" in layer_data}
+        signature = [(layer_id, pyramid_file_for_zoom(layer_data["geo_file"], st.session_state.map_zoom),
+                      layer_data["is_visible"]) for layer_id, layer_data in layers.items()]
+        base = st.session_state.get("map_base")
+        deltas = {}
+        if base is not None and base["signature"] == signature:
+            deltas = {layer_id: diff_scores(base["scores"][layer_id], layer_data["scores"])
+                      for layer_id, layer_data in layers.items()}
+        if base is None or base["signature"] != signature or sum(map(len, deltas.values())) > REBASE_AFTER:
+            base = st.session_state.map_base = {
+                "signature": signature,
+                "center": st.session_state.map_center,
+                "zoom": st.session_state.map_zoom,
+                "scores": {layer_id: dict(layer_data["scores"]) for layer_id, layer_data in layers.items()},
+            }
+            deltas = {}
+        m, colormap = create_base_map(base["center"], base["zoom"])
+
+        for layer_id, layer_data in layers.items():
             add_geojson_layer(
                 map_object=m,
                 colormap=colormap,
                 city=layer_data["city"],
                 topic=layer_data["topic"],
-                scores=layer_data["scores"],
+                scores=base["scores"][layer_id],
                 is_visible=layer_data["is_visible"],
                 geo_file=layer_data["geo_file"],
+                zoom=base["zoom"],
+                geometry=layer_data["layer"].geometry,
             )
     
-    folium.LayerControl().add_to(m)
-    map_data = st_folium(m, width=1200, height=800, key="map_output_layers")
+        folium.LayerControl().add_to(m)
+        map_data = st_folium(m, width=1200, height=800, key="map_output_layers",
+                             feature_group_to_add=score_delta_layer(colormap, deltas))
 
 
 
@@ -121,6 +176,9 @@ if os.path.exists(CACHE_FILE):
     # Load cached cities
     with open(CACHE_FILE, "r", encoding="utf-8") as f:
         country_cities = json.load(f)
+elif VIEWER_MODE:
+    # No network in viewer mode: offer the cities already on disk
+    country_cities = sorted(os.listdir(os.path.dirname(CACHE_FILE))) or ["Hsinchu County"]
 else:
     # Fetch from OSM and save
     geojson_country, _ = get_country_subareas(country_input)
@@ -144,15 +202,39 @@ topic_input = st.sidebar.selectbox(
     ["cleanliness-dirtiness"],
     index=["cleanliness-dirtiness"].index(st.session_state.selected_topic)
 )
-st.session_state.force_refresh = st.sidebar.checkbox(
-    "Force refresh (ignore cached scores)",
-    value=st.session_state.force_refresh
+if VIEWER_MODE:
+    st.sidebar.caption("👀 Read-only viewer: showing stored scores")
+else:
+    st.session_state.force_refresh = st.sidebar.checkbox(
+        "Force refresh (ignore cached scores)",
+        value=st.session_state.force_refresh
+    )
+    st.session_state.retrieval_mode = st.sidebar.selectbox(
+        "Retrieval",
+        ["agent", "fast"],
+        index=["agent", "fast"].index(st.session_state.retrieval_mode),
+        help="fast: fixed query plan searched in parallel, one LLM call per district"
+    )
+render_mode = st.sidebar.radio(
+    "Rendering",
+    ["City layers", "Country tiles"],
+    index=["City layers", "Country tiles"].index(st.session_state.render_mode)
 )
+if render_mode != st.session_state.render_mode:
+    st.session_state.render_mode = render_mode
+    st.rerun()
+if render_mode == "Country tiles":
+    manifest = read_manifest(country_input, topic_input)
+    label = "Build country tiles" if manifest is None else "Rebuild country tiles (refresh scores)"
+    if not VIEWER_MODE and st.sidebar.button(label):
+        with st.spinner(f"Building {country_input} tiles..."):
+            build_tiles(country_input, topic_input)
+        st.rerun()
+    if manifest is None:
+        st.sidebar.info("No tiles built yet for this country and metric.")
 if topic_input != st.session_state.selected_topic:
     st.session_state.selected_topic = topic_input
     st.session_state.map_layers = {}  
-    st.session_state.district_to_process = None
-    st.session_state.layer_to_process = None
     st.rerun()
 
 if st.sidebar.button("Add Map Layer"):
@@ -166,23 +248,30 @@ if st.sidebar.button("Add Map Layer"):
 
     layer_id = f"{city_input}_{topic_input}"
 
-    geo_file, score_file = ensure_geojson(city_input, topic_input, country=country_input)
-    scores = {}
-    if os.path.exists(score_file):
-        with open(score_file, "r", encoding="utf-8") as f:
-            scores = json.load(f)
-
-    st.session_state.map_layers[layer_id] = {
-        "city": city_input,
-        "country": country_input,
-        "topic": topic_input,
-        "scores": scores,
-        "is_visible": True,
-        "geo_file": geo_file,
-        "score_file": score_file,
-    }
+    if VIEWER_MODE:
+        # Read-only: use the geometry already on disk, without building pyramids, indexes or importing scores
+        geo_file, score_file = city_layer_files(city_input, topic_input, country=country_input)
+        if not geometry_exists(geo_file):
+            st.sidebar.warning(f"{city_input} has not been fetched yet; the viewer only shows existing maps.")
+            geo_file = None
+    else:
+        geo_file, score_file = ensure_geojson(city_input, topic_input, country=country_input)
+    if geo_file is not None:
+        # Geometry and scores are shared with every session showing the same layer
+        layer = get_registry().acquire(country_input, city_input, topic_input, geo_file)
 
-    st.rerun()
+        st.session_state.map_layers[layer_id] = {
+            "city": city_input,
+            "country": country_input,
+            "topic": topic_input,
+            "layer": layer,
+            "scores": layer.scores,
+            "is_visible": True,
+            "geo_file": geo_file,
+            "score_file": score_file,
+        }
+
+        st.rerun()
 
 # ─────────────────────────────────────
 # Multi-Layer Click Handling
@@ -194,13 +283,58 @@ if map_data and map_data.get("last_active_drawing"):
     props = map_data["last_active_drawing"]["properties"]
     district, layer_id = props.get("district"), props.get("layer_id")
     if district and layer_id and layer_id in st.session_state.map_layers:
-        layer_scores = st.session_state.map_layers[layer_id]["scores"]
+        layer = st.session_state.map_layers[layer_id]
+        layer_scores = layer["scores"]
         if district in layer_scores and not st.session_state.force_refresh:
-            st.info(f"{district} ({st.session_state.map_layers[layer_id]['topic']}) already scored: {layer_scores[district]:.2f}")
+            updated_at = get_store().get_updated_at(layer["country"], layer["city"], layer["topic"]).get(district)
+            age = f" ({freshness_label(updated_at)})" if updated_at is not None else ""
+            if updated_at is None or is_fresh(updated_at, topic_ttl_days(layer["topic"])) or VIEWER_MODE:
+                st.info(f"{district} ({layer['topic']}) already scored: {layer_scores[district]:.2f}{age}")
+            else:
+                # Stale-while-revalidate: show the old score now, re-score in the background
+                st.info(f"{district} ({layer['topic']}) scored {layer_scores[district]:.2f}{age}; "
+                        f"stale, refreshing in the background")
+                if district not in get_queue().active_districts(layer["country"], layer["city"], layer["topic"]):
+                    enqueue_districts(layer_id, [district], force_refresh=False)
+        elif VIEWER_MODE:
+            st.info(f"{district} has not been scored yet (read-only viewer).")
         else:
-            st.session_state.district_to_process = district
-            st.session_state.layer_to_process = layer_id
-            st.rerun()
+            layer = st.session_state.map_layers[layer_id]
+            if district in get_queue().active_districts(layer["country"], layer["city"], layer["topic"]):
+                st.info(f"{district} ({layer['topic']}) is already queued for scoring.")
+            else:
+                enqueue_districts(layer_id, [district])
+                st.toast(f"Queued {district} ({layer['topic']}) for scoring")
+
+# Tile mode has no per-feature click events, so resolve the clicked point through the spatial index
+if st.session_state.render_mode == "Country tiles" and map_data and map_data.get("last_clicked"):
+    clicked = map_data["last_clicked"]
+    country_index = get_country_index(st.session_state.selected_country, st.session_state.selected_topic)
+    match = country_index.lookup([(clicked["lat"], clicked["lng"])])[0]
+    if match:
+        city, district, score = match
+        score_text = f"{score:.2f}" if score is not None else "not scored yet"
+        st.info(f"{district}, {city} ({st.session_state.selected_topic}): {score_text}")
+
+# ─────────────────────────────────────
+# Background Scoring Jobs
+# ─────────────────────────────────────
+if st.session_state.map_layers and not VIEWER_MODE:
+    if st.sidebar.button("Score all unscored districts"):
+        queued = 0
+        for layer_id, layer_data in st.session_state.map_layers.items():
+            unscored = [d for d in layer_data["layer"].geometry.districts if d not in layer_data["scores"]]
+            queued += len(enqueue_districts(layer_id, unscored))
+        st.sidebar.success(f"Queued {queued} districts for scoring")
+    if st.sidebar.button("Refresh stale districts"):
+        queued = 0
+        for layer_id, layer_data in st.session_state.map_layers.items():
+            stale = get_store().stale_districts(layer_data["country"], layer_data["city"], layer_data["topic"])
+            # Stale scores are cache misses for score_district, so no force refresh is needed
+            queued += len(enqueue_districts(layer_id, stale, force_refresh=False))
+        st.sidebar.success(f"Queued {queued} stale districts for re-scoring")
+    with st.sidebar:
+        job_status()
 
 # ─────────────────────────────────────
 # Sidebar Rankings per Layer
@@ -211,6 +345,25 @@ if st.session_state.map_layers:
     for layer_id, layer_data in st.session_state.map_layers.items():
         if isinstance(layer_data, dict) and layer_data.get("scores"):
             st.sidebar.markdown(f"**{layer_id}**")
+            stale = set(get_store().stale_districts(layer_data["country"], layer_data["city"], layer_data["topic"]))
+            unscored = len(layer_data["layer"].geometry.districts) - len(layer_data["scores"])
+            st.sidebar.caption(f"🟢 {len(layer_data['scores']) - len(stale)} fresh · 🟠 {len(stale)} stale · "
+                               f"⚪ {max(unscored, 0)} unscored (fresh for {topic_ttl_days(layer_data['topic'])} days)")
             sorted_scores = sorted(layer_data["scores"].items(), key=lambda x: x[1], reverse=True)
             for i, (district, score) in enumerate(sorted_scores[:10], 1):
-                st.sidebar.write(f"{i}. {district} — {score:.2f}")
\ No newline at end of file
+                st.sidebar.write(f"{i}. {district} — {score:.2f}{' 🟠' if district in stale else ''}")
+
+# ─────────────────────────────────────
+# Trace Panel
+# ─────────────────────────────────────
+# Scoring runs in the job workers, so their traces come from the trace file
+traces = recent_traces()
+if traces:
+    with st.expander("🧭 Traces (latency, calls, tokens, cache hits)", expanded=False):
+        st.markdown("**Time per stage** (recent traces of the app and job workers)")
+        st.dataframe(stage_summary(traces), use_container_width=True)
+        labels = [f"{t.name} {' '.join(str(v) for v in t.attrs.values())} — {t.duration * 1000:.0f} ms" for t in traces]
+        selected = st.selectbox("Trace", range(len(traces)), format_func=lambda i: labels[i])
+        trace = traces[selected]
+        st.write({key: value for key, value in sorted(trace.totals().items())})
+        st.dataframe(flatten(trace), use_container_width=True)
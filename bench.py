@@ -0,0 +1,498 @@
+"""
+Stage-level benchmarks.
+
+Times each pipeline stage separately (geocode, Overpass fetch + osm2geojson,
+GeoJSON load/annotate, folium HTML, retrieval, scoring, cache read/write) on
+the real city data in countries/ and on synthetic cities with hundreds of
+districts. External calls, including the scoring model, are served from the
+replay cassette fixtures/bench.json.gz (see replay.py).
+
+    python bench.py                                   # run everything, compare to bench_thresholds.json
+    python bench.py --record                          # refresh the cassette from the live services
+    python bench.py --synthesize                      # rebuild it offline (see bench_fixtures.py)
+    python bench.py --stages load_annotate,folium_html --synthetic 300,1000
+    python bench.py --baseline old_results.json       # also compare against a previous run
+
+Results are written as JSON (--output). The exit code is 1 when the cassette
+is missing or a stage errors, is skipped, or regresses past its threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import fnmatch
+import argparse
+import platform
+import tempfile
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_ROOT)
+
+import replay
+from geometry import write_compact, read_index
+
+STAGES = ["geocode", "overpass", "load_annotate", "folium_html", "retrieval", "scoring", "cache_write", "cache_read"]
+# Stages that talk to external services and need the cassette
+NETWORK_STAGES = {"geocode", "overpass", "retrieval"}
+
+# Real data shipped in countries/ (geometry may be missing for some cities)
+REAL_CITIES = [("Taiwan", "Taipei"), ("Taiwan", "Taichung")]
+BENCH_TOPIC = "cleanliness-dirtiness"
+
+DEFAULT_CASSETTE = os.path.join(REPO_ROOT, "fixtures", "bench.json.gz")
+DEFAULT_THRESHOLDS = os.path.join(REPO_ROOT, "bench_thresholds.json")
+DEFAULT_OUTPUT = "bench_results.json"
+
+SAMPLE_SOURCES = [
+    "District sanitation report: street cleaning coverage and waste collection statistics (2023).",
+    "Residents report illegal dumping near the night market; the district office issued fines.",
+    "Volunteer clean-up along the riverside park collected 2 tons of waste.",
+]
+
+
+class Skip(Exception):
+    """Stage cannot run with the available data; reported as a failure."""
+
+
+# ────────────────────────────────────────────────
+# Datasets
+# ────────────────────────────────────────────────
+
+def _city_folder(root, country, city):
+    for name in (country, country.lower()):
+        folder = os.path.join(root, "countries", name, city)
+        if os.path.isdir(folder):
+            return folder
+    return None
+
+
+def grid_features(names, lon0, lat0, points_per_edge=12, seed=0, first_id=900000):
+    """
+    Admin-level-7 boundary features for names laid out as a grid of 0.01° cells
+    from (lon0, lat0), with jittered, shared borders (points_per_edge vertices per side).
+    """
+    rng = random.Random(seed)
+    side = max(1, round(len(names) ** 0.5))
+    rows = (len(names) + side - 1) // side
+    cell, step = 0.01, points_per_edge
+
+    # Shared vertex lattice, so neighbouring districts have identical borders
+    nx, ny = side * step + 1, rows * step + 1
+    jitter = cell / step * 0.3
+    lattice = [[(lon0 + i * cell / step + (rng.uniform(-jitter, jitter) if 0 < i < nx - 1 else 0),
+                 lat0 + j * cell / step + (rng.uniform(-jitter, jitter) if 0 < j < ny - 1 else 0))
+                for j in range(ny)] for i in range(nx)]
+
+    features = []
+    for index, name in enumerate(names):
+        ci, cj = index % side, index // side
+        i0, j0, i1, j1 = ci * step, cj * step, (ci + 1) * step, (cj + 1) * step
+        ring = [lattice[i][j0] for i in range(i0, i1)]
+        ring += [lattice[i1][j] for j in range(j0, j1)]
+        ring += [lattice[i][j1] for i in range(i1, i0, -1)]
+        ring += [lattice[i0][j] for j in range(j1, j0, -1)]
+        ring.append(ring[0])
+        features.append({
+            "type": "Feature",
+            "properties": {"type": "relation", "id": first_id + index,
+                           "tags": {"name": name, "name:en": name, "admin_level": "7",
+                                    "boundary": "administrative"}},
+            "geometry": {"type": "Polygon", "coordinates": [[list(p) for p in ring]]},
+        })
+    return features
+
+
+def synthetic_city(n_districts, geo_file, points_per_edge=12, seed=0):
+    """Writes a grid city of n_districts districts near Taipei's coordinates."""
+    names = [f"District {index + 1:04d}" for index in range(n_districts)]
+    features = grid_features(names, 121.3, 24.9, points_per_edge=points_per_edge, seed=seed)
+    os.makedirs(os.path.dirname(geo_file), exist_ok=True)
+    write_compact({"type": "FeatureCollection", "features": features}, geo_file)
+    return geo_file
+
+
+def prepare_datasets(workspace, synthetic_sizes):
+    """
+    Copies the real cities into the workspace and generates synthetic ones.
+    Real cities without geometry get it through ensure_geojson, i.e. from the
+    replayed Overpass response, so every city has the same stages.
+    Returns {name: {"country", "city", "geo_file" or None, "districts"}}.
+    """
+    from map_tool import ensure_geojson
+    datasets = {}
+    for country, city in REAL_CITIES:
+        source = _city_folder(REPO_ROOT, country, city)
+        if source is None:
+            continue
+        shutil.copytree(source, os.path.join(workspace, "countries", country, city), dirs_exist_ok=True)
+        try:
+            geo_file, _ = ensure_geojson(city, BENCH_TOPIC, country=country)
+            districts = [entry["district"] for entry in read_index(geo_file)]
+        except Exception as e:
+            print(f"❌ No geometry for {city}: {type(e).__name__}: {e}")
+            geo_file, districts = None, []
+        datasets[city] = {"country": country, "city": city, "geo_file": geo_file,
+                          "districts": list(dict.fromkeys(districts))}
+
+    for size in synthetic_sizes:
+        name = f"synthetic-{size}"
+        geo_file = synthetic_city(size, os.path.join(workspace, "countries", "Synthetic", name, "map.geojson"))
+        datasets[name] = {"country": "Synthetic", "city": name, "geo_file": geo_file,
+                          "districts": [entry["district"] for entry in read_index(geo_file)]}
+    return datasets
+
+
+# ────────────────────────────────────────────────
+# Stages
+# Each stage takes (dataset, options) and returns a zero-argument callable to time.
+# ────────────────────────────────────────────────
+
+def _need_geometry(dataset):
+    if not dataset["geo_file"]:
+        raise Skip("no geometry for this city")
+
+
+def applies(stage, dataset, options):
+    """Stages that call external services (including the replayed model) only run on the real cities."""
+    external = stage in NETWORK_STAGES or (stage == "scoring" and options.llm == "replay")
+    return not (external and dataset["country"] == "Synthetic")
+
+
+def stage_geocode(dataset, options):
+    from map_tool import resolve_area
+    import map_tool
+    query = f"{dataset['city']}, {dataset['country']}"
+
+    def run():
+        map_tool.get_geocode_cache().clear()  # time the Nominatim round-trip, not the cache
+        location, _ = resolve_area(query, country=dataset["country"])
+        if location is None:
+            raise RuntimeError(f"could not resolve {query}")
+    return run
+
+
+def stage_overpass(dataset, options):
+    from map_tool import resolve_area, fetch_admin_boundaries
+    from country_configs import COUNTRY_CONFIGS
+    _, area_id = resolve_area(f"{dataset['city']}, {dataset['country']}", country=dataset["country"])
+    levels = COUNTRY_CONFIGS.get(dataset["country"], {}).get("district_levels", ["7", "8"])
+
+    def run():
+        by_level = fetch_admin_boundaries(area_id, levels)
+        if not any(geojson_data["features"] for geojson_data in by_level.values()):
+            raise RuntimeError("no features returned")
+    return run
+
+
+def stage_load_annotate(dataset, options):
+    _need_geometry(dataset)
+    from map_tool import load_annotated_features, clear_geojson_cache
+
+    def run():
+        clear_geojson_cache()
+        load_annotated_features(dataset["geo_file"])
+    return run
+
+
+def _scores(dataset):
+    rng = random.Random(dataset["city"])
+    return {district: round(rng.random(), 2) for district in dataset["districts"]}
+
+
+def stage_folium_html(dataset, options):
+    _need_geometry(dataset)
+    from map_tool import create_base_map, add_geojson_layer, load_annotated_features
+    scores = _scores(dataset)
+    load_annotated_features(dataset["geo_file"])  # time rendering, not the cold load
+
+    def run():
+        m, colormap = create_base_map()
+        add_geojson_layer(m, colormap, dataset["city"], BENCH_TOPIC, scores, geo_file=dataset["geo_file"])
+        m.get_root().render()
+    return run
+
+
+def _sample(dataset, options):
+    districts = dataset["districts"][:options.sample]
+    if not districts:
+        raise Skip("no districts")
+    return districts
+
+
+def stage_retrieval(dataset, options):
+    districts = _sample(dataset, options)
+    import main
+    from search_cache import SearchCache
+    from search_client import SearchClient, HOST_RATES
+
+    if not options.record:
+        main.SERPER_API_KEY = main.SERPER_API_KEY or "replay"  # never sent: calls are replayed
+        # Replayed calls reach no provider, so rate limits would only add sleeps
+        main.search_client = SearchClient(host_rates={host: (1e6, 1e6) for host in HOST_RATES},
+                                          backoff_base=0.0)
+
+    def run():
+        main.search_cache = SearchCache(path=os.path.join(tempfile.mkdtemp(dir=options.workspace), "search.sqlite3"))
+        for district in districts:
+            main.retrieve_evidence(district, dataset["city"], dataset["country"], BENCH_TOPIC,
+                                   retrieval_mode="fast")
+    return run
+
+
+def stage_scoring(dataset, options):
+    districts = _sample(dataset, options)
+    from scoring import score_evidence
+    from llm_cache import DiskLLMCache
+    if options.llm == "local":
+        from local_model import LocalScoringModel
+        llm = LocalScoringModel()
+    else:
+        import main
+        main.LLM_BACKEND = "openrouter"
+        if not options.record:
+            main.OPENROUTER_API_KEY = main.OPENROUTER_API_KEY or "replay"  # never sent: calls are replayed
+        llm = main.get_llm()
+    sources = [{"tool": "Serper", "text": text} for text in SAMPLE_SOURCES]
+
+    def run():
+        if options.llm != "local":
+            llm.cache = DiskLLMCache(path=os.path.join(tempfile.mkdtemp(dir=options.workspace), "llm.sqlite3"))
+        for district in districts:
+            score_evidence(llm, district, dataset["city"], dataset["country"], BENCH_TOPIC, sources)
+    return run
+
+
+def _cache_records(dataset):
+    rng = random.Random(dataset["city"])
+    return {district: {"tool_results": [{"tool": "Serper", "text": t} for t in SAMPLE_SOURCES],
+                       "metrics": {"street_cleanliness": "good"}, "score": round(rng.random(), 2)}
+            for district in dataset["districts"]}
+
+
+def _open_caches(options, name):
+    from search_cache import SearchCache
+    from score_store import ScoreStore
+    folder = os.path.join(options.workspace, "caches", name)
+    os.makedirs(folder, exist_ok=True)
+    return SearchCache(path=os.path.join(folder, "search.sqlite3")), ScoreStore(path=os.path.join(folder, "scores.sqlite3"))
+
+
+def _write_caches(dataset, search_cache, store, records):
+    for district, record in records.items():
+        text = "\n\n".join(s["text"] for s in record["tool_results"])
+        search_cache.put("serper", f"{district} {dataset['city']} {BENCH_TOPIC}", text)
+        store.upsert(dataset["country"], dataset["city"], BENCH_TOPIC, district, record)
+
+
+def stage_cache_write(dataset, options):
+    if not dataset["districts"]:
+        raise Skip("no districts")
+    records = _cache_records(dataset)
+    runs = iter(range(10 ** 6))
+
+    def run():
+        search_cache, store = _open_caches(options, f"write-{dataset['city']}-{next(runs)}")
+        _write_caches(dataset, search_cache, store, records)
+    return run
+
+
+def stage_cache_read(dataset, options):
+    if not dataset["districts"]:
+        raise Skip("no districts")
+    search_cache, store = _open_caches(options, f"read-{dataset['city']}")
+    _write_caches(dataset, search_cache, store, _cache_records(dataset))
+
+    def run():
+        for district in dataset["districts"]:
+            if search_cache.get("serper", f"{district} {dataset['city']} {BENCH_TOPIC}") is None:
+                raise RuntimeError(f"search cache miss for {district}")
+            store.get(dataset["country"], dataset["city"], BENCH_TOPIC, district)
+        store.get_scores(dataset["country"], dataset["city"], BENCH_TOPIC)
+    return run
+
+
+STAGE_FUNCTIONS = {
+    "geocode": stage_geocode,
+    "overpass": stage_overpass,
+    "load_annotate": stage_load_annotate,
+    "folium_html": stage_folium_html,
+    "retrieval": stage_retrieval,
+    "scoring": stage_scoring,
+    "cache_write": stage_cache_write,
+    "cache_read": stage_cache_read,
+}
+
+
+# ────────────────────────────────────────────────
+# Runner
+# ────────────────────────────────────────────────
+
+def run_stage(stage, dataset, options):
+    result = {"stage": stage, "dataset": dataset["city"], "key": f"{stage}/{dataset['city']}"}
+    try:
+        func = STAGE_FUNCTIONS[stage](dataset, options)
+        func()  # warm-up run, not timed
+        timings = []
+        for _ in range(options.repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+    except Skip as e:
+        return dict(result, status="skipped", reason=str(e))
+    except Exception as e:
+        return dict(result, status="error", reason=f"{type(e).__name__}: {e}")
+    return dict(result, status="ok", runs=len(timings),
+                median=round(statistics.median(timings), 5),
+                min=round(min(timings), 5), max=round(max(timings), 5))
+
+
+def load_thresholds(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _threshold_for(key, thresholds):
+    """The most specific pattern wins: exact key, then the longest matching glob."""
+    stages = thresholds.get("stages", {})
+    if key in stages:
+        return stages[key]
+    matches = [pattern for pattern in stages if fnmatch.fnmatch(key, pattern)]
+    return stages[max(matches, key=len)] if matches else None
+
+
+def check_regressions(results, thresholds, baseline=None):
+    """
+    Marks each ok result with the limits it was checked against.
+    A stage regresses when its median exceeds its max_seconds, or exceeds the
+    baseline median by more than tolerance (relative) and min_delta (seconds).
+    Errors and skipped stages fail too, since they were not measured at all.
+    Returns the list of failure messages.
+    """
+    tolerance = thresholds.get("tolerance", 0.25)
+    min_delta = thresholds.get("min_delta", 0.005)
+    baseline_medians = {r["key"]: r["median"] for r in (baseline or {}).get("results", []) if r.get("status") == "ok"}
+
+    failures = []
+    for result in results:
+        if result["status"] in ("error", "skipped"):
+            failures.append(f"{result['key']}: {result['status']}: {result['reason']}")
+            continue
+        if result["status"] != "ok":
+            continue
+        limit = _threshold_for(result["key"], thresholds)
+        if limit and result["median"] > limit.get("max_seconds", float("inf")):
+            result["regressed"] = True
+            failures.append(f"{result['key']}: {result['median']:.4f}s > max {limit['max_seconds']}s")
+        previous = baseline_medians.get(result["key"])
+        if previous is not None:
+            stage_tolerance = (limit or {}).get("tolerance", tolerance)
+            result["baseline"] = previous
+            if result["median"] > previous * (1 + stage_tolerance) and result["median"] - previous > min_delta:
+                result["regressed"] = True
+                failures.append(f"{result['key']}: {result['median']:.4f}s vs baseline {previous:.4f}s "
+                                f"(+{(result['median'] / previous - 1) * 100:.0f}%)")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stage-level benchmarks for agent-maps")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to run")
+    parser.add_argument("--datasets", default="", help="comma-separated dataset names (default: all)")
+    parser.add_argument("--synthetic", default="300,1000", help="comma-separated synthetic district counts")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (median is reported)")
+    parser.add_argument("--sample", type=int, default=5, help="districts per city for retrieval/scoring")
+    parser.add_argument("--llm", choices=["replay", "local"], default="replay",
+                        help="score with the replayed OpenRouter model or the offline stand-in model")
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE, help="replay fixture for external calls")
+    parser.add_argument("--record", action="store_true", help="record missing external calls into the cassette")
+    parser.add_argument("--synthesize", action="store_true",
+                        help="rebuild the cassette from synthesized responses (no network or API keys, see bench_fixtures.py)")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--baseline", default=None, help="previous results JSON to compare against")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    return parser.parse_args(argv)
+
+
+def run_benchmarks(argv=None):
+    options = parse_args(argv)
+    stages = [s for s in options.stages.split(",") if s]
+    unknown = set(stages) - set(STAGE_FUNCTIONS)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+    synthetic_sizes = [int(n) for n in options.synthetic.split(",") if n]
+    output = os.path.abspath(options.output)
+    thresholds = load_thresholds(options.thresholds)
+    baseline = load_thresholds(options.baseline) if options.baseline else None
+
+    options.cassette = os.path.abspath(options.cassette)
+    if options.synthesize:
+        if os.path.exists(options.cassette):
+            os.remove(options.cassette)
+    elif not options.record and not os.path.exists(options.cassette):
+        print(f"❌ No cassette at {options.cassette} (create it with --record or --synthesize)")
+        return 1
+
+    # Everything the benchmark writes (stores, caches, pyramids) lives in a throwaway workspace
+    workspace = tempfile.mkdtemp(prefix="agent-maps-bench-")
+    options.workspace = workspace
+    previous_cwd = os.getcwd()
+    os.chdir(workspace)
+    results = []
+    if options.synthesize:
+        import bench_fixtures
+    replay.activate(options.cassette, "update" if options.record or options.synthesize else "replay")
+    try:
+        if options.synthesize:
+            bench_fixtures.install()
+        datasets = prepare_datasets(workspace, synthetic_sizes)
+        if options.datasets:
+            wanted = set(options.datasets.split(","))
+            datasets = {name: d for name, d in datasets.items() if name in wanted}
+
+        for stage in stages:
+            for dataset in datasets.values():
+                if not applies(stage, dataset, options):
+                    continue
+                result = run_stage(stage, dataset, options)
+                results.append(result)
+                if result["status"] == "ok":
+                    print(f"⏱️ {result['key']:<40} {result['median'] * 1000:10.1f} ms")
+                else:
+                    print(f"{'⏭️' if result['status'] == 'skipped' else '❌'} {result['key']:<40} "
+                          f"{result['status']}: {result['reason']}")
+    finally:
+        if options.synthesize:
+            bench_fixtures.uninstall()
+        replay.deactivate()
+        os.chdir(previous_cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    failures = check_regressions(results, thresholds, baseline)
+    report = {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": options.repeat,
+        "results": results,
+        "failures": failures,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 Results written to {output}")
+
+    if failures:
+        print("❌ Benchmark regressions:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    print("✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_benchmarks())
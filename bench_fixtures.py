@@ -0,0 +1,223 @@
+"""
+Synthesized responses for the benchmark cassette.
+
+`python bench.py --synthesize` runs the benchmark in replay "update" mode with
+the HTTP senders below in place of the network, so every call the pipeline
+makes is recorded under its real key (method, URL, body hash) with a response
+in the service's wire format:
+
+- Nominatim: one relation result per city (ids and coordinates are illustrative)
+- Overpass: `out geom` relations built from the city's geometry in countries/,
+  or a grid of the city's district names when it has none (Taichung)
+- Serper, DuckDuckGo, Wikipedia: snippets that mention the searched district
+- OpenRouter: chat completions whose content fills the requested json_schema
+  like local_model.LocalScoringModel
+
+Timings replayed from it measure our side of each stage (parsing, osm2geojson,
+ranking, the OpenAI/LangChain client), not the services. Record the real thing
+with `python bench.py --record` where the services are reachable.
+"""
+import os
+import re
+import json
+import hashlib
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import replay
+from bench import REPO_ROOT, BENCH_TOPIC, SAMPLE_SOURCES, _city_folder, grid_features
+from geometry import geometry_exists, load_city_geojson
+from local_model import _fill
+
+# Nominatim query -> (country, city, osm relation id, lat, lon); the Overpass area id is osm id + 3600000000
+PLACES = {
+    "Taipei, Taiwan": ("Taiwan", "Taipei", 1293250, 25.0375, 121.5637),
+    "Taichung, Taiwan": ("Taiwan", "Taichung", 3909246, 24.1477, 120.6736),
+}
+
+_originals = {}
+
+
+# ────────────────────────────────────────────────
+# Service responses
+# ────────────────────────────────────────────────
+
+def _nominatim(params):
+    place = PLACES.get(params.get("q", [""])[0])
+    if place is None:
+        return []
+    country, city, osm_id, lat, lon = place
+    return [{
+        "place_id": osm_id, "osm_type": "relation", "osm_id": osm_id,
+        "lat": str(lat), "lon": str(lon), "class": "boundary", "type": "administrative",
+        "display_name": f"{city}, {country}", "importance": 0.8,
+        "boundingbox": [str(lat - 0.1), str(lat + 0.1), str(lon - 0.1), str(lon + 0.1)],
+    }]
+
+
+def _city_features(country, city):
+    """The city's boundary features: its geometry in countries/, else a grid of its district names."""
+    folder = _city_folder(REPO_ROOT, country, city)
+    geo_file = os.path.join(folder, "map.geojson")
+    if geometry_exists(geo_file):
+        return load_city_geojson(geo_file)["features"]
+    with open(os.path.join(folder, f"{BENCH_TOPIC}_data.json"), "r", encoding="utf-8") as f:
+        names = list(json.load(f))
+    _, _, osm_id, lat, lon = PLACES[f"{city}, {country}"]
+    return grid_features(names, lon - 0.03, lat - 0.03, first_id=osm_id * 100)
+
+
+def _overpass_element(feature):
+    """An `out geom` relation: one closed member way per ring."""
+    props = feature["properties"]
+    geometry = feature["geometry"]
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    members = []
+    for polygon in polygons:
+        for i, ring in enumerate(polygon):
+            members.append({
+                "type": "way", "ref": props["id"] * 1000 + len(members), "role": "outer" if i == 0 else "inner",
+                "geometry": [{"lat": lat, "lon": lon} for lon, lat in ring],
+            })
+    return {"type": "relation", "id": props["id"], "members": members, "tags": props.get("tags", {})}
+
+
+def _overpass(params):
+    query = params.get("data", [""])[0]
+    area_id = int(re.search(r"area\((\d+)\)", query).group(1))
+    levels = re.search(r'"admin_level"~"\^\(([^)]*)\)\$"', query).group(1).split("|")
+    elements = []
+    for country, city, osm_id, _, _ in PLACES.values():
+        if osm_id + 3600000000 == area_id:
+            elements = [_overpass_element(feature) for feature in _city_features(country, city)
+                        if feature["properties"].get("tags", {}).get("admin_level") in levels]
+    return {"version": 0.6, "generator": "bench_fixtures", "elements": elements}
+
+
+def _snippets(query, count=3):
+    return [f"{query}: {text}" for text in SAMPLE_SOURCES[:count]]
+
+
+def _serper(body):
+    query = json.loads(body)["q"]
+    return {
+        "searchParameters": {"q": query, "type": "search", "engine": "google"},
+        "organic": [{"title": f"{query} ({i + 1})", "link": f"https://example.org/{i + 1}",
+                     "snippet": snippet, "position": i + 1}
+                    for i, snippet in enumerate(_snippets(query))],
+    }
+
+
+def _wikipedia(params):
+    param = {key: values[0] for key, values in params.items()}
+    title = param.get("srsearch") or param.get("titles") or ""
+    page_id = str(int(hashlib.sha256(title.encode("utf-8")).hexdigest()[:8], 16))
+    if param.get("list") == "search":
+        return {"query": {"searchinfo": {"totalhits": 1}, "search": [{"ns": 0, "title": title}]}}
+    page = {"pageid": int(page_id), "ns": 0, "title": title}
+    if param.get("prop") == "extracts":
+        page["extract"] = " ".join(_snippets(title, 2))
+    else:
+        page["fullurl"] = f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
+    return {"query": {"pages": {page_id: page}}}
+
+
+def _duckduckgo(query):
+    return " ".join(_snippets(query))
+
+
+def _openrouter(body):
+    request = json.loads(body)
+    prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+    seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    schema = (request.get("response_format") or {}).get("json_schema", {}).get("schema", {})
+    content = json.dumps(_fill(schema, seed), ensure_ascii=False)
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+    return {
+        "id": f"gen-{seed[:16]}", "object": "chat.completion", "created": 0,
+        "model": request.get("model"), "provider": "bench_fixtures",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def respond(method, url, body):
+    """JSON response for a call to one of the services, or None for anything else."""
+    parsed = urlparse(url)
+    params = parse_qs(parsed.query, keep_blank_values=True)
+    service = replay.service_for(url)
+    if service == "nominatim":
+        return _nominatim(params)
+    if service == "overpass":
+        return _overpass(params)
+    if service == "serper":
+        return _serper(body)
+    if service == "wikipedia":
+        return _wikipedia(params)
+    if service == "openrouter" and parsed.path.endswith("/chat/completions"):
+        return _openrouter(body)
+    return None
+
+
+# ────────────────────────────────────────────────
+# Senders
+# ────────────────────────────────────────────────
+
+def _content(method, url, body):
+    data = respond(method, url, body)
+    if data is None:
+        raise ConnectionError(f"bench_fixtures has no synthesized response for {method} {url}")
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def _requests_send(adapter, request, *args, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json; charset=utf-8"})
+    response._content = _content(request.method, request.url, request.body)
+    response._content_consumed = True
+    response.url = request.url
+    response.request = request
+    response.encoding = "utf-8"
+    return response
+
+
+def _httpx_send(client, request, *args, **kwargs):
+    return replay._httpx_module(request).Response(
+        200, headers={"Content-Type": "application/json"},
+        content=_content(request.method, str(request.url), request.read()), request=request,
+    )
+
+
+async def _httpx_asend(client, request, *args, **kwargs):
+    return _httpx_send(client, request)
+
+
+def install():
+    """Routes the cassette's live calls to the synthesized responses."""
+    import main
+    backends = main.get_search_backends()
+    _originals.update(
+        requests_send=replay._original_requests_send,
+        httpx_send=replay._original_httpx_send,
+        httpx_asend=replay._original_httpx_asend,
+        ddg_run=backends.ddg_run,
+    )
+    replay._original_requests_send = _requests_send
+    replay._original_httpx_send = _httpx_send
+    replay._original_httpx_asend = _httpx_asend
+    backends.ddg_run = replay.recorded("duckduckgo", _duckduckgo)
+
+
+def uninstall():
+    if not _originals:
+        return
+    import main
+    replay._original_requests_send = _originals.pop("requests_send")
+    replay._original_httpx_send = _originals.pop("httpx_send")
+    replay._original_httpx_asend = _originals.pop("httpx_asend")
+    main.get_search_backends().ddg_run = _originals.pop("ddg_run")
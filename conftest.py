@@ -0,0 +1,2 @@
+# test_map.py and test_osm.py are manual scripts against the live OSM services
+collect_ignore = ["test_map.py", "test_osm.py"]
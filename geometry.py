@@ -0,0 +1,440 @@
+import os
+import json
+
+# ────────────────────────────────────────────────
+# Simplification pyramid levels
+# ────────────────────────────────────────────────
+# (level name, Douglas-Peucker tolerance in degrees, coordinate decimals, max map zoom)
+# Tolerances are roughly one screen pixel at the level's max zoom, so simplification
+# is invisible on screen. Zooms above the last level use the full-resolution map.geojson.
+PYRAMID_LEVELS = [
+    ("low", 0.005, 3, 8),
+    ("mid", 0.0007, 4, 11),
+    ("high", 0.00017, 5, 13),
+]
+
+
+def pyramid_file(geo_file, level):
+    """countries/<country>/<city>/map.geojson -> countries/<country>/<city>/map.<level>.geojson"""
+    root, ext = os.path.splitext(geo_file)
+    return f"{root}.{level}{ext}"
+
+
+def pyramid_file_for_zoom(geo_file, zoom):
+    """Returns the coarsest pyramid file that still looks exact at the given map zoom."""
+    if zoom is None:
+        return geo_file
+    for level, _, _, max_zoom in PYRAMID_LEVELS:
+        if zoom <= max_zoom:
+            path = pyramid_file(geo_file, level)
+            return path if os.path.exists(path) else geo_file
+    return geo_file
+
+
+def pyramid_is_current(geo_file):
+    """True if every pyramid level exists and is newer than the source geometry."""
+    source_mtime = geometry_mtime(geo_file)
+    for level, _, _, _ in PYRAMID_LEVELS:
+        path = pyramid_file(geo_file, level)
+        if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+            return False
+    return True
+
+
+# ────────────────────────────────────────────────
+# Shared-arc topology
+# ────────────────────────────────────────────────
+
+def _polygons(geometry):
+    """Yields the polygons (lists of rings) of a Polygon or MultiPolygon geometry."""
+    if geometry["type"] == "Polygon":
+        yield geometry["coordinates"]
+    elif geometry["type"] == "MultiPolygon":
+        yield from geometry["coordinates"]
+
+
+def _clean_ring(ring, decimals=None):
+    """Rounds coordinates (optionally) and drops consecutive duplicates. Returns an open ring."""
+    points = []
+    for coord in ring:
+        point = (round(coord[0], decimals), round(coord[1], decimals)) if decimals is not None else (coord[0], coord[1])
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def build_topology(geojson_data, decimals=None):
+    """
+    Splits every polygon ring into arcs shared between neighbouring districts.
+    A vertex is a junction when it is visited with different neighbours in
+    different rings; rings are cut at junctions and identical arcs (in either
+    direction) are stored once.
+
+    Returns (arcs, features) where arcs is a list of point lists and each
+    feature is {"properties", "type", "polygons"} with polygons as nested
+    lists of arc references (TopoJSON style: ~i means arc i reversed).
+    Non-polygon geometries are returned unchanged under "geometry".
+    """
+    rings = []
+    for feature in geojson_data.get("features", []):
+        geometry = feature.get("geometry") or {}
+        for polygon in _polygons(geometry):
+            for ring in polygon:
+                rings.append(_clean_ring(ring, decimals))
+
+    # Collect each vertex's neighbour pairs to find junctions
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(points):
+        key = tuple(points)
+        if key in arc_index:
+            return arc_index[key]
+        reverse_key = key[::-1]
+        if reverse_key in arc_index:
+            return ~arc_index[reverse_key]
+        arc_index[key] = len(arcs)
+        arcs.append(list(points))
+        return arc_index[key]
+
+    def ring_to_arcs(ring):
+        if len(ring) < 3:
+            return []
+        cuts = [i for i, point in enumerate(ring) if point in junctions]
+        if not cuts:
+            # Closed arc: start at the smallest vertex so identical rings dedupe
+            start = ring.index(min(ring))
+            rotated = ring[start:] + ring[:start]
+            return [add_arc(rotated + [rotated[0]])]
+        rotated = ring[cuts[0]:] + ring[:cuts[0]]
+        cuts = [i - cuts[0] for i in cuts] + [len(ring)]
+        rotated.append(rotated[0])
+        return [add_arc(rotated[a:b + 1]) for a, b in zip(cuts, cuts[1:])]
+
+    features = []
+    for feature in geojson_data.get("features", []):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") not in ("Polygon", "MultiPolygon"):
+            features.append({"properties": feature.get("properties", {}), "geometry": geometry})
+            continue
+        polygons = []
+        for polygon in _polygons(geometry):
+            refs = [ring_to_arcs(_clean_ring(ring, decimals)) for ring in polygon]
+            refs = [r for r in refs if r]
+            if refs:
+                polygons.append(refs)
+        features.append({"properties": feature.get("properties", {}), "type": geometry["type"], "polygons": polygons})
+
+    return arcs, features
+
+
+def resolve_ring(arcs, refs):
+    """Rebuilds a closed coordinate ring from arc references."""
+    ring = []
+    for ref in refs:
+        points = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        ring.extend(points if not ring else points[1:])
+    return [list(point) for point in ring]
+
+
+def to_geojson(arcs, features):
+    """Materializes topology features back into a GeoJSON FeatureCollection."""
+    out = []
+    for feature in features:
+        if "geometry" in feature:
+            out.append({"type": "Feature", "properties": feature["properties"], "geometry": feature["geometry"]})
+            continue
+        polygons = [[resolve_ring(arcs, refs) for refs in polygon] for polygon in feature["polygons"]]
+        if feature["type"] == "Polygon":
+            geometry = {"type": "Polygon", "coordinates": polygons[0] if polygons else []}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": polygons}
+        out.append({"type": "Feature", "properties": feature["properties"], "geometry": geometry})
+    return {"type": "FeatureCollection", "features": out}
+
+
+# ────────────────────────────────────────────────
+# Simplification
+# ────────────────────────────────────────────────
+
+def simplify_line(points, tolerance):
+    """Douglas-Peucker simplification. Endpoints are always kept."""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length_sq = dx * dx + dy * dy
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if length_sq == 0:
+                dist = (px - x1) ** 2 + (py - y1) ** 2
+            else:
+                t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length_sq))
+                dist = (px - x1 - t * dx) ** 2 + (py - y1 - t * dy) ** 2
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_topology(arcs, features, tolerance):
+    """
+    Simplifies every shared arc once, so neighbouring districts keep
+    identical borders (no gaps or overlaps). Rings that would collapse
+    below a triangle fall back to their unsimplified arcs.
+    """
+    simplified = [simplify_line(arc, tolerance) for arc in arcs]
+    for i, arc in enumerate(arcs):
+        # A closed arc needs at least 4 points to stay a polygon
+        if arc[0] == arc[-1] and len(simplified[i]) < 4:
+            simplified[i] = arc
+
+    def ring_ok(refs):
+        return len(resolve_ring(simplified, refs)) >= 4
+
+    out_features = []
+    for feature in features:
+        if "geometry" in feature:
+            out_features.append(feature)
+            continue
+        polygons = []
+        for polygon in feature["polygons"]:
+            rings = []
+            for refs in polygon:
+                if ring_ok(refs):
+                    rings.append(refs)
+                elif not rings:
+                    # Keep the outer ring at full detail rather than lose the district
+                    rings.append([len(simplified) + j for j in range(len(refs))])
+                    simplified.extend(arcs[r] if r >= 0 else arcs[~r][::-1] for r in refs)
+            polygons.append(rings)
+        out_features.append(dict(feature, polygons=polygons))
+    return simplified, out_features
+
+
+# ────────────────────────────────────────────────
+# Pyramid building
+# ────────────────────────────────────────────────
+
+def _district_name(props):
+    # Same resolution order as map_tool.feature_district_name
+    tags = props.get("tags", {})
+    return tags.get("name:en") or tags.get("name") or props.get("name") or "Unnamed Area"
+
+
+def _compact_properties(props):
+    """Keeps only the properties the map layers read."""
+    tags = props.get("tags", {})
+    compact = {k: props[k] for k in ("type", "id", "name") if k in props}
+    compact["tags"] = {k: tags[k] for k in ("name", "name:en") if k in tags}
+    return compact
+
+
+def build_pyramid(geo_file):
+    """
+    Writes map.<level>.geojson next to geo_file for every PYRAMID_LEVELS entry:
+    shared-arc simplified, quantized to the level's decimals, with properties
+    trimmed to district names. Returns {level: path}.
+    """
+    geojson_data = load_city_geojson(geo_file)
+
+    paths = {}
+    for level, tolerance, decimals, _ in PYRAMID_LEVELS:
+        arcs, features = build_topology(geojson_data, decimals=decimals)
+        arcs, features = simplify_topology(arcs, features, tolerance)
+        for feature in features:
+            feature["properties"] = _compact_properties(feature["properties"])
+        simplified = to_geojson(arcs, features)
+
+        path = pyramid_file(geo_file, level)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(simplified, f, ensure_ascii=False, separators=(",", ":"))
+        paths[level] = path
+        print(f"🗺️ Wrote {level} geometry ({os.path.getsize(path) // 1024} KB) to {path}")
+    return paths
+
+
+def ensure_pyramid(geo_file):
+    """Builds the pyramid for geo_file unless an up-to-date one is already cached."""
+    if geometry_exists(geo_file) and not pyramid_is_current(geo_file):
+        build_pyramid(geo_file)
+
+
+# ────────────────────────────────────────────────
+# Compact on-disk format
+# ────────────────────────────────────────────────
+# A city's geometry is stored as two files next to the logical map.geojson path:
+#   map.topo.json   TopoJSON-style shared arcs with delta-encoded integer coordinates
+#   map.index.json  per-district properties (names, OSM id) and bbox, no geometry
+# Readers that only need names or bboxes never touch the arcs file.
+QUANTIZE_SCALE = 1e-7  # OSM stores 7 decimals, so this is lossless
+
+
+def compact_paths(geo_file):
+    """countries/<country>/<city>/map.geojson -> (map.topo.json, map.index.json)"""
+    root, _ = os.path.splitext(geo_file)
+    return f"{root}.topo.json", f"{root}.index.json"
+
+
+def geometry_exists(geo_file):
+    """True if the city's geometry is stored in either the compact or the raw GeoJSON format."""
+    topo_file, index_file = compact_paths(geo_file)
+    return (os.path.exists(topo_file) and os.path.exists(index_file)) or os.path.exists(geo_file)
+
+
+def geometry_mtime(geo_file):
+    topo_file, _ = compact_paths(geo_file)
+    return os.path.getmtime(topo_file if os.path.exists(topo_file) else geo_file)
+
+
+def _ring_bbox(arcs, polygons, bbox):
+    for polygon in polygons:
+        for refs in polygon[:1]:  # outer rings bound the district
+            for ref in refs:
+                for x, y in arcs[ref if ref >= 0 else ~ref]:
+                    bbox[0], bbox[1] = min(bbox[0], x), min(bbox[1], y)
+                    bbox[2], bbox[3] = max(bbox[2], x), max(bbox[3], y)
+    return bbox
+
+
+def write_compact(geojson_data, geo_file):
+    """Writes geojson_data in the compact format for geo_file. Returns (topo_file, index_file)."""
+    arcs, features = build_topology(geojson_data)
+    all_points = [point for arc in arcs for point in arc]
+    x0 = min((p[0] for p in all_points), default=0.0)
+    y0 = min((p[1] for p in all_points), default=0.0)
+
+    encoded_arcs = []
+    for arc in arcs:
+        encoded, px, py = [], 0, 0
+        for x, y in arc:
+            qx, qy = round((x - x0) / QUANTIZE_SCALE), round((y - y0) / QUANTIZE_SCALE)
+            encoded.append([qx - px, qy - py])
+            px, py = qx, qy
+        encoded_arcs.append(encoded)
+
+    geometries, index = [], []
+    for i, feature in enumerate(features):
+        props = _compact_properties(feature["properties"])
+        entry = {"district": _district_name(props), "properties": props}
+        if "geometry" in feature:
+            geometries.append({"id": i, "geometry": feature["geometry"]})
+        else:
+            geometries.append({"id": i, "type": feature["type"], "arcs": feature["polygons"]})
+            bbox = _ring_bbox(arcs, feature["polygons"], [float("inf"), float("inf"), float("-inf"), float("-inf")])
+            entry["bbox"] = bbox if bbox[0] != float("inf") else None
+        index.append(entry)
+
+    topology = {
+        "type": "Topology",
+        "transform": {"scale": [QUANTIZE_SCALE, QUANTIZE_SCALE], "translate": [x0, y0]},
+        "arcs": encoded_arcs,
+        "objects": {"districts": {"type": "GeometryCollection", "geometries": geometries}},
+    }
+    topo_file, index_file = compact_paths(geo_file)
+    with open(topo_file, "w", encoding="utf-8") as f:
+        json.dump(topology, f, separators=(",", ":"))
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    return topo_file, index_file
+
+
+def read_index(geo_file):
+    """
+    Returns [{"district", "properties", "bbox"}] for a city without decoding geometry.
+    Falls back to scanning the raw GeoJSON when the city has not been migrated.
+    """
+    _, index_file = compact_paths(geo_file)
+    if os.path.exists(index_file):
+        with open(index_file, encoding="utf-8") as f:
+            return json.load(f)
+    with open(geo_file, encoding="utf-8") as f:
+        geojson_data = json.load(f)
+    index = []
+    for feature in geojson_data.get("features", []):
+        props = feature.get("properties", {})
+        bbox = [float("inf"), float("inf"), float("-inf"), float("-inf")]
+        for polygon in _polygons(feature.get("geometry") or {}):
+            for x, y, *_ in polygon[0] if polygon else []:
+                bbox = [min(bbox[0], x), min(bbox[1], y), max(bbox[2], x), max(bbox[3], y)]
+        index.append({"district": _district_name(props), "properties": props,
+                      "bbox": bbox if bbox[0] != float("inf") else None})
+    return index
+
+
+def load_city_geojson(geo_file):
+    """Returns the city's geometry as a GeoJSON FeatureCollection, decoding the compact format on demand."""
+    topo_file, index_file = compact_paths(geo_file)
+    if not (os.path.exists(topo_file) and os.path.exists(index_file)):
+        with open(geo_file, encoding="utf-8") as f:
+            return json.load(f)
+
+    with open(topo_file, encoding="utf-8") as f:
+        topology = json.load(f)
+    index = read_index(geo_file)
+
+    (sx, sy), (x0, y0) = topology["transform"]["scale"], topology["transform"]["translate"]
+    arcs = []
+    for encoded in topology["arcs"]:
+        arc, qx, qy = [], 0, 0
+        for dx, dy in encoded:
+            qx, qy = qx + dx, qy + dy
+            arc.append((x0 + qx * sx, y0 + qy * sy))
+        arcs.append(arc)
+
+    features = []
+    for geometry, entry in zip(topology["objects"]["districts"]["geometries"], index):
+        if "geometry" in geometry:
+            features.append({"properties": entry["properties"], "geometry": geometry["geometry"]})
+        else:
+            features.append({"properties": entry["properties"], "type": geometry["type"], "polygons": geometry["arcs"]})
+    return to_geojson(arcs, features)
+
+
+def migrate_city(geo_file, remove_source=False):
+    """Converts an existing raw map.geojson to the compact format."""
+    with open(geo_file, encoding="utf-8") as f:
+        geojson_data = json.load(f)
+    topo_file, index_file = write_compact(geojson_data, geo_file)
+    before = os.path.getsize(geo_file)
+    after = os.path.getsize(topo_file) + os.path.getsize(index_file)
+    print(f"📦 {geo_file}: {before // 1024} KB -> {after // 1024} KB")
+    if remove_source:
+        os.remove(geo_file)
+    return topo_file, index_file
+
+
+def migrate_tree(root="countries", remove_source=False):
+    """Migrates every countries/<country>/<city>/map.geojson under root."""
+    migrated = []
+    for dirpath, _, filenames in os.walk(root):
+        if "map.geojson" in filenames:
+            migrated.append(migrate_city(os.path.join(dirpath, "map.geojson"), remove_source=remove_source))
+    return migrated
+
+
+if __name__ == "__main__":
+    import sys
+    migrate_tree(remove_source="--remove-source" in sys.argv)
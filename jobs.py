@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+import traceback
+import multiprocessing
+
+DEFAULT_JOBS_PATH = os.path.join(".cache", "jobs.sqlite3")
+# Worker processes the app starts on first use, unless JOB_WORKERS says otherwise
+# (0 = rely on `python jobs.py` workers)
+DEFAULT_WORKERS = 2
+POLL_INTERVAL = 1.0
+# A running job older than this is assumed to belong to a dead worker and is re-queued
+STALE_AFTER = 30 * 60
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of district scoring jobs shared by the app and worker processes.
+    Jobs go queued -> running -> done | failed. Enqueueing a district that already
+    has a queued or running job returns the existing job instead of a duplicate.
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    country TEXT NOT NULL,
+                    city TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    district TEXT NOT NULL,
+                    data_file TEXT,
+                    retrieval_mode TEXT NOT NULL,
+                    force_refresh INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    score REAL,
+                    error TEXT,
+                    progress TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            if "progress" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_layer ON jobs (country, city, topic, finished_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, country, city, topic, district, data_file=None, retrieval_mode="agent", force_refresh=False):
+        """Queues one district and returns the job id (an existing active job is reused)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"""
+                SELECT id FROM jobs
+                WHERE country = ? AND city = ? AND topic = ? AND district = ?
+                  AND status IN ({",".join("?" * len(ACTIVE_STATUSES))})
+            """, (country, city, topic, district) + ACTIVE_STATUSES).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row["id"]
+            job_id = conn.execute("""
+                INSERT INTO jobs (country, city, topic, district, data_file, retrieval_mode,
+                                  force_refresh, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?)
+            """, (country, city, topic, district, data_file, retrieval_mode,
+                  int(bool(force_refresh)), time.time())).lastrowid
+            conn.execute("COMMIT")
+            return job_id
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enqueue_many(self, country, city, topic, districts, **kwargs):
+        return [self.enqueue(country, city, topic, district, **kwargs) for district in districts]
+
+    def claim(self, worker):
+        """Atomically marks the oldest queued job as running for worker and returns it (or None)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', worker = ?, started_at = ? WHERE id = ?",
+                             (worker, time.time(), row["id"]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row is not None else None
+
+    def complete(self, job_id, score):
+        self._connect().execute("UPDATE jobs SET status = 'done', score = ?, finished_at = ? WHERE id = ?",
+                                (score, time.time(), job_id))
+
+    def fail(self, job_id, error):
+        self._connect().execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                                (str(error)[:2000], time.time(), job_id))
+
+    def set_progress(self, job_id, progress):
+        """Short status line of a running job (sources found so far), shown by the app."""
+        self._connect().execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def requeue_stale(self, max_age=STALE_AFTER):
+        """Puts running jobs whose worker has not finished them within max_age back in the queue."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, started_at = NULL "
+            "WHERE status = 'running' AND started_at < ?", (time.time() - max_age,))
+        return cursor.rowcount
+
+    def active_counts(self, layers=None):
+        """{"queued": n, "running": n}, optionally limited to [(country, city, topic)] layers."""
+        counts = {status: 0 for status in ACTIVE_STATUSES}
+        query = "SELECT country, city, topic, status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running') GROUP BY 1, 2, 3, 4"
+        wanted = set(layers) if layers is not None else None
+        for row in self._connect().execute(query):
+            if wanted is None or (row["country"], row["city"], row["topic"]) in wanted:
+                counts[row["status"]] += row["n"]
+        return counts
+
+    def running_jobs(self, layers=None):
+        """Running jobs with their progress, optionally limited to [(country, city, topic)] layers."""
+        wanted = set(layers) if layers is not None else None
+        rows = self._connect().execute("SELECT * FROM jobs WHERE status = 'running' ORDER BY started_at")
+        return [dict(row) for row in rows
+                if wanted is None or (row["country"], row["city"], row["topic"]) in wanted]
+
+    def active_districts(self, country, city, topic):
+        """Districts of a layer with a queued or running job."""
+        rows = self._connect().execute(
+            "SELECT district FROM jobs WHERE country = ? AND city = ? AND topic = ? "
+            "AND status IN ('queued', 'running')", (country, city, topic))
+        return {row["district"] for row in rows}
+
+    def finished_since(self, since):
+        """Jobs that finished (done or failed) after the given timestamp, oldest first."""
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE finished_at > ? ORDER BY finished_at", (since,))
+        return [dict(row) for row in rows]
+
+
+_queue = None
+
+
+def get_queue():
+    """Process-wide JobQueue on the default path."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
+
+
+# ────────────────────────────────────────────────
+# Workers
+# ────────────────────────────────────────────────
+
+def run_job(queue, job):
+    # Imported in the worker so the app process never loads the scoring pipeline for queued work
+    from main import score_district
+
+    def on_sources(new_sources, budget):
+        summary = budget.summary()
+        queue.set_progress(job["id"], f"{summary['district_sources']}/{budget.enough_sources} district sources, "
+                                      f"{summary['tool_calls']} tool calls, {summary['elapsed_s']:.0f}s")
+
+    try:
+        result = score_district(job["data_file"], job["district"], job["city"], job["country"], job["topic"],
+                                force_refresh=bool(job["force_refresh"]), retrieval_mode=job["retrieval_mode"],
+                                on_sources=on_sources)
+        queue.complete(job["id"], result.get("score"))
+        print(f"✅ Job {job['id']}: {job['district']} scored {result.get('score')}")
+    except Exception as e:
+        traceback.print_exc()
+        queue.fail(job["id"], e)
+        print(f"❌ Job {job['id']}: {job['district']} failed: {e}")
+
+
+def worker_loop(path=DEFAULT_JOBS_PATH, worker=None, poll_interval=POLL_INTERVAL):
+    """Claims and runs jobs forever; sleeps poll_interval when the queue is empty."""
+    worker = worker or f"worker-{os.getpid()}"
+    queue = JobQueue(path)
+    requeued = queue.requeue_stale()
+    if requeued:
+        print(f"♻️ Re-queued {requeued} stale jobs")
+    print(f"👷 {worker} waiting for jobs in {path}")
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job)
+
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def ensure_workers(count=None, path=DEFAULT_JOBS_PATH):
+    """
+    Starts count worker processes once per app process (restarting any that died).
+    count defaults to JOB_WORKERS, read on each call so a value from .env applies.
+    Workers are spawned, not forked, so they do not inherit the app's threads.
+    """
+    if count is None:
+        count = int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS))
+    with _workers_lock:
+        _workers[:] = [process for process in _workers if process.is_alive()]
+        context = multiprocessing.get_context("spawn")
+        while len(_workers) < count:
+            process = context.Process(target=worker_loop, args=(path, None), daemon=True)
+            process.start()
+            _workers.append(process)
+    return len(_workers)
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    if workers <= 1:
+        worker_loop()
+    else:
+        processes = [multiprocessing.Process(target=worker_loop, daemon=True) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
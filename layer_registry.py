@@ -0,0 +1,167 @@
+import os
+import math
+import weakref
+import threading
+from array import array
+from collections.abc import MutableMapping
+from types import MappingProxyType
+from geometry import geometry_mtime, pyramid_file_for_zoom
+from map_tool import get_district_names, load_annotated_features
+from score_store import get_store
+from tracing import count
+
+
+class CityGeometry:
+    """
+    Immutable geometry of one city, shared by every topic layer and session.
+    Holds the district order (the index of each layer's score vector) and the
+    parsed features of each pyramid level once it has been requested.
+    Features are shared: callers must copy before mutating them.
+    """
+
+    def __init__(self, geo_file):
+        self.geo_file = geo_file
+        self.districts = tuple(get_district_names(geo_file))
+        self.positions = MappingProxyType({district: i for i, district in enumerate(self.districts)})
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def features(self, zoom=None):
+        """Annotated features of the pyramid level that fits zoom (loaded on first use)."""
+        path = pyramid_file_for_zoom(self.geo_file, zoom)
+        with self._lock:
+            if path not in self._levels:
+                self._levels[path] = tuple(load_annotated_features(path))
+            return self._levels[path]
+
+
+class ScoreVector(MutableMapping):
+    """
+    Scores of one topic layer as a float array aligned with the city's district
+    order (NaN = unscored), with the dict interface the app already uses.
+    Scores for districts the geometry does not know are kept in a small side dict.
+    """
+
+    def __init__(self, geometry, scores=None):
+        self.geometry = geometry
+        self.values = array("d", [math.nan]) * len(geometry.districts)
+        self.extra = {}
+        self.update(scores or {})
+
+    def __getitem__(self, district):
+        i = self.geometry.positions.get(district)
+        if i is None:
+            return self.extra[district]
+        score = self.values[i]
+        if math.isnan(score):
+            raise KeyError(district)
+        return score
+
+    def __setitem__(self, district, score):
+        i = self.geometry.positions.get(district)
+        if i is None:
+            if score is None:
+                self.extra.pop(district, None)
+            else:
+                self.extra[district] = float(score)
+        else:
+            self.values[i] = math.nan if score is None else float(score)
+
+    def __delitem__(self, district):
+        self[district]  # KeyError if unscored
+        self[district] = None
+
+    def __iter__(self):
+        for district, score in zip(self.geometry.districts, self.values):
+            if not math.isnan(score):
+                yield district
+        yield from list(self.extra)
+
+    def __len__(self):
+        return sum(1 for score in self.values if not math.isnan(score)) + len(self.extra)
+
+    def __repr__(self):
+        return f"ScoreVector({dict(self)!r})"
+
+
+class LayerHandle:
+    """
+    A session's reference to a shared layer. The references are released when
+    the handle is garbage collected (layer removed, session ended) or on release().
+    """
+
+    def __init__(self, registry, key, geometry, scores):
+        self.key = key
+        self.geometry = geometry
+        self.scores = scores
+        self._finalizer = weakref.finalize(self, registry._release, key)
+
+    def release(self):
+        self._finalizer()
+
+
+class LayerRegistry:
+    """
+    Process-wide, reference-counted layers shared by every session: one
+    CityGeometry per city file (and version on disk) and one ScoreVector per
+    (country, city, topic). An entry is dropped once no LayerHandle refers to it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._geometries = {}  # (path, mtime) -> [CityGeometry, refs]
+        self._layers = {}  # (country, city, topic, path, mtime) -> [ScoreVector, refs]
+
+    def acquire(self, country, city, topic, geo_file):
+        """Returns a LayerHandle for the layer, loading geometry and scores only if no session holds them."""
+        geo_key = (os.path.abspath(geo_file), geometry_mtime(geo_file))
+        key = (country, city, topic) + geo_key
+        with self._lock:
+            geometry_entry = self._geometries.get(geo_key)
+            if geometry_entry is None:
+                geometry_entry = self._geometries[geo_key] = [CityGeometry(geo_file), 0]
+                count("layer_registry_geometry_loads")
+            geometry_entry[1] += 1
+            layer_entry = self._layers.get(key)
+            if layer_entry is None:
+                layer_entry = self._layers[key] = [ScoreVector(geometry_entry[0]), 0]
+            layer_entry[1] += 1
+            handle = LayerHandle(self, key, geometry_entry[0], layer_entry[0])
+        # Pick up scores written by workers or other processes since the vector was created
+        handle.scores.update(get_store().get_scores(country, city, topic))
+        return handle
+
+    def _release(self, key):
+        with self._lock:
+            layer_entry = self._layers.get(key)
+            if layer_entry is not None:
+                layer_entry[1] -= 1
+                if layer_entry[1] <= 0:
+                    del self._layers[key]
+            geo_key = key[3:]
+            geometry_entry = self._geometries.get(geo_key)
+            if geometry_entry is not None:
+                geometry_entry[1] -= 1
+                if geometry_entry[1] <= 0:
+                    del self._geometries[geo_key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "geometries": len(self._geometries),
+                "layers": len(self._layers),
+                "handles": sum(refs for _, refs in self._layers.values()),
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide LayerRegistry shared by every Streamlit session."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LayerRegistry()
+        return _registry
@@ -0,0 +1,95 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from tracing import count
+
+DEFAULT_LLM_CACHE_PATH = os.path.join(".cache", "llm_cache.sqlite3")
+DEFAULT_LLM_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+
+class DiskLLMCache(BaseCache):
+    """
+    Content-addressed LangChain cache for chat/LLM responses.
+    Entries are keyed by sha256(llm_string, prompt); llm_string carries the model
+    name, temperature and bound kwargs (e.g. response_format), so any change to
+    those is a different entry. Stored in SQLite and held under max_bytes by
+    evicting least-recently-used entries.
+    """
+
+    def __init__(self, path=DEFAULT_LLM_CACHE_PATH, max_bytes=DEFAULT_LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses (accessed_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self.make_key(prompt, llm_string)
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM llm_responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            count("llm_cache_misses")
+            return None
+        with conn:
+            conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        count("llm_cache_hits")
+        return loads(row[0])
+
+    def update(self, prompt, llm_string, return_val):
+        key = self.make_key(prompt, llm_string)
+        value = dumps(return_val)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                INSERT INTO llm_responses (key, value, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value, size = excluded.size, accessed_at = excluded.accessed_at
+            """, (key, value, len(value.encode("utf-8")), now, now))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, size in conn.execute(
+                        "SELECT key, size FROM llm_responses ORDER BY accessed_at").fetchall():
+                    conn.execute("DELETE FROM llm_responses WHERE key = ?", (old_key,))
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+
+    def clear(self, **kwargs):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses")
+
+    def stats(self):
+        row = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": row[0], "bytes": row[1]}
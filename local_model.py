@@ -0,0 +1,53 @@
+import json
+import hashlib
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Ratings the stand-in model picks from; weighted towards the middle like real scores
+_RATINGS = ["very poor", "poor", "average", "average", "good", "good", "excellent"]
+
+
+def _pick(seed, name, allowed):
+    digest = hashlib.sha256(f"{seed}\x00{name}".encode("utf-8")).digest()
+    choices = [r for r in _RATINGS if r in allowed] or list(allowed)
+    return choices[digest[0] % len(choices)]
+
+
+def _fill(schema, seed, name=""):
+    """Generates a deterministic value that satisfies the metric JSON schemas built in scoring.py."""
+    if "enum" in schema:
+        return _pick(seed, name, schema["enum"])
+    if schema.get("type") == "object":
+        return {key: _fill(sub, seed, f"{name}/{key}") for key, sub in schema.get("properties", {}).items()}
+    return ""
+
+
+class LocalScoringModel(BaseChatModel):
+    """
+    Deterministic offline stand-in for the OpenRouter chat model.
+    With a json_schema response_format (the scoring path) it returns schema-valid
+    metric JSON derived from a hash of the prompt; otherwise it answers the
+    retrieval agent with an empty Final Answer. No network, no API key.
+    """
+
+    model_name: str = "local-stand-in"
+
+    @property
+    def _llm_type(self):
+        return "local-stand-in"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(m.content) for m in messages)
+        seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        response_format = kwargs.get("response_format") or {}
+        schema = response_format.get("json_schema", {}).get("schema")
+        if schema:
+            content = json.dumps(_fill(schema, seed), ensure_ascii=False)
+        else:
+            content = json.dumps({"action": "Final Answer", "action_input": json.dumps({"sources": []})})
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
@@ -1,50 +1,47 @@
 # main_langchain.py
 import os
 import json
-from langchain_community.tools import DuckDuckGoSearchRun
-import requests
-from langchain_openai import ChatOpenAI
-from langchain.agents import Tool, initialize_agent, AgentType
-from langchain.prompts import PromptTemplate
-from langchain.schema import SystemMessage, HumanMessage
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import dotenv
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.memory import ConversationBufferMemory
+from provider_limits import limited, alimited, provider_slot
+from map_tool import get_district_names
+from search_client import SearchClient
+from search_cache import SearchCache
+from score_store import get_store, is_fresh, topic_ttl_days
+from source_ranker import relevance, rank_sources
+from retrieval import build_query_plan, cap_plan, fan_out, RetrievalBudget, BudgetExhausted, use_budget, budgeted, abudgeted, active_budget
+from scoring import score_evidence, score_evidence_batch
+from aggregation import score_metrics
+from topic_configs import TOPIC_CONFIG
+from replay import install_from_env, recorded
+from tracing import span, count, bind, record_token_usage
 # Environment
 # ────────────────────────────────────────────────
 dotenv.load_dotenv()
+# REPLAY_MODE=record|replay|update serves external calls from fixture files (see replay.py)
+install_from_env()
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-ddg = DuckDuckGoSearchRun()
-wiki = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
-if not SERPER_API_KEY:
-    raise ValueError("SERPER_API_KEY not set")
-
-if not OPENROUTER_API_KEY:
-    raise ValueError("OPENROUTER_API_KEY not set")
-
-
-llm = ChatOpenAI(
-    model="stepfun/step-3.5-flash:free",
-    temperature=0,
-    openai_api_key=OPENROUTER_API_KEY,
-    openai_api_base="https://openrouter.ai/api/v1",
-)
+# "openrouter" (default) or "local" for the deterministic offline stand-in model
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openrouter")
+search_client = SearchClient()
+search_cache = SearchCache()
 
 # ────────────────────────────────────────────────
 # Search functions
 # ────────────────────────────────────────────────
 
-def serper_search(query, max_results=6):
-    url = "https://google.serper.dev/search"
-    payload = json.dumps({"q": query, "num": max_results})
+SERPER_URL = "https://google.serper.dev/search"
+
+def _serper_request(query, max_results):
+    if not SERPER_API_KEY:
+        raise ValueError("SERPER_API_KEY not set")
+    payload = {"q": query, "num": max_results}
     headers = {"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"}
-    response = requests.post(url, headers=headers, data=payload)
-    response.raise_for_status()
-    results = response.json()
-    
+    return payload, headers
+
+def _serper_snippets(results, max_results):
     snippets = []
 
     # Include answer box if present
@@ -57,88 +54,211 @@ def serper_search(query, max_results=6):
     # IMPORTANT: convert list to single string for agent
     return "\n\n".join(snippets)
 
+def serper_search(query, max_results=6):
+    payload, headers = _serper_request(query, max_results)
+    with span("search.serper", query=query):
+        results = search_cache.get_or_compute(
+            "serper", query, lambda: search_client.post_json(SERPER_URL, payload, headers=headers)
+        )
+    return _serper_snippets(results, max_results)
+
+async def aserper_search(query, max_results=6):
+    """serper_search() on the event loop, through the pooled async HTTP client."""
+    payload, headers = _serper_request(query, max_results)
+    with span("search.serper", query=query):
+        results = await search_cache.aget_or_compute(
+            "serper", query, lambda: search_client.apost_json(SERPER_URL, payload, headers=headers)
+        )
+    return _serper_snippets(results, max_results)
+
+def ddg_search(query):
+    backends = get_search_backends()
+    with span("search.duckduckgo", query=query):
+        return search_cache.get_or_compute(
+            "duckduckgo", query,
+            lambda: search_client.call("duckduckgo.com", ("duckduckgo", query), backends.ddg_run, query),
+            locale=backends.ddg.api_wrapper.region,
+        )
+
+async def addg_search(query):
+    """ddg_search() for the event loop: ddgs is blocking, so it runs in a worker thread (SearchClient.acall)."""
+    backends = get_search_backends()
+    with span("search.duckduckgo", query=query):
+        return await search_cache.aget_or_compute(
+            "duckduckgo", query,
+            lambda: search_client.acall("duckduckgo.com", ("duckduckgo", query), backends.ddg_run, query),
+            locale=backends.ddg.api_wrapper.region,
+        )
+
+def wiki_search(query):
+    backends = get_search_backends()
+    with span("search.wikipedia", query=query):
+        return search_cache.get_or_compute(
+            "wikipedia", query,
+            lambda: search_client.call("wikipedia.org", ("wikipedia", query), backends.wiki.run, query),
+            locale=backends.wiki.api_wrapper.lang,
+        )
+
+async def awiki_search(query):
+    """wiki_search() for the event loop: the wikipedia package is blocking, so it runs in a worker thread."""
+    backends = get_search_backends()
+    with span("search.wikipedia", query=query):
+        return await search_cache.aget_or_compute(
+            "wikipedia", query,
+            lambda: search_client.acall("wikipedia.org", ("wikipedia", query), backends.wiki.run, query),
+            locale=backends.wiki.api_wrapper.lang,
+        )
+
 # ────────────────────────────────────────────────
-# LangChain Tools
+# LangChain components (each built on first use)
 # ────────────────────────────────────────────────
-tools = [
-    Tool(
-        name="Serper",
-        func=serper_search,
-        description="Use this tool to search official government and PDF data online."
-    ),
-    Tool(
-        name="DuckDuckGo",
-        func=ddg.run,
-        description="Use this tool to search general web content or recent news."
-    ),
-    Tool(
-        name="Wikipedia",
-        func=wiki.run,
-        description="Use this tool to fetch historical or background information from Wikipedia."
+serper_tool = limited("serper", serper_search)
+ddg_tool = limited("duckduckgo", ddg_search)
+wiki_tool = limited("wikipedia", wiki_search)
+# Coroutines for the agent's async path (ainvoke)
+aserper_tool = alimited("serper", aserper_search)
+addg_tool = alimited("duckduckgo", addg_search)
+awiki_tool = alimited("wikipedia", awiki_search)
+
+def _build_llm():
+    if LLM_BACKEND == "local":
+        from local_model import LocalScoringModel
+        return LocalScoringModel()
+    if not OPENROUTER_API_KEY:
+        raise ValueError("OPENROUTER_API_KEY not set")
+
+    from langchain_openai import ChatOpenAI
+    from llm_cache import DiskLLMCache
+
+    class RateLimitedChatOpenAI(ChatOpenAI):
+        """ChatOpenAI client whose completions share the OpenRouter concurrency limit."""
+
+        def _generate(self, *args, **kwargs):
+            # During retrieval, every agent step is charged against the district's budget
+            budget = active_budget()
+            if budget is not None:
+                budget.check()
+            with provider_slot("openrouter"), span("llm.openrouter", model=self.model_name):
+                result = super()._generate(*args, **kwargs)
+                count("llm_calls")
+                record_token_usage(result.llm_output)
+            if budget is not None:
+                budget.charge_tokens(result.llm_output)
+            return result
+
+    # Responses are cached on disk by (model, temperature, prompt) so re-scores with unchanged evidence are free
+    return RateLimitedChatOpenAI(
+        model="stepfun/step-3.5-flash:free",
+        temperature=0,
+        openai_api_key=OPENROUTER_API_KEY,
+        openai_api_base="https://openrouter.ai/api/v1",
+        cache=DiskLLMCache(),
     )
-]
+
+class SearchBackends:
+    """DuckDuckGo and Wikipedia clients used by ddg_search / wiki_search."""
+
+    def __init__(self):
+        from langchain_community.tools import DuckDuckGoSearchRun, WikipediaQueryRun
+        from langchain_community.utilities import WikipediaAPIWrapper
+
+        self.ddg = DuckDuckGoSearchRun()
+        # ddgs does not go through requests/httpx, so it is recorded at the function level
+        self.ddg_run = recorded("duckduckgo", self.ddg.run)
+        self.wiki = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
+
+class Toolchain:
+    """
+    Agent Tools for the ReAct retrieval. Only retrieval_mode="agent" needs it;
+    scoring and fast retrieval use get_llm() and the search functions directly.
+    """
+
+    def __init__(self):
+        if not SERPER_API_KEY:
+            raise ValueError("SERPER_API_KEY not set")
+
+        from langchain.agents import Tool
+
+        self.tools = [
+            Tool(
+                name="Serper",
+                func=budgeted("Serper", serper_tool),
+                coroutine=abudgeted("Serper", aserper_tool),
+                description="Use this tool to search official government and PDF data online."
+            ),
+            Tool(
+                name="DuckDuckGo",
+                func=budgeted("DuckDuckGo", ddg_tool),
+                coroutine=abudgeted("DuckDuckGo", addg_tool),
+                description="Use this tool to search general web content or recent news."
+            ),
+            Tool(
+                name="Wikipedia",
+                func=budgeted("Wikipedia", wiki_tool),
+                coroutine=abudgeted("Wikipedia", awiki_tool),
+                description="Use this tool to fetch historical or background information from Wikipedia."
+            )
+        ]
+
+_components = {}
+_components_lock = threading.Lock()
+
+def _shared(name, build):
+    """Returns the process-wide component, building it on first use (imports LangChain, checks API keys)."""
+    if name not in _components:
+        with _components_lock:
+            if name not in _components:
+                with span(f"build_{name}", llm_backend=LLM_BACKEND):
+                    _components[name] = build()
+    return _components[name]
+
+def get_llm():
+    """Chat model used for scoring and by the agent."""
+    return _shared("llm", _build_llm)
+
+def get_search_backends():
+    return _shared("search_backends", SearchBackends)
+
+def get_toolchain():
+    return _shared("toolchain", Toolchain)
 
 # ────────────────────────────────────────────────
 # Query evaluation & scoring
 # ────────────────────────────────────────────────
 def evaluate_single_result(text, topic_keywords, district):
-    text_lower = text.lower()
-    score = 0.0
-    # district match
-    if district.lower() in text_lower:
-        score += 0.4
-    # topic keywords match
-    for kw in topic_keywords:
-        if kw.lower() in text_lower:
-            score += 0.2
-    # data-report signals
-    data_keywords = ["統計", "數據", "報告", "年", "資料", "table", "statistics"]
-    data_hits = sum(1 for k in data_keywords if k.lower() in text_lower)
-    score += min(data_hits * 0.05, 0.15)
-    # government sources
-    if ".gov" in text_lower or ".gov.tw" in text_lower:
-        score += 0.1
-    return min(score, 1.0)
+    # District mention, topic keywords, data-report wording and .gov sources,
+    # matched in one Aho-Corasick pass (see source_ranker)
+    return relevance(text, topic_keywords, district)
 
 # ────────────────────────────────────────────────
 # Agent Execution
 # ────────────────────────────────────────────────
 
-def score_district(data_file, district, city, country, topic, force_refresh=False, max_iters=3, logger=None):
+def _agent_retrieve(district, city, country, topic, topic_keywords, budget):
     """
-    Two-stage district scoring:
-    Stage 1: Retrieval of top sources using agent
-    Stage 2: Extract structured metrics from sources
+    ReAct agent retrieval. Returns the sources the agent reports, or every
+    snippet its tools returned when the budget stopped it before a final answer.
     """
+    from langchain.agents import initialize_agent, AgentType
+    from langchain.memory import ConversationBufferMemory
+    from langchain_community.chat_message_histories import ChatMessageHistory
 
-    topic_keywords = TOPIC_CONFIG.get(topic, {}).get('keywords', [topic])
-
-    # --------------------------
-    # Load cached data if available
-    # --------------------------
-    if not force_refresh and os.path.exists(data_file):
-        with open(data_file, "r", encoding="utf-8") as f:
-            cache = json.load(f)
-            if district in cache:
-                if logger: logger(f"📂 Using cached score for {district}")
-                return cache[district]
-    else:
-        cache = {}
-
-    # --------------------------
-    # Stage 1: Retrieval
-    # --------------------------
+    toolchain = get_toolchain()
     chat_history = ChatMessageHistory()
     memory = ConversationBufferMemory(memory_key="chat_history", chat_memory=chat_history, return_messages=True)
 
     retrieval_agent = initialize_agent(
-        tools=tools,
-        llm=llm,
+        tools=toolchain.tools,
+        llm=get_llm(),
         agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
         memory=memory,
         max_output_tokens=2000,
         verbose=True,
-        handle_parsing_errors=True
+        handle_parsing_errors=True,
+        # Backstops for the budget checks in the tools and the chat model
+        max_iterations=budget.max_tool_calls + 1,
+        max_execution_time=budget.remaining(),
+        early_stopping_method="force",
     )
 
     keywords_string = ",\n".join(topic_keywords)
@@ -159,7 +279,7 @@ Instructions:
 1. Find at most 5 relevant snippets per tool.
 2. Return only snippets that explicitly mention {district}.
 3. Do NOT score or generate metrics yet — only find sources.
-4. If the results are not going to be helpful for scoring the {topic} of {district}, keep searching until you find some that will be.
+4. If the results are not going to be helpful for scoring the {topic} of {district}, try different queries, but stop once you have {budget.enough_sources} snippets that mention {district}.
 
 Format final output as JSON with this structure:
 {{
@@ -175,7 +295,12 @@ Format final output as JSON with this structure:
 }}
 """
 
-    retrieval_response = retrieval_agent.invoke(retrieval_prompt)
+    with span("agent"):
+        try:
+            retrieval_response = retrieval_agent.invoke(retrieval_prompt)
+        except BudgetExhausted as e:
+            print(f"⏹️ Agent for {district} stopped ({e.reason}) after {budget.tool_calls} tool calls")
+            return budget.sources
 
     # Step 1: get response string
     retrieval_str = (
@@ -192,205 +317,240 @@ Format final output as JSON with this structure:
         print("Failed to parse JSON:", e)
         sources = []
 
-    # Step 3: use sources safely
+    # Step 3: use sources safely (an agent cut off by its limits has no usable final answer)
+    if not sources:
+        sources = budget.sources
     print("Final Sources:", sources)
+    return sources
 
-    # --------------------------
-    # Stage 2: Structured Scoring
-    # --------------------------
-    # Prepare sources as a text block for LLM
-    sources_text_block = "\n".join([f"{s['tool']}: {s['text']}" for s in sources])
-
-    scoring_prompt = f"""
-    You are an expert municipal urban policy analyst.
-
-    Your task is to evaluate district-level conditions using aggregated evidence,
-    not isolated anecdotes.
-
-    District: "{district}"
-    City: {city}
-    Country: {country}
-    Topic: "{topic}"
-
-    Sources:
-    {sources_text_block}
-
-    INSTRUCTIONS:
-
-    1. Evaluate conditions at the DISTRICT LEVEL.
-    - Do NOT generalize from a single localized complaint.
-    - A single negative news article does NOT justify a "poor" rating.
-    - Only assign "poor" or "very poor" if there is repeated, systemic,
-        or district-wide evidence of persistent issues.
-
-    2. Government monitoring reports, routine clean-up reports, or inspection
-    activity indicate baseline functioning — NOT failure.
-
-    3. Positive civic activities (e.g., volunteer cleanups, upgrades,
-    improvements, proactive ordinances) indicate active governance and
-    should prevent overly negative scoring.
-
-    4. Be conservative with extreme ratings:
-    - Use "excellent" only if there is strong evidence of exceptional performance.
-    - Use "very poor" only if there is strong evidence of severe, systemic issues.
-
-    5. Treat interventions like new rules, fines, or regulations as **evidence of active management**, 
-    not automatically as negative conditions.
-
-    Use ONLY the following scale for every metric:
-    "very poor", "poor", "average", "good", "excellent"
-
-    Metrics to include (fill with estimates if unknown):
-    Positive Metrics:
-    {TOPIC_CONFIG.get(topic).get('metrics').get("positive")}
-    Negative Metrics:
-    {TOPIC_CONFIG.get(topic).get('metrics').get("negative")}
-
-    Return JSON only.
-    Do NOT include explanations.
-    Use the folloring structure:
-    {{
-    "action": "Final Answer",
-    "action_input": "{{
-        \\"metric1\\": \\"average\\",
-        \\"metric2\\": \\"good\\",
-        \\"metric3\\": \\"poor\\"
-        }}"
-    }}
+def _fast_retrieve(district, city, country, topic_keywords, budget, logger=None):
     """
-    print("Retrieving Scores")
-    # Call LLM directly (no tools)
-    scoring_response = retrieval_agent.invoke(scoring_prompt)
-    print('Scoring Response:', scoring_response['output'])
-    # Parse JSON safely
-    output_text = scoring_response['output']
-    try:
-        metrics = json.loads(output_text)
-        print("Json Loaded Succesfully")
-    except Exception:
-        print("Could not load json")
-        metrics = {}
-
-
-    # --------------------------
-    # Stage 3: Convert metrics to numeric score
-    # --------------------------
-    def signals_to_score(metrics):
-        """
-        Converts structured metrics into a 0–1 overall score.
-        All metrics use the same semantic scale:
-        very poor -> 0.0
-        poor -> 0.25
-        average -> 0.5
-        good -> 0.75
-        excellent -> 1.0
-        """
-
-        if not metrics:
-            return 0.5
-
-        scale = {
-            "very poor": 0.0,
-            "poor": 0.25,
-            "average": 0.5,
-            "good": 0.75,
-            "excellent": 1.0
-        }
-
-        total = 0.0
-        count = 0
-
-        for value in metrics.values():
-            if isinstance(value, str):
-                total += scale.get(value.lower(), 0.5)
-                count += 1
-
-        return round(total / count, 2) if count > 0 else 0.5
-
-    score = signals_to_score(metrics)
+    Fixed query plan fired at all search tools in parallel — no LLM calls.
+    The plan is capped at the budget's tool calls (keeping every tool), and the
+    searches still running are abandoned at the deadline or once enough
+    district-mentioning sources are in; only then is the budget's stop_reason set.
+    """
+    plan = cap_plan(build_query_plan(district, city, country, topic_keywords), budget.max_tool_calls)
+
+    def counted(func):
+        # Searches abandoned before they started (early stop, deadline) are not charged
+        def run(query):
+            budget.count_call()
+            return func(query)
+        return run
+
+    def abandoned(reason, count):
+        budget.stop_reason = reason
+
+    if logger: logger(f"⚡ Running {len(plan)} searches in parallel for {district}")
+    tools = {"Serper": serper_tool, "DuckDuckGo": ddg_tool, "Wikipedia": wiki_tool}
+    sources = fan_out(plan, {name: counted(func) for name, func in tools.items()},
+                      timeout=budget.remaining(), logger=logger,
+                      on_sources=budget.add_sources, should_stop=lambda: budget.enough,
+                      on_abandon=abandoned)
+    print("Final Sources:", sources)
+    return sources
 
+def retrieve_evidence(district, city, country, topic, retrieval_mode="agent", logger=None, budget=None):
+    """
+    Stage 1: collect sources for a district and pre-rank them.
+    retrieval_mode="agent" uses the ReAct agent, "fast" a fixed parallel query plan.
+    budget is a RetrievalBudget (deadline, tool calls, tokens, early stop); the
+    mode's default budget is used when it is not given.
+    """
+    topic_keywords = TOPIC_CONFIG.get(topic, {}).get('keywords', [topic])
+    budget = budget or RetrievalBudget.for_mode(district, retrieval_mode)
+    with span("retrieval", district=district, mode=retrieval_mode) as retrieval_span, use_budget(budget):
+        if retrieval_mode == "fast":
+            sources = _fast_retrieve(district, city, country, topic_keywords, budget, logger=logger)
+        else:
+            sources = _agent_retrieve(district, city, country, topic, topic_keywords, budget)
+        retrieval_span.set(**budget.summary())
+        if budget.stop_reason and logger: logger(f"⏹️ Retrieval for {district} stopped early ({budget.stop_reason})")
+
+        # Deterministic pre-ranking — drop duplicates and low-relevance
+        # snippets, keep the best ones within the prompt token budget
+        retrieved_count = len(sources)
+        with span("rank_sources"):
+            sources = rank_sources(sources, district, topic_keywords)
+        retrieval_span.set(retrieved=retrieved_count, kept=len(sources))
+    if logger: logger(f"🔎 Kept {len(sources)} of {retrieved_count} sources for scoring")
+    return sources
+
+def _save_result(store, district, city, country, topic, sources, metrics):
+    """Stage 3: convert metrics to a numeric score and upsert the record."""
+    score = score_metrics(metrics, topic)
     result = {
         "tool_results": sources,
         "metrics": metrics,
         "score": score
     }
     print(f"{district}, {city} has been scored at {score} for {topic}")
-    # Save to cache
-    cache[district] = result
-    with open(data_file, "w", encoding="utf-8") as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
-
+    # Save to store (single-row upsert)
+    with span("save", district=district):
+        store.upsert(country, city, topic, district, result)
     return result
 
-TOPIC_CONFIG = {
-    "cleanliness-dirtiness": {
-        'keywords': [
-            # positive / neutral
-            "cleanliness", # English
-            "public sanitation", # English
-            "environmental hygiene", # English
-            "waste collection", # English
-            "sweeping", # English
-            "sanitation management", # English
-            "sanitation crews", # English
-            "recycling", # English
-            "整潔", # Chinese
-            "公共場所衛生", # Chinese
-            "環境衛生", # Chinese
-            "垃圾清運", # Chinese
-            "清掃", # Chinese
-            "衛生管理", # Chinese
-            "清潔隊", # Chinese
-            "資源回收", # Chinese
-            "清潔", # Japanese
-            "公衆衛生", # Japanese
-            "環境衛生", # Japanese
-            "ごみ収集", # Japanese
-            "掃除", # Japanese
-            "衛生管理", # Japanese
-            "清掃員", # Japanese
-            "資源回収", # Japanese
-
-            # negative / filthiness
-            "dirtiness", # English
-            "trash accumulation", # English
-            "illegal dumping", # English
-            "pollution", # English
-            "hygiene issues", # English
-            "bad smell", # English
-            "insufficient cleaning", # English
-            "messy environment", # English
-            "髒亂", # Chinese
-            "垃圾堆積", # Chinese
-            "違規棄置", # Chinese
-            "污染", # Chinese
-            "衛生問題", # Chinese
-            "臭味", # Chinese
-            "清潔不足", # Chinese
-            "環境髒亂", # Chinese
-            "不潔", # Japanese
-            "ごみの蓄積", # Japanese
-            "不法投棄", # Japanese
-            "汚染", # Japanese
-            "衛生問題", # Japanese
-            "悪臭", # Japanese
-            "清掃不足", # Japanese
-            "不衛生な環境" # Japanese
-        ],
-        'metrics': {
-            'positive': """
-- overall_cleanliness (very poor, poor, average, good, excellent)
-- street_cleanliness (very poor, poor, average, good, excellent)
-- waste_management (very poor, poor, average, good, excellent)
-- public_area_cleanliness (very poor, poor, average, good, excellent)
-- park_cleanliness (very poor, poor, average, good, excellent)
-- illegal_dumping_incidents (very poor, poor, average, good, excellent)
-""",
-            'negative': """
-- odor_issues (very poor, poor, average, good, excellent)
-- sanitation_compliance (very poor, poor, average, good, excellent; how well local rules and inspections are followed)
-- community_engagement (very poor, poor, average, good, excellent; participation in clean-up or awareness activities)
-"""
+def score_district(data_file, district, city, country, topic, force_refresh=False, logger=None, retrieval_mode="agent", budget=None, on_sources=None):
+    """
+    Two-stage district scoring:
+    Stage 1: Retrieval of top sources — with the ReAct agent (retrieval_mode="agent")
+             or a fixed query plan searched in parallel (retrieval_mode="fast")
+    Stage 2: Extract structured metrics from sources with one direct LLM call
+    Results are stored in the score store; data_file is the legacy JSON
+    score file, imported into the store the first time it is seen. Cached scores
+    are reused while they are younger than the topic's ttl_days.
+    Retrieval runs under budget (a RetrievalBudget, by default the mode's limits);
+    on_sources(new_sources, budget) receives snippets as they are found.
+    """
+
+    with span("score_district", district=district, city=city, country=country, topic=topic,
+              retrieval_mode=retrieval_mode):
+        # --------------------------
+        # Load cached data if available
+        # --------------------------
+        store = get_store()
+        if data_file:
+            store.import_json_file(data_file, country, city, topic)
+        if not force_refresh:
+            cached = store.get(country, city, topic, district)
+            if cached is not None and is_fresh(cached["updated_at"], topic_ttl_days(topic)):
+                count("score_cache_hits")
+                if logger: logger(f"📂 Using cached score for {district}")
+                return cached
+            if cached is not None:
+                # Past the topic's TTL: re-score (the app keeps showing the old score meanwhile)
+                count("score_cache_stale")
+                if logger: logger(f"♻️ Cached score for {district} is stale, re-scoring")
+
+        # --------------------------
+        # Stage 1: Retrieval
+        # --------------------------
+        if budget is None:
+            budget = RetrievalBudget.for_mode(district, retrieval_mode, on_sources=on_sources)
+        elif on_sources is not None:
+            budget.on_sources = on_sources
+        sources = retrieve_evidence(district, city, country, topic, retrieval_mode=retrieval_mode,
+                                    logger=logger, budget=budget)
+
+        # --------------------------
+        # Stage 2: Structured Scoring (direct LLM call with a strict metric schema)
+        # --------------------------
+        print("Retrieving Scores")
+        with span("scoring", district=district):
+            metrics = score_evidence(get_llm(), district, city, country, topic, sources)
+        print('Scoring Response:', metrics)
+
+        # --------------------------
+        # Stage 3: Convert metrics to numeric score
+        # --------------------------
+        return _save_result(store, district, city, country, topic, sources, metrics)
+
+# ────────────────────────────────────────────────
+# Batch Scoring
+# ────────────────────────────────────────────────
+
+def score_districts(data_file, districts, city, country, topic, force_refresh=False, max_workers=8, progress=None, logger=None, retrieval_mode="agent", batch_size=1):
+    """
+    Scores many districts of one city concurrently.
+    With batch_size=1 each district runs the full score_district pipeline on a
+    bounded worker pool. With batch_size>1 retrieval still runs per district in
+    parallel, but the evidence of up to batch_size districts is scored in a
+    single LLM call. Calls to Serper, DuckDuckGo, Wikipedia and OpenRouter are
+    additionally capped by PROVIDER_LIMITS.
+
+    progress(done, total, district, result, error) is called as each district finishes.
+    Returns (results, errors) dicts keyed by district name.
+    """
+    districts = list(dict.fromkeys(districts))
+    with span("score_districts", city=city, country=country, topic=topic, districts=len(districts),
+              retrieval_mode=retrieval_mode, batch_size=batch_size):
+        return _score_districts(data_file, districts, city, country, topic, force_refresh,
+                                max_workers, progress, logger, retrieval_mode, batch_size)
+
+def _score_districts(data_file, districts, city, country, topic, force_refresh, max_workers, progress, logger, retrieval_mode, batch_size):
+    results, errors = {}, {}
+    if not districts:
+        return results, errors
+
+    def report(district, result=None, error=None):
+        if error is not None:
+            print(f"❌ Scoring failed for {district}: {error}")
+            errors[district] = error
+        else:
+            results[district] = result
+        if progress:
+            progress(len(results) + len(errors), len(districts), district, result, error)
+
+    workers = max(1, min(max_workers, len(districts)))
+    if batch_size <= 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(bind(score_district), data_file, district, city, country, topic,
+                            force_refresh=force_refresh, logger=logger,
+                            retrieval_mode=retrieval_mode): district
+                for district in districts
+            }
+            for future in as_completed(futures):
+                try:
+                    report(futures[future], result=future.result())
+                except Exception as e:
+                    report(futures[future], error=e)
+        return results, errors
+
+    # Batched scoring: serve cached districts, retrieve the rest in parallel
+    store = get_store()
+    if data_file:
+        store.import_json_file(data_file, country, city, topic)
+    pending = []
+    ttl_days = topic_ttl_days(topic)
+    for district in districts:
+        cached = None if force_refresh else store.get(country, city, topic, district)
+        if cached is not None and is_fresh(cached["updated_at"], ttl_days):
+            report(district, result=cached)
+        else:
+            pending.append(district)
+
+    def score_batch(batch):
+        with span("scoring", districts=len(batch)):
+            return score_evidence_batch(get_llm(), batch, city, country, topic)
+
+    evidence = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(bind(retrieve_evidence), district, city, country, topic,
+                        retrieval_mode=retrieval_mode, logger=logger): district
+            for district in pending
+        }
+        for future in as_completed(futures):
+            try:
+                evidence[futures[future]] = future.result()
+            except Exception as e:
+                report(futures[future], error=e)
+
+        batches = [list(evidence.items())[i:i + batch_size] for i in range(0, len(evidence), batch_size)]
+        futures = {
+            pool.submit(bind(score_batch), batch): batch
+            for batch in batches
         }
-    },
-}
\ No newline at end of file
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                metrics_by_district = future.result()
+            except Exception as e:
+                for district, _ in batch:
+                    report(district, error=e)
+                continue
+            for district, sources in batch:
+                report(district, result=_save_result(store, district, city, country, topic,
+                                                     sources, metrics_by_district.get(district, {})))
+
+    return results, errors
+
+def score_city(geo_file, data_file, city, country, topic, force_refresh=False, max_workers=8, progress=None, logger=None, retrieval_mode="agent", batch_size=1):
+    """Scores every district listed in a city's map.geojson. See score_districts."""
+    districts = get_district_names(geo_file)
+    return score_districts(data_file, districts, city, country, topic,
+                           force_refresh=force_refresh, max_workers=max_workers,
+                           progress=progress, logger=logger, retrieval_mode=retrieval_mode,
+                           batch_size=batch_size)
@@ -1,38 +1,68 @@
-import requests
-import osm2geojson
+import os
 import folium
 import json
-from geopy.geocoders import Nominatim
 from country_configs import COUNTRY_CONFIGS
+from tracing import span, count
+from score_store import get_store
+from spatial_index import ensure_city_index
+from geometry import (ensure_pyramid, pyramid_file_for_zoom, geometry_exists, geometry_mtime,
+                      load_city_geojson, read_index, write_compact)
+
+def load_osm_stack():
+    """
+    Imports the OSM network stack on first use, so viewing already-fetched maps
+    never loads requests, osm2geojson or geopy. Returns (requests, osm2geojson, Nominatim).
+    """
+    import requests
+    import osm2geojson
+    from geopy.geocoders import Nominatim
+    from replay import install_from_env
+    # Nominatim/Overpass calls are recorded or replayed when REPLAY_MODE is set
+    install_from_env()
+    return requests, osm2geojson, Nominatim
+
+def city_layer_files(city, topic, country="Taiwan"):
+    """(geometry file, legacy score file) paths of a city layer; nothing is read or written."""
+    city_folder = os.path.join("countries", country, city)
+    return os.path.join(city_folder, "map.geojson"), os.path.join(city_folder, f"{topic}_data.json")
 
 def ensure_geojson(city, topic, country="Taiwan"):
     """
     Ensures GeoJSON file exists for city.
     Uses country-specific district levels from COUNTRY_CONFIGS.
-    Stores files under countries/<country>/<city>/map.geojson
+    Stores geometry for countries/<country>/<city>/map.geojson in the
+    compact map.topo.json + map.index.json format, caches simplified
+    map.<level>.geojson versions for lower zooms and a map.rtree.json
+    spatial index, and imports any legacy <topic>_data.json scores into the score store.
     """
-    # Prepare folder
-    city_folder = os.path.join("countries", country, city)
-    os.makedirs(city_folder, exist_ok=True)
+    geo_file, data_file = city_layer_files(city, topic, country)  # data_file holds legacy scores
+    os.makedirs(os.path.dirname(geo_file), exist_ok=True)
 
-    geo_file = os.path.join(city_folder, "map.geojson")
-    data_file = os.path.join(city_folder, f"{topic}_data.json")  # for scores
+    with span("ensure_geojson", city=city, country=country, topic=topic) as geojson_span:
+        if not geometry_exists(geo_file):
+            # Get country-specific district levels
+            config = COUNTRY_CONFIGS.get(country, {})
+            district_levels = config.get("district_levels", ["7", "8"])
 
-    if not os.path.exists(geo_file):
-        # Get country-specific district levels
-        config = COUNTRY_CONFIGS.get(country, {})
-        district_levels = config.get("district_levels", ["7", "8"])
+            # Fetch GeoJSON (looping handled inside get_city_geojson)
+            geojson_data_raw = get_city_geojson(city, country=country, district_levels=district_levels)
+            if geojson_data_raw and geojson_data_raw[0]:
+                geojson_data = geojson_data_raw[0]
+            else:
+                raise ValueError(f"Failed to fetch GeoJSON for {city}, {country}")
 
-        # Fetch GeoJSON (looping handled inside get_city_geojson)
-        geojson_data_raw = get_city_geojson(city, country=country, district_levels=district_levels)
-        if geojson_data_raw and geojson_data_raw[0]:
-            geojson_data = geojson_data_raw[0]
+            # Save validated GeoJSON in the compact format
+            with span("write_compact"):
+                write_compact(geojson_data, geo_file)
         else:
-            raise ValueError(f"Failed to fetch GeoJSON for {city}, {country}")
+            geojson_span.count("geometry_cache_hits")
 
-        # Save validated GeoJSON
-        with open(geo_file, "w", encoding="utf-8") as f:
-            json.dump(geojson_data, f, indent=4)
+        with span("pyramid"):
+            ensure_pyramid(geo_file)
+        with span("spatial_index"):
+            ensure_city_index(geo_file)
+        with span("import_scores"):
+            get_store().import_json_file(data_file, country, city, topic)
 
     return geo_file, data_file
 
@@ -42,9 +72,9 @@ def get_country_subareas(country_name):
     Uses country-specific admin level from COUNTRY_CONFIGS.
     Returns GeoJSON and resolved Nominatim location.
     """
+    requests, osm2geojson, _ = load_osm_stack()
     overpass_url = "https://overpass.kumi.systems/api/interpreter"
-    geolocator = Nominatim(user_agent="area_vibe_checker")
-    
+
     config = COUNTRY_CONFIGS.get(country_name)
     if not config:
         raise ValueError(f"No configuration found for country '{country_name}'")
@@ -52,17 +82,12 @@ def get_country_subareas(country_name):
 
     # 1️⃣ Resolve Country
     print(f"🌐 Resolving Country: {country_name}...")
-    locations = geolocator.geocode(country_name, exactly_one=False, limit=5)
-    if not locations:
+    target_location, area_id = resolve_area(country_name, country=country_name)
+    if target_location is None:
         print(f"❌ Could not resolve country: {country_name}")
         return None, None
-
-    target_location = next((loc for loc in locations if loc.raw.get('osm_type') == 'relation'), locations[0])
     print(f"✅ Using Relation ID: {target_location.raw.get('osm_id')}")
 
-    osm_id = int(target_location.raw.get('osm_id'))
-    area_id = osm_id + 3600000000
-
     # 2️⃣ Query subareas
     try:
         print(f"🌍 Fetching admin_level={admin_level} subareas for {country_name}...")
@@ -72,9 +97,13 @@ def get_country_subareas(country_name):
         (relation["boundary"="administrative"]["admin_level"="{admin_level}"](area.countryArea););
         out geom;
         """
-        response = requests.get(overpass_url, params={'data': query}, timeout=300)
-        response.raise_for_status()
-        geojson_data = osm2geojson.json2geojson(response.json())
+        with span("overpass", admin_level=admin_level) as overpass_span:
+            response = requests.get(overpass_url, params={'data': query}, timeout=300)
+            response.raise_for_status()
+            overpass_span.set(response_bytes=len(response.content))
+            with span("osm2geojson"):
+                geojson_data = osm2geojson.json2geojson(response.json())
+            overpass_span.set(features=len(geojson_data.get("features", [])))
 
         if not geojson_data.get("features"):
             print(f"⚠️ No features found at admin_level={admin_level} for {country_name}")
@@ -88,13 +117,79 @@ def get_country_subareas(country_name):
         print(f"❌ OSM Fetch or Conversion Error: {e}")
         return None, None
 
+OVERPASS_URL = "https://overpass.kumi.systems/api/interpreter"
+
+# Resolved places rarely change; keep them for months instead of re-asking Nominatim (~1 req/s)
+GEOCODE_CACHE_PATH = os.path.join(".cache", "geocode_cache.sqlite3")
+GEOCODE_TTL = 180 * 24 * 60 * 60
+_geocode_cache = None
+
+def get_geocode_cache():
+    global _geocode_cache
+    if _geocode_cache is None:
+        from search_cache import SearchCache
+        _geocode_cache = SearchCache(path=GEOCODE_CACHE_PATH, ttls={"nominatim": GEOCODE_TTL})
+    return _geocode_cache
+
+def resolve_area(query, country=""):
+    """
+    Geocodes query with Nominatim, preferring relation results.
+    The chosen result is cached on disk per (query, country).
+    Returns (location, overpass area id) or (None, None).
+    """
+    from geopy.location import Location
+    cache = get_geocode_cache()
+    with span("geocode", query=query) as geocode_span:
+        raw = cache.get("nominatim", query, locale=country)
+        geocode_span.set(cached=raw is not None)
+        if raw is None:
+            _, _, Nominatim = load_osm_stack()
+            geolocator = Nominatim(user_agent="area_vibe_checker")
+            locations = geolocator.geocode(query, exactly_one=False, limit=5)
+            if not locations:
+                return None, None
+            raw = next((loc for loc in locations if loc.raw.get('osm_type') == 'relation'), locations[0]).raw
+            cache.put("nominatim", query, raw, locale=country)
+    target_location = Location(raw.get("display_name", query), (float(raw["lat"]), float(raw["lon"])), raw)
+    return target_location, int(raw.get('osm_id')) + 3600000000
+
+def split_by_admin_level(geojson_data, levels):
+    """Splits a FeatureCollection into {admin_level: FeatureCollection} using each feature's tags."""
+    by_level = {level: {"type": "FeatureCollection", "features": []} for level in levels}
+    for feature in geojson_data.get("features", []):
+        level = feature.get("properties", {}).get("tags", {}).get("admin_level")
+        if level in by_level:
+            by_level[level]["features"].append(feature)
+    return by_level
+
+def fetch_admin_boundaries(area_id, levels, timeout=180):
+    """
+    Fetches the boundary relations of every admin_level in levels inside an
+    Overpass area with one union query. Returns {admin_level: GeoJSON}.
+    """
+    requests, osm2geojson, _ = load_osm_stack()
+    levels = [str(level) for level in levels]
+    level_pattern = "|".join(levels)
+    query = f"""
+            [out:json][timeout:{timeout}];
+            area({area_id})->.cityArea;
+            (relation["boundary"="administrative"]["admin_level"~"^({level_pattern})$"](area.cityArea););
+            out geom;
+            """
+    with span("overpass", admin_levels=levels) as overpass_span:
+        response = requests.get(OVERPASS_URL, params={'data': query}, timeout=timeout)
+        response.raise_for_status()
+        overpass_span.set(response_bytes=len(response.content))
+        with span("osm2geojson"):
+            geojson_data = osm2geojson.json2geojson(response.json())
+        overpass_span.set(features=len(geojson_data.get("features", [])))
+    return split_by_admin_level(geojson_data, levels)
+
 def get_city_geojson(city_query, country="Taiwan", district_levels=None):
     """
     Fetch GeoJSON for a city, trying country-specific district levels with fallbacks.
     district_levels: list of admin_levels to try (first is preferred)
     """
-    overpass_url = "https://overpass.kumi.systems/api/interpreter"
-    geolocator = Nominatim(user_agent="area_vibe_checker")
     # Use country config fallback if district_levels not provided
     if district_levels is None:
         config = COUNTRY_CONFIGS.get(country, {})
@@ -102,43 +197,115 @@ def get_city_geojson(city_query, country="Taiwan", district_levels=None):
 
     # 1️⃣ Resolve city
     print(f"🌐 Resolving City: {city_query}, {country}...")
-    locations = geolocator.geocode(f"{city_query}, {country}", exactly_one=False, limit=5)
-    if not locations:
+    target_location, area_id = resolve_area(f"{city_query}, {country}", country=country)
+    if target_location is None:
         print(f"❌ Could not resolve city: {city_query}, {country}")
         return None, None
-
-    target_location = next((loc for loc in locations if loc.raw.get('osm_type') == 'relation'), locations[0])
     print(f"✅ Using Relation ID: {target_location.raw.get('osm_id')}")
 
-    osm_id = int(target_location.raw.get('osm_id'))
-    area_id = osm_id + 3600000000
+    # 2️⃣ Fetch every candidate level in one round-trip, then take the first level with features
+    print(f"🌍 Fetching Level {'/'.join(district_levels)} Districts for {city_query}...")
+    try:
+        by_level = fetch_admin_boundaries(area_id, district_levels)
+    except Exception as e:
+        print(f"❌ Error fetching levels {district_levels}: {e}")
+        by_level = {}
 
-    # 2️⃣ Try district_levels in order until GeoJSON is found
     for level in district_levels:
-        try:
-            print(f"🌍 Fetching Level {level} Districts for {city_query}...")
-            query = f"""
-            [out:json][timeout:180];
-            area({area_id})->.cityArea;
-            (relation["boundary"="administrative"]["admin_level"="{level}"](area.cityArea););
-            out geom;
-            """
-            response = requests.get(overpass_url, params={'data': query}, timeout=180)
-            response.raise_for_status()
-            geojson_data = osm2geojson.json2geojson(response.json())
-
-            if geojson_data.get("features"):
-                return geojson_data, target_location
-            else:
-                print(f"⚠️ No features found at level {level} for {city_query}, trying next level...")
-        except Exception as e:
-            print(f"❌ Error fetching level {level}: {e}")
-            continue
+        geojson_data = by_level.get(str(level))
+        if geojson_data and geojson_data.get("features"):
+            print(f"✅ Using Level {level} ({len(geojson_data['features'])} districts)")
+            return geojson_data, target_location
+        print(f"⚠️ No features found at level {level} for {city_query}, trying next level...")
 
     print(f"❌ Failed to fetch GeoJSON for {city_query}, {country} at levels {district_levels}")
     return None, None
 
-import json, folium, os, branca.colormap as cm
+import json, folium, os, threading, branca.colormap as cm
+from collections import OrderedDict
+
+def feature_district_name(props):
+    """Resolves the display name of a district from its GeoJSON feature properties."""
+    return (props.get("tags", {}).get("name:en") or
+            props.get("tags", {}).get("name") or
+            props.get("name") or
+            "Unnamed Area")
+
+def get_district_names(geo_file):
+    """Returns the district names of a city in file order, read from the properties index."""
+    names = []
+    for entry in read_index(geo_file):
+        if entry["district"] not in names:
+            names.append(entry["district"])
+    return names
+
+# ────────────────────────────────────────────────
+# Parsed GeoJSON cache (shared by every rerun and session in the process)
+# ────────────────────────────────────────────────
+GEOJSON_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_geojson_cache = OrderedDict()  # (path, mtime) -> (features, approx_bytes)
+_geojson_cache_bytes = 0
+_geojson_cache_lock = threading.Lock()
+geojson_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _approx_size(geojson_data):
+    # Parsed JSON takes several times its serialized size in Python objects
+    return len(json.dumps(geojson_data, separators=(",", ":"))) * 4
+
+def load_annotated_features(geo_file):
+    """
+    Returns the parsed features of geo_file with "district" already resolved.
+    Results are cached per (path, mtime) under GEOJSON_CACHE_MAX_BYTES with LRU eviction.
+    The returned features are shared: callers must copy before mutating them.
+    """
+    global _geojson_cache_bytes
+    key = (os.path.abspath(geo_file), geometry_mtime(geo_file))
+    with _geojson_cache_lock:
+        if key in _geojson_cache:
+            _geojson_cache.move_to_end(key)
+            geojson_cache_stats["hits"] += 1
+            count("geojson_cache_hits")
+            return _geojson_cache[key][0]
+        geojson_cache_stats["misses"] += 1
+    count("geojson_cache_misses")
+
+    with span("load_geojson", file=os.path.basename(geo_file)):
+        geojson_data = load_city_geojson(geo_file)
+    features = []
+    for feature in geojson_data["features"]:
+        properties = dict(feature["properties"], district=feature_district_name(feature["properties"]))
+        features.append({"type": "Feature", "properties": properties, "geometry": feature["geometry"]})
+    size = _approx_size(geojson_data)
+
+    with _geojson_cache_lock:
+        # Drop stale versions of the same file
+        for stale in [k for k in _geojson_cache if k[0] == key[0] and k != key]:
+            _geojson_cache_bytes -= _geojson_cache.pop(stale)[1]
+        if key not in _geojson_cache:
+            _geojson_cache[key] = (features, size)
+            _geojson_cache_bytes += size
+        while _geojson_cache_bytes > GEOJSON_CACHE_MAX_BYTES and len(_geojson_cache) > 1:
+            _, (_, evicted_size) = _geojson_cache.popitem(last=False)
+            _geojson_cache_bytes -= evicted_size
+            geojson_cache_stats["evictions"] += 1
+        return _geojson_cache[key][0]
+
+def clear_geojson_cache():
+    """Drops every cached parsed GeoJSON (used by benchmarks to time cold loads)."""
+    global _geojson_cache_bytes
+    with _geojson_cache_lock:
+        _geojson_cache.clear()
+        _geojson_cache_bytes = 0
+
+SCORE_COLORS = ["red", "orange", "yellow", "green"]
+
+def make_colormap():
+    """The 0–1 score color ramp shared by GeoJSON layers and vector tiles."""
+    return cm.LinearColormap(
+        colors=SCORE_COLORS,
+        vmin=0, vmax=1,
+        caption="Score"
+    )
 
 def create_base_map(center=[23.7, 121], zoom=7, interactive=True):
     """Creates a new Folium Map instance."""
@@ -152,35 +319,38 @@ def create_base_map(center=[23.7, 121], zoom=7, interactive=True):
         double_click_zoom=interactive,
         zoom_control=interactive
     )
-    colormap = cm.LinearColormap(
-        colors=["red", "orange", "yellow", "green"],
-        vmin=0, vmax=1,
-        caption="Score"
-    )
+    colormap = make_colormap()
     colormap.add_to(m)
     return m, colormap
 
-def add_geojson_layer(map_object, colormap, city, topic, scores, is_visible=True, geo_file=""):
-    """Adds a styled GeoJSON FeatureGroup layer to a Folium map."""
+def add_geojson_layer(map_object, colormap, city, topic, scores, is_visible=True, geo_file="", zoom=None, geometry=None):
+    """
+    Adds a styled GeoJSON FeatureGroup layer to a Folium map.
+    When zoom is given, the simplified geometry level that fits it is used.
+    geometry is an optional shared CityGeometry (layer_registry) to take the features from.
+    """
     layer_id = f"{city}_{topic}"
 
-    if not os.path.exists(geo_file):
+    if geometry is None and not geometry_exists(geo_file):
         print(f"Warning: GeoJSON file not found: {geo_file}")
         return
+    with span("load_annotate", layer=layer_id, zoom=zoom):
+        if geometry is not None:
+            features = geometry.features(zoom)
+        else:
+            features = load_annotated_features(pyramid_file_for_zoom(geo_file, zoom))
 
-    with open(geo_file) as f:
-        geojson_data = json.load(f)
-
-    # Attach scores, district name, and a unique layer_id to each feature
-    for feature in geojson_data["features"]:
-        props = feature["properties"]
-        district = (props.get("tags", {}).get("name:en") or
-                    props.get("tags", {}).get("name") or
-                    props.get("name") or
-                    "Unnamed Area")
-        feature["properties"]["district"] = district
-        feature["properties"]["score"] = scores.get(district)
-        feature["properties"]["layer_id"] = layer_id  # For multi-layer click handling
+    # Attach scores and a unique layer_id to per-layer copies of the cached features (geometry is shared)
+    geojson_data = {"type": "FeatureCollection", "features": [
+        {
+            "type": "Feature",
+            "geometry": feature["geometry"],
+            "properties": dict(feature["properties"],
+                               score=scores.get(feature["properties"]["district"]),
+                               layer_id=layer_id),  # For multi-layer click handling
+        }
+        for feature in features
+    ]}
 
     # Style function uses the passed-in colormap
     def style_function(feature):
@@ -201,7 +371,90 @@ def add_geojson_layer(map_object, colormap, city, topic, scores, is_visible=True
             localize=True
         ),
         highlight_function=lambda x: {"weight": 3, "color": "blue"}
-    ).add_to(feature_group)
+    ).add_child(ScoreLayerRegistration(layer_id)).add_to(feature_group)
 
     # Add the layer to the main map
-    feature_group.add_to(map_object)
\ No newline at end of file
+    feature_group.add_to(map_object)
+
+
+# ────────────────────────────────────────────────
+# Client-side restyling (score deltas without resending geometry)
+# ────────────────────────────────────────────────
+from branca.element import MacroElement
+from jinja2 import Template
+
+class ScoreLayerRegistration(MacroElement):
+    """Registers a GeoJson layer in the browser under its layer_id so score deltas can find it."""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        window.scoreLayers = window.scoreLayers || {};
+        window.scoreLayers[{{ this.layer_id|tojson }}] = {{ this._parent.get_name() }};
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer_id):
+        super().__init__()
+        self._name = "ScoreLayerRegistration"
+        self.layer_id = layer_id
+
+class ScoreDeltas(MacroElement):
+    """
+    Restyles already-rendered districts in place: {layer_id: {district: [score, color]}}.
+    Each layer gets a district -> features index on first use, so the work done in
+    the browser is proportional to the number of changed districts.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function (deltas) {
+            const layers = window.scoreLayers || {};
+            for (const [layerId, changes] of Object.entries(deltas)) {
+                const layer = layers[layerId];
+                if (!layer) continue;
+                if (!layer._byDistrict) {
+                    // resetStyle() (used on mouseout) must keep the restyled colors
+                    const baseStyle = layer.options.style;
+                    layer.options.style = (feature) => Object.assign({}, baseStyle(feature), feature.properties.restyle || {});
+                    layer._byDistrict = {};
+                    layer.eachLayer((f) => {
+                        (layer._byDistrict[f.feature.properties.district] ||= []).push(f);
+                    });
+                }
+                for (const [district, [score, color]] of Object.entries(changes)) {
+                    for (const f of layer._byDistrict[district] || []) {
+                        f.feature.properties.score = score;
+                        f.feature.properties.restyle = score === null
+                            ? {fillColor: "#ddd", fillOpacity: 0.4}
+                            : {fillColor: color, fillOpacity: 0.75};
+                        layer.resetStyle(f);
+                    }
+                }
+            }
+        })({{ this.deltas|tojson }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, deltas):
+        super().__init__()
+        self._name = "ScoreDeltas"
+        self.deltas = deltas
+
+def diff_scores(base_scores, scores):
+    """Districts whose score differs from base_scores: {district: score or None}."""
+    changed = {district: score for district, score in scores.items() if base_scores.get(district) != score}
+    changed.update({district: None for district in base_scores if district not in scores})
+    return changed
+
+def score_delta_layer(colormap, deltas):
+    """
+    FeatureGroup carrying only a restyle script for {layer_id: {district: score}},
+    meant for st_folium(feature_group_to_add=...) so the base map (and its geometry)
+    stays mounted in the browser.
+    """
+    colored = {
+        layer_id: {district: [score, None if score is None else colormap(score)]
+                   for district, score in changes.items()}
+        for layer_id, changes in deltas.items() if changes
+    }
+    feature_group = folium.FeatureGroup(name="score_deltas", control=False)
+    feature_group.add_child(ScoreDeltas(colored))
+    return feature_group
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import codecs
+from country_configs import COUNTRY_CONFIGS
+from geometry import geometry_exists, write_compact, ensure_pyramid
+from spatial_index import ensure_city_index
+from map_tool import OVERPASS_URL, load_osm_stack, resolve_area, split_by_admin_level
+from tracing import span
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_TIMEOUT = 900
+
+
+def build_country_query(area_id, city_level, district_levels, timeout=DEFAULT_TIMEOUT):
+    """
+    One Overpass query for a whole country. For each city-level relation it emits
+    the city (tags only, no members) followed by the district relations inside it
+    (with geometry), so the response can be split into cities while streaming.
+    """
+    level_pattern = "|".join(str(level) for level in district_levels)
+    return f"""
+        [out:json][timeout:{timeout}];
+        area({area_id})->.countryArea;
+        rel["boundary"="administrative"]["admin_level"="{city_level}"](area.countryArea)->.cities;
+        foreach.cities->.city(
+          .city out tags;
+          .city map_to_area->.cityArea;
+          rel["boundary"="administrative"]["admin_level"~"^({level_pattern})$"](area.cityArea);
+          out geom;
+        );
+        """
+
+
+# ────────────────────────────────────────────────
+# Streaming JSON
+# ────────────────────────────────────────────────
+
+def iter_overpass_elements(chunks):
+    """
+    Yields the objects of the top-level "elements" array of an Overpass JSON
+    response one at a time, decoding from an iterable of byte chunks with
+    JSONDecoder.raw_decode so the full response is never held in memory.
+    Raises RuntimeError if Overpass appended a "remark" (timeout or runtime error),
+    since the elements would then be incomplete.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos = "", 0
+    in_elements = False
+    chunks = iter(chunks)
+
+    def more():
+        nonlocal buffer, pos
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        return True
+
+    while not in_elements:
+        start = buffer.find('"elements"', pos)
+        if start >= 0:
+            bracket = buffer.find("[", start)
+            if bracket >= 0:
+                pos, in_elements = bracket + 1, True
+                continue
+            pos = start
+        else:
+            # Keep a tail in case the key is split across chunks
+            pos = max(pos, len(buffer) - len('"elements"'))
+        if not more():
+            return
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if not more():
+                raise RuntimeError("Overpass response ended inside the elements array")
+            continue
+        if buffer[pos] == "]":
+            pos += 1
+            break
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not more():
+                raise
+            continue
+        pos = end
+        yield element
+
+    # Only metadata follows the array; a remark means the query did not finish
+    while more():
+        pass
+    if '"remark"' in buffer[pos:]:
+        raise RuntimeError(f"Overpass reported an error: {buffer[pos:].strip()[:300]}")
+
+
+def group_by_city(elements):
+    """
+    Groups the streamed elements into (city_tags, district_elements) pairs.
+    City markers are the relations printed with "out tags" (they have no members).
+    """
+    city_tags, districts = None, []
+    for element in elements:
+        if element.get("type") == "relation" and "members" not in element:
+            if city_tags is not None:
+                yield city_tags, districts
+            city_tags, districts = element.get("tags", {}), []
+        elif city_tags is not None:
+            districts.append(element)
+    if city_tags is not None:
+        yield city_tags, districts
+
+
+# ────────────────────────────────────────────────
+# Prefetch
+# ────────────────────────────────────────────────
+
+def city_name(tags):
+    """Same name the app lists in cities.json: English name if available."""
+    return tags.get("name:en", tags.get("name"))
+
+
+def write_city(country, city, elements, district_levels, osm2geojson, force=False):
+    """
+    Converts one city's district relations and writes the compact geometry,
+    pyramid and spatial index. Returns (admin_level, district count) or None.
+    """
+    geo_file = os.path.join("countries", country, city, "map.geojson")
+    if geometry_exists(geo_file) and not force:
+        return None
+    by_level = split_by_admin_level(osm2geojson.json2geojson({"elements": elements}), district_levels)
+    for level in district_levels:
+        geojson_data = by_level[str(level)]
+        if geojson_data["features"]:
+            os.makedirs(os.path.dirname(geo_file), exist_ok=True)
+            write_compact(geojson_data, geo_file)
+            ensure_pyramid(geo_file)
+            ensure_city_index(geo_file)
+            return level, len(geojson_data["features"])
+    return None
+
+
+def prefetch_country(country, force=False, timeout=DEFAULT_TIMEOUT):
+    """
+    Fetches every city and district boundary of a country with a single Overpass
+    request, streams the response and shards it into
+    countries/<country>/<city>/map.geojson (compact format) plus
+    countries/<country>/cities.json. Cities that already have geometry are kept
+    unless force is set. Returns {city: (admin_level, districts) or None}.
+    """
+    config = COUNTRY_CONFIGS.get(country)
+    if not config:
+        raise ValueError(f"No configuration found for country '{country}'")
+    city_level = config.get("city_admin_level", "4")
+    district_levels = [str(level) for level in config.get("district_levels", ["7", "8"])]
+    requests, osm2geojson, _ = load_osm_stack()
+
+    with span("prefetch_country", country=country) as prefetch_span:
+        print(f"🌐 Resolving Country: {country}...")
+        target_location, area_id = resolve_area(country, country=country)
+        if target_location is None:
+            raise ValueError(f"Could not resolve country: {country}")
+
+        query = build_country_query(area_id, city_level, district_levels, timeout)
+        print(f"🌍 Fetching every level {city_level} city and level {'/'.join(district_levels)} "
+              f"district of {country} in one Overpass request...")
+        results = {}
+        with span("overpass", admin_levels=[city_level] + district_levels):
+            response = requests.get(OVERPASS_URL, params={"data": query}, timeout=timeout, stream=True)
+            response.raise_for_status()
+            elements = iter_overpass_elements(response.iter_content(chunk_size=CHUNK_SIZE))
+            for tags, city_elements in group_by_city(elements):
+                city = city_name(tags)
+                if not city:
+                    continue
+                with span("write_city", city=city):
+                    results[city] = write_city(country, city, city_elements, district_levels, osm2geojson, force)
+                if results[city]:
+                    level, count = results[city]
+                    print(f"✅ {city}: {count} level {level} districts")
+                else:
+                    print(f"⏭️ {city}: {'already fetched' if geometry_exists(os.path.join('countries', country, city, 'map.geojson')) else 'no districts found'}")
+        prefetch_span.set(cities=len(results))
+
+    cities_file = os.path.join("countries", country.lower(), "cities.json")
+    os.makedirs(os.path.dirname(cities_file), exist_ok=True)
+    with open(cities_file, "w", encoding="utf-8") as f:
+        json.dump(list(results), f, ensure_ascii=False, indent=2)
+    print(f"📄 Wrote {len(results)} cities to {cities_file}")
+    return results
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not args:
+        print("Usage: python prefetch.py <Country> [--force]")
+        sys.exit(1)
+    prefetch_country(args[0], force="--force" in sys.argv)
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# ────────────────────────────────────────────────
+# Per-provider concurrency limits
+# ────────────────────────────────────────────────
+# Maximum number of calls allowed in flight at once for each external
+# provider, shared by every thread in the process.
+PROVIDER_LIMITS = {
+    "serper": 4,
+    "duckduckgo": 2,
+    "wikipedia": 4,
+    "openrouter": 4,
+}
+
+# Seconds between checks for a free slot in async callers
+SLOT_POLL_INTERVAL = 0.01
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _semaphore(provider):
+    with _semaphores_lock:
+        if provider not in _semaphores:
+            _semaphores[provider] = threading.BoundedSemaphore(PROVIDER_LIMITS.get(provider, 1))
+        return _semaphores[provider]
+
+
+def set_provider_limit(provider, limit):
+    """Changes the concurrency limit for a provider. Affects calls started afterwards."""
+    with _semaphores_lock:
+        PROVIDER_LIMITS[provider] = limit
+        _semaphores[provider] = threading.BoundedSemaphore(limit)
+
+
+@contextmanager
+def provider_slot(provider):
+    """Blocks until a call slot for the provider is free and holds it for the block."""
+    semaphore = _semaphore(provider)
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def limited(provider, func):
+    """Wraps func so every call goes through provider_slot(provider)."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with provider_slot(provider):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def alimited(provider, func):
+    """
+    Async limited() for a coroutine function. Shares the provider's slots with
+    the threads, and polls for a free slot with asyncio.sleep so the event loop keeps running.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        semaphore = _semaphore(provider)
+        while not semaphore.acquire(blocking=False):
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            semaphore.release()
+    return wrapper
@@ -0,0 +1,434 @@
+import os
+import sys
+import asyncio
+import json
+import gzip
+import time
+import base64
+import atexit
+import hashlib
+import importlib
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# ────────────────────────────────────────────────
+# Fixture format
+# ────────────────────────────────────────────────
+# Bump when the interaction layout changes; older cassettes must be re-recorded
+FIXTURE_VERSION = 1
+DEFAULT_CASSETTE = os.path.join("fixtures", "cassette.json")
+
+# "off" (default), "record" (fresh cassette, always hits the network),
+# "replay" (never hits the network) or "update" (replay known calls, record new ones)
+MODES = ("off", "record", "replay", "update")
+
+# Host substring -> service name stored with each interaction
+SERVICES = {
+    "nominatim": "nominatim",
+    "overpass": "overpass",
+    "serper.dev": "serper",
+    "duckduckgo": "duckduckgo",
+    "wikipedia.org": "wikipedia",
+    "openrouter.ai": "openrouter",
+}
+
+# Headers that describe the wire encoding; replayed bodies are already decoded
+_WIRE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+# Minimum seconds between incremental saves while recording
+SAVE_INTERVAL = 2.0
+
+
+class CassetteMiss(RuntimeError):
+    """Raised in replay mode for a call that is not in the cassette."""
+
+
+def service_for(url):
+    host = urlparse(url).hostname or ""
+    return next((name for marker, name in SERVICES.items() if marker in host), host)
+
+
+def _hash_body(body):
+    if body is None:
+        body = b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if not isinstance(body, (bytes, bytearray)):
+        body = repr(body).encode("utf-8")
+    return hashlib.sha256(body).hexdigest()
+
+
+def _encode_body(content):
+    try:
+        return {"text": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_body(body):
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body.get("text", "").encode("utf-8")
+
+
+def _key_id(key):
+    return json.dumps(key, ensure_ascii=False)
+
+
+def _wire_free(headers):
+    return {k: v for k, v in headers.items() if k.lower() not in _WIRE_HEADERS}
+
+
+# ────────────────────────────────────────────────
+# Cassette
+# ────────────────────────────────────────────────
+
+class Cassette:
+    """
+    Versioned fixture file of recorded external calls.
+    HTTP calls are keyed by (method, url, sha256(body)); request headers are never
+    stored, so API keys stay out of fixtures. Function-level calls (backends that
+    do not go through requests/httpx, e.g. ddgs) are keyed by (service, key).
+    Identical calls are served back in recorded order, repeating the last one.
+    Paths ending in .gz are gzip-compressed.
+    """
+
+    def __init__(self, path=DEFAULT_CASSETTE, mode="replay", latency=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown replay mode '{mode}', expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.interactions = []
+        self._by_key = {}
+        self._served = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        if mode in ("replay", "update") and os.path.exists(path):
+            self.load()
+        elif mode == "replay":
+            raise FileNotFoundError(f"Replay cassette not found: {path}")
+
+    def _open(self, mode):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def load(self):
+        with self._open("r") as f:
+            data = json.load(f)
+        if data.get("version") != FIXTURE_VERSION:
+            raise ValueError(
+                f"{self.path} is fixture version {data.get('version')}, expected {FIXTURE_VERSION}; re-record it"
+            )
+        self.interactions = data.get("interactions", [])
+        self._by_key = {}
+        for interaction in self.interactions:
+            self._by_key.setdefault(_key_id(interaction["key"]), []).append(interaction)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": FIXTURE_VERSION, "recorded_at": time.time(), "interactions": list(self.interactions)}
+            self._dirty = False
+            self._saved_at = time.time()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        opener = gzip.open(tmp_path, "wt", encoding="utf-8") if self.path.endswith(".gz") else \
+            open(tmp_path, "w", encoding="utf-8")
+        with opener as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def records(self):
+        return self.mode in ("record", "update")
+
+    def find(self, key):
+        """Returns the next recorded interaction for key, or None."""
+        if self.mode == "record":
+            return None
+        key_id = _key_id(key)
+        with self._lock:
+            matches = self._by_key.get(key_id)
+            if not matches:
+                return None
+            index = self._served.get(key_id, 0)
+            self._served[key_id] = index + 1
+            return matches[min(index, len(matches) - 1)]
+
+    def miss(self, key):
+        if self.mode == "replay":
+            raise CassetteMiss(f"No recorded call for {key} in {self.path}")
+
+    def add(self, service, key, response, elapsed):
+        interaction = {"service": service, "key": key, "response": response, "elapsed": round(elapsed, 4)}
+        with self._lock:
+            self.interactions.append(interaction)
+            self._by_key.setdefault(_key_id(key), []).append(interaction)
+            self._dirty = True
+            due = time.time() - self._saved_at > SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def delay(self, interaction):
+        """Simulated latency in seconds: "recorded" replays the original timing, a number is fixed seconds."""
+        if self.latency == "recorded":
+            return interaction.get("elapsed", 0.0)
+        return float(self.latency or 0.0)
+
+    def wait(self, interaction):
+        delay = self.delay(interaction)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def await_latency(self, interaction):
+        """wait() for async senders: sleeps without blocking the event loop."""
+        delay = self.delay(interaction)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_active = None
+_installed = False
+_install_lock = threading.Lock()
+
+
+def active():
+    return _active
+
+
+def _http_key(method, url, body):
+    return ["http", method.upper(), url, _hash_body(body)]
+
+
+# ────────────────────────────────────────────────
+# requests (Nominatim via geopy, Overpass, Serper, Wikipedia)
+# ────────────────────────────────────────────────
+_original_requests_send = HTTPAdapter.send
+
+
+def _requests_response(request, recorded):
+    response = requests.Response()
+    response.status_code = recorded["status"]
+    response.headers = CaseInsensitiveDict(recorded["headers"])
+    response._content = _decode_body(recorded["body"])
+    response._content_consumed = True
+    response.url = request.url
+    response.request = request
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.reason = recorded.get("reason", "")
+    return response
+
+
+def _patched_requests_send(self, request, *args, **kwargs):
+    cassette = _active
+    if cassette is None:
+        return _original_requests_send(self, request, *args, **kwargs)
+
+    key = _http_key(request.method, request.url, request.body)
+    interaction = cassette.find(key)
+    if interaction is not None:
+        cassette.wait(interaction)
+        return _requests_response(request, interaction["response"])
+    cassette.miss(key)
+
+    started = time.monotonic()
+    response = _original_requests_send(self, request, *args, **kwargs)
+    content = response.content
+    cassette.add(service_for(request.url), key, {
+        "status": response.status_code,
+        "reason": response.reason,
+        "headers": _wire_free(response.headers),
+        "body": _encode_body(content),
+    }, time.monotonic() - started)
+    return response
+
+
+# ────────────────────────────────────────────────
+# httpx (OpenRouter via the openai client)
+# ────────────────────────────────────────────────
+# Newer openai clients ship on the httpx2 fork, so every importable flavour is patched
+HTTPX_MODULES = []
+for _name in ("httpx", "httpx2"):
+    try:
+        HTTPX_MODULES.append(importlib.import_module(_name))
+    except ImportError:
+        pass
+
+# module name -> (Client.send, AsyncClient.send) before patching
+_httpx_sends = {module.__name__: (module.Client.send, module.AsyncClient.send) for module in HTTPX_MODULES}
+
+
+def _httpx_module(request):
+    return sys.modules[type(request).__module__.split(".")[0]]
+
+
+def _original_httpx_send(client, request, *args, **kwargs):
+    return _httpx_sends[_httpx_module(request).__name__][0](client, request, *args, **kwargs)
+
+
+async def _original_httpx_asend(client, request, *args, **kwargs):
+    return await _httpx_sends[_httpx_module(request).__name__][1](client, request, *args, **kwargs)
+
+
+def _httpx_response(request, recorded):
+    return _httpx_module(request).Response(
+        status_code=recorded["status"],
+        headers=recorded["headers"],
+        content=_decode_body(recorded["body"]),
+        request=request,
+    )
+
+
+def _httpx_record(cassette, key, request, response, content, elapsed):
+    cassette.add(service_for(str(request.url)), key, {
+        "status": response.status_code,
+        "headers": _wire_free(dict(response.headers)),
+        "body": _encode_body(content),
+    }, elapsed)
+
+
+def _patched_httpx_send(self, request, *args, **kwargs):
+    cassette = _active
+    if cassette is None:
+        return _original_httpx_send(self, request, *args, **kwargs)
+
+    key = _http_key(request.method, str(request.url), request.read())
+    interaction = cassette.find(key)
+    if interaction is not None:
+        cassette.wait(interaction)
+        return _httpx_response(request, interaction["response"])
+    cassette.miss(key)
+
+    started = time.monotonic()
+    response = _original_httpx_send(self, request, *args, **kwargs)
+    _httpx_record(cassette, key, request, response, response.read(), time.monotonic() - started)
+    return response
+
+
+async def _patched_httpx_asend(self, request, *args, **kwargs):
+    cassette = _active
+    if cassette is None:
+        return await _original_httpx_asend(self, request, *args, **kwargs)
+
+    key = _http_key(request.method, str(request.url), await request.aread())
+    interaction = cassette.find(key)
+    if interaction is not None:
+        await cassette.await_latency(interaction)
+        return _httpx_response(request, interaction["response"])
+    cassette.miss(key)
+
+    started = time.monotonic()
+    response = await _original_httpx_asend(self, request, *args, **kwargs)
+    _httpx_record(cassette, key, request, response, await response.aread(), time.monotonic() - started)
+    return response
+
+
+# ────────────────────────────────────────────────
+# Function-level calls (DuckDuckGo via ddgs)
+# ────────────────────────────────────────────────
+
+def recorded(service, func):
+    """
+    Wraps func(*args) so its JSON-serializable return value is recorded/replayed.
+    Used for backends whose HTTP stack cannot be patched (ddgs talks through primp).
+    Exceptions are not recorded.
+    """
+    def run(*args, **kwargs):
+        cassette = _active
+        if cassette is None:
+            return func(*args, **kwargs)
+        key = ["call", service, json.dumps([args, kwargs], sort_keys=True, ensure_ascii=False, default=str)]
+        interaction = cassette.find(key)
+        if interaction is not None:
+            cassette.wait(interaction)
+            return interaction["response"]["value"]
+        cassette.miss(key)
+        started = time.monotonic()
+        value = func(*args, **kwargs)
+        cassette.add(service, key, {"value": value}, time.monotonic() - started)
+        return value
+    return run
+
+
+# ────────────────────────────────────────────────
+# Activation
+# ────────────────────────────────────────────────
+
+def install():
+    """Patches requests and httpx once. Patched senders pass straight through while no cassette is active."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        HTTPAdapter.send = _patched_requests_send
+        for module in HTTPX_MODULES:
+            module.Client.send = _patched_httpx_send
+            module.AsyncClient.send = _patched_httpx_asend
+        _installed = True
+
+
+def _parse_latency(value):
+    if not value:
+        return 0.0
+    return value if value == "recorded" else float(value)
+
+
+def activate(path=DEFAULT_CASSETTE, mode="replay", latency=0.0):
+    """Installs the patches and makes a cassette the active one for the whole process."""
+    global _active
+    install()
+    if _active is not None and _active.records:
+        _active.save()
+    _active = Cassette(path, mode, latency) if mode != "off" else None
+    return _active
+
+
+def deactivate():
+    global _active
+    if _active is not None and _active.records:
+        _active.save()
+    _active = None
+
+
+@contextmanager
+def use_cassette(path=DEFAULT_CASSETTE, mode="replay", latency=0.0):
+    """Runs the block against a cassette, restoring the previous one afterwards."""
+    global _active
+    previous = _active
+    cassette = activate(path, mode, latency)
+    try:
+        yield cassette
+    finally:
+        deactivate()
+        _active = previous
+
+
+def install_from_env():
+    """
+    Activates a cassette from REPLAY_MODE / REPLAY_CASSETTE / REPLAY_LATENCY.
+    Safe to call from several modules: the first call that finds a mode wins.
+    """
+    if _active is not None:
+        return _active
+    mode = os.getenv("REPLAY_MODE", "off").lower()
+    if mode == "off":
+        return None
+    cassette = activate(os.getenv("REPLAY_CASSETTE", DEFAULT_CASSETTE), mode,
+                        _parse_latency(os.getenv("REPLAY_LATENCY")))
+    print(f"📼 Replay mode '{mode}' using {cassette.path} ({len(cassette.interactions)} recorded calls)")
+    return cassette
+
+
+@atexit.register
+def _save_on_exit():
+    if _active is not None and _active.records:
+        _active.save()
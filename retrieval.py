@@ -0,0 +1,296 @@
+import re
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from source_ranker import mentions_district
+from tracing import span, bind
+
+# ────────────────────────────────────────────────
+# Query plan
+# ────────────────────────────────────────────────
+# Which keyword scripts are worth searching in for each country
+COUNTRY_SCRIPTS = {
+    "Taiwan": ("latin", "han"),
+    "Japan": ("latin", "han", "kana"),
+}
+DEFAULT_SCRIPTS = ("latin", "han", "kana")
+
+# Number of keyword queries per tool and script
+SERPER_KEYWORDS_PER_SCRIPT = 3
+DDG_KEYWORDS_PER_SCRIPT = 1
+
+
+def keyword_script(keyword):
+    """Classifies a keyword as "kana" (Japanese), "han" (Chinese characters only) or "latin"."""
+    if re.search(r"[぀-ヿ]", keyword):
+        return "kana"
+    if re.search(r"[一-鿿]", keyword):
+        return "han"
+    return "latin"
+
+
+def _keywords_by_script(topic_keywords, scripts):
+    grouped = {script: [] for script in scripts}
+    for keyword in dict.fromkeys(topic_keywords):
+        script = keyword_script(keyword)
+        if script in grouped:
+            grouped[script].append(keyword)
+    return grouped
+
+
+def build_query_plan(district, city, country, topic_keywords,
+                     serper_per_script=SERPER_KEYWORDS_PER_SCRIPT, ddg_per_script=DDG_KEYWORDS_PER_SCRIPT):
+    """
+    Returns a fixed list of (tool, query) pairs for one district:
+    Serper for official/report content per keyword, DuckDuckGo for news,
+    and one Wikipedia lookup for background.
+    """
+    grouped = _keywords_by_script(topic_keywords, COUNTRY_SCRIPTS.get(country, DEFAULT_SCRIPTS))
+    plan = []
+    for keywords in grouped.values():
+        for keyword in keywords[:serper_per_script]:
+            plan.append(("Serper", f"{district} {city} {keyword}"))
+        for keyword in keywords[:ddg_per_script]:
+            plan.append(("DuckDuckGo", f"{district} {city} {keyword}"))
+    plan.append(("Wikipedia", f"{district}, {city}"))
+    return list(dict.fromkeys(plan))
+
+
+def cap_plan(plan, max_calls):
+    """
+    Cuts a query plan to max_calls entries, keeping each tool's first query so no
+    tool (e.g. the single Wikipedia lookup at the end) is dropped entirely.
+    The plan order is kept.
+    """
+    if max_calls is None or len(plan) <= max_calls:
+        return list(plan)
+    firsts = {}
+    for i, (tool, _) in enumerate(plan):
+        firsts.setdefault(tool, i)
+    keep = set(sorted(firsts.values())[:max_calls])
+    for i in range(len(plan)):
+        if len(keep) >= max_calls:
+            break
+        keep.add(i)
+    return [entry for i, entry in enumerate(plan) if i in keep]
+
+
+# ────────────────────────────────────────────────
+# Parallel fan-out
+# ────────────────────────────────────────────────
+
+def _split_snippets(text):
+    """Tools return snippets joined by blank lines; split them back into individual sources."""
+    return [chunk.strip() for chunk in re.split(r"\n\s*\n", text or "") if chunk.strip()]
+
+
+def fan_out(plan, search_functions, max_workers=8, timeout=60, logger=None, on_sources=None, should_stop=None,
+            on_abandon=None):
+    """
+    Runs every (tool, query) in the plan concurrently.
+    search_functions maps tool name -> callable(query) returning text.
+    Returns sources as [{"tool", "query", "text"}]; failed or timed-out calls are skipped.
+    Total latency is bounded by the slowest call (or timeout), not the number of calls.
+    on_sources(new_sources) is called as each search returns; once should_stop()
+    is true the remaining searches are abandoned. on_abandon(reason, count) is
+    called when searches are abandoned ("enough_sources" or "deadline").
+    """
+    sources = []
+    if not plan:
+        return sources
+
+    deadline = time.monotonic() + timeout
+    with span("fan_out", queries=len(plan)) as fan_out_span:
+        pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(plan))))
+        futures = {pool.submit(bind(search_functions[tool]), query): (tool, query) for tool, query in plan}
+        pending = set(futures)
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tool, query = futures[future]
+                    try:
+                        snippets = _split_snippets(future.result())
+                    except Exception as e:
+                        print(f"❌ {tool} query failed ({query}): {e}")
+                        fan_out_span.count("failed_searches")
+                        continue
+                    new_sources = [{"tool": tool, "query": query, "text": s} for s in snippets]
+                    sources.extend(new_sources)
+                    if logger: logger(f"🔍 {tool}: {len(snippets)} snippets for \"{query}\"")
+                    if on_sources: on_sources(new_sources)
+                if should_stop and should_stop():
+                    if pending:
+                        print(f"✋ Enough sources, skipping {len(pending)} remaining searches")
+                        fan_out_span.count("skipped_searches", len(pending))
+                        if on_abandon: on_abandon("enough_sources", len(pending))
+                        pending = set()
+                    break
+        finally:
+            if pending:
+                print(f"⏱️ {len(pending)} searches still running at the deadline, skipping them")
+                fan_out_span.count("timed_out_searches", len(pending))
+                if on_abandon: on_abandon("deadline", len(pending))
+            pool.shutdown(wait=False, cancel_futures=True)
+    return sources
+
+
+# ────────────────────────────────────────────────
+# Budgets & early stopping
+# ────────────────────────────────────────────────
+# Wall-clock seconds one district's retrieval may take, per retrieval mode
+RETRIEVAL_DEADLINES = {"agent": 120.0, "fast": 60.0}
+MAX_TOOL_CALLS = 12
+# Prompt + completion tokens the retrieval agent may spend (scoring is not counted)
+MAX_RETRIEVAL_TOKENS = 30000
+# Distinct snippets naming the district after which retrieval stops early
+ENOUGH_SOURCES = 8
+
+_budget = contextvars.ContextVar("retrieval_budget", default=None)
+
+
+class BudgetExhausted(Exception):
+    """Raised inside retrieval once a limit is reached or enough evidence has been found."""
+
+    def __init__(self, reason):
+        super().__init__(f"retrieval stopped: {reason}")
+        self.reason = reason
+
+
+class RetrievalBudget:
+    """
+    Deadline, tool-call and token limits for one district's retrieval, plus the
+    early-stop rule (enough distinct snippets mentioning the district).
+    Every snippet a tool returns is collected here, so a run that is cut short
+    still has its evidence; on_sources(new_sources, budget) streams them out.
+    """
+
+    def __init__(self, district, deadline=RETRIEVAL_DEADLINES["agent"], max_tool_calls=MAX_TOOL_CALLS,
+                 max_tokens=MAX_RETRIEVAL_TOKENS, enough_sources=ENOUGH_SOURCES, on_sources=None):
+        self.district = district
+        self.deadline = deadline
+        self.max_tool_calls = max_tool_calls
+        self.max_tokens = max_tokens
+        self.enough_sources = enough_sources
+        self.on_sources = on_sources
+        self.started = time.monotonic()
+        self.tool_calls = 0
+        self.tokens = 0
+        self.sources = []
+        self.stop_reason = None
+        self._mentioning = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_mode(cls, district, retrieval_mode, **kwargs):
+        kwargs.setdefault("deadline", RETRIEVAL_DEADLINES.get(retrieval_mode, RETRIEVAL_DEADLINES["agent"]))
+        return cls(district, **kwargs)
+
+    def remaining(self):
+        return max(0.0, self.started + self.deadline - time.monotonic())
+
+    @property
+    def enough(self):
+        return bool(self.enough_sources) and len(self._mentioning) >= self.enough_sources
+
+    def exhausted(self):
+        """The first limit that has been reached (or None)."""
+        if self.enough:
+            return "enough_sources"
+        if self.remaining() <= 0:
+            return "deadline"
+        if self.max_tool_calls is not None and self.tool_calls >= self.max_tool_calls:
+            return "tool_calls"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return "tokens"
+        return None
+
+    def check(self):
+        """Raises BudgetExhausted (and remembers why) once any limit is reached."""
+        with self._lock:
+            self.stop_reason = self.stop_reason or self.exhausted()
+            if self.stop_reason:
+                raise BudgetExhausted(self.stop_reason)
+
+    def charge_call(self):
+        """Checks the budget and counts one tool call against it."""
+        self.check()
+        with self._lock:
+            self.tool_calls += 1
+
+    def count_call(self):
+        """Counts a tool call that needs no check, e.g. one search of an already capped query plan."""
+        with self._lock:
+            self.tool_calls += 1
+
+    def charge_tokens(self, llm_output):
+        usage = (llm_output or {}).get("token_usage") or {}
+        with self._lock:
+            self.tokens += usage.get("total_tokens") or 0
+
+    def add_sources(self, new_sources):
+        with self._lock:
+            self.sources.extend(new_sources)
+            for source in new_sources:
+                if mentions_district(source.get("text"), self.district):
+                    self._mentioning.add(source["text"].strip())
+        if self.on_sources and new_sources:
+            self.on_sources(new_sources, self)
+
+    def summary(self):
+        return {
+            "tool_calls": self.tool_calls,
+            "tokens": self.tokens,
+            "sources": len(self.sources),
+            "district_sources": len(self._mentioning),
+            "elapsed_s": round(time.monotonic() - self.started, 2),
+            "stop_reason": self.stop_reason,
+        }
+
+
+def active_budget():
+    return _budget.get()
+
+
+@contextmanager
+def use_budget(budget):
+    """Makes budget the active one for tools and LLM calls in this context."""
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+def budgeted(tool, func):
+    """
+    Wraps a search tool so that, while a budget is active, each call is charged
+    against it (raising BudgetExhausted when spent) and its snippets are collected.
+    """
+    def run(query):
+        budget = _budget.get()
+        if budget is None:
+            return func(query)
+        budget.charge_call()
+        text = func(query)
+        budget.add_sources([{"tool": tool, "query": query, "text": s} for s in _split_snippets(text)])
+        return text
+    return run
+
+
+def abudgeted(tool, func):
+    """budgeted() for a coroutine function (the agent's async tool path)."""
+    async def run(query):
+        budget = _budget.get()
+        if budget is None:
+            return await func(query)
+        budget.charge_call()
+        text = await func(query)
+        budget.add_sources([{"tool": tool, "query": query, "text": s} for s in _split_snippets(text)])
+        return text
+    return run
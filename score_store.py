@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from topic_configs import TOPIC_CONFIG
+
+DEFAULT_DB_PATH = os.path.join("countries", "scores.sqlite3")
+# Freshness of topics without a ttl_days entry in TOPIC_CONFIG
+DEFAULT_TTL_DAYS = 30
+DAY = 24 * 60 * 60
+# updated_at of rows imported from legacy JSON files: their age is unknown, so they start out stale
+LEGACY_UPDATED_AT = 0.0
+
+
+def _key(country, city, topic, district=None):
+    key = (country.lower(), city, topic)
+    return key if district is None else key + (district,)
+
+
+def topic_ttl_days(topic):
+    return TOPIC_CONFIG.get(topic, {}).get("ttl_days", DEFAULT_TTL_DAYS)
+
+
+def is_fresh(updated_at, ttl_days, now=None):
+    """True while a score updated at updated_at is younger than ttl_days."""
+    return updated_at is not None and (now or time.time()) - updated_at < ttl_days * DAY
+
+
+def freshness_label(updated_at, now=None):
+    """Human-readable age of a score, e.g. "updated 3 days ago"."""
+    if not updated_at:
+        return "imported, age unknown"
+    age = (now or time.time()) - updated_at
+    if age < DAY:
+        return "updated today"
+    days = int(age // DAY)
+    return f"updated {days} day{'s' if days != 1 else ''} ago"
+
+
+class ScoreStore:
+    """
+    SQLite-backed store for district scores.
+    One row per (country, city, topic, district) holding the score plus the
+    metrics and tool_results that produced it. Writes are single-row upserts,
+    and WAL mode lets the app read while scoring runs write.
+    Country names are stored lower-cased to match the countries/<country>/ folders.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scores (
+                    country TEXT NOT NULL,
+                    city TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    district TEXT NOT NULL,
+                    score REAL,
+                    metrics TEXT,
+                    tool_results TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (country, city, topic, district)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS legacy_imports (
+                    path TEXT PRIMARY KEY,
+                    imported_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_record(row):
+        score, metrics, tool_results, updated_at = row
+        return {
+            "tool_results": json.loads(tool_results) if tool_results else [],
+            "metrics": json.loads(metrics) if metrics else {},
+            "score": score,
+            "updated_at": updated_at,
+        }
+
+    # ── reads ───────────────────────────────────
+
+    def get(self, country, city, topic, district):
+        """Returns the full record for one district, or None if it has not been scored."""
+        row = self._connect().execute(
+            "SELECT score, metrics, tool_results, updated_at FROM scores "
+            "WHERE country = ? AND city = ? AND topic = ? AND district = ?",
+            _key(country, city, topic, district),
+        ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def get_scores(self, country, city, topic):
+        """Returns {district: score} for every scored district of a city."""
+        rows = self._connect().execute(
+            "SELECT district, score FROM scores WHERE country = ? AND city = ? AND topic = ?",
+            _key(country, city, topic),
+        ).fetchall()
+        return {district: score for district, score in rows if score is not None}
+
+    def get_updated_at(self, country, city, topic):
+        """Returns {district: updated_at} for every scored district of a city."""
+        rows = self._connect().execute(
+            "SELECT district, updated_at FROM scores WHERE country = ? AND city = ? AND topic = ? "
+            "AND score IS NOT NULL",
+            _key(country, city, topic),
+        ).fetchall()
+        return dict(rows)
+
+    def stale_districts(self, country, city, topic, ttl_days=None, now=None):
+        """Scored districts of a city older than the topic's TTL (or ttl_days), oldest first."""
+        ttl_days = topic_ttl_days(topic) if ttl_days is None else ttl_days
+        rows = self._connect().execute(
+            "SELECT district FROM scores WHERE country = ? AND city = ? AND topic = ? "
+            "AND score IS NOT NULL AND updated_at < ? ORDER BY updated_at",
+            _key(country, city, topic) + ((now or time.time()) - ttl_days * DAY,),
+        ).fetchall()
+        return [district for district, in rows]
+
+    def get_metrics(self, country, topic, city=None):
+        """Returns [(city, district, metrics)] for every scored district of a country (or one city)."""
+        query = "SELECT city, district, metrics FROM scores WHERE country = ? AND topic = ?"
+        params = (country.lower(), topic)
+        if city is not None:
+            query += " AND city = ?"
+            params += (city,)
+        rows = self._connect().execute(query + " ORDER BY city, district", params).fetchall()
+        return [(row_city, district, json.loads(metrics) if metrics else {}) for row_city, district, metrics in rows]
+
+    def get_records(self, country, city, topic):
+        """Returns {district: record} for every scored district of a city."""
+        rows = self._connect().execute(
+            "SELECT district, score, metrics, tool_results, updated_at FROM scores "
+            "WHERE country = ? AND city = ? AND topic = ?",
+            _key(country, city, topic),
+        ).fetchall()
+        return {row[0]: self._row_to_record(row[1:]) for row in rows}
+
+    # ── writes ──────────────────────────────────
+
+    def upsert(self, country, city, topic, district, record):
+        """Inserts or replaces the record for one district."""
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO scores (country, city, topic, district, score, metrics, tool_results, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(country, city, topic, district) DO UPDATE SET
+                    score = excluded.score, metrics = excluded.metrics,
+                    tool_results = excluded.tool_results, updated_at = excluded.updated_at
+            """, _key(country, city, topic, district) + (
+                record.get("score"),
+                json.dumps(record.get("metrics") or {}, ensure_ascii=False),
+                json.dumps(record.get("tool_results") or [], ensure_ascii=False),
+                record.get("updated_at") or time.time(),
+            ))
+
+    def update_scores(self, country, topic, scores):
+        """Sets the score of many [(city, district, score)] rows at once, keeping updated_at."""
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE scores SET score = ? WHERE country = ? AND city = ? AND topic = ? AND district = ?",
+                [(score,) + _key(country, city, topic, district) for city, district, score in scores],
+            )
+
+    # ── legacy JSON import ──────────────────────
+
+    def import_json_file(self, data_file, country, city, topic):
+        """
+        Imports a legacy countries/<country>/<city>/<topic>_data.json file once.
+        Handles both the flat {district: score} files written by app.py and the
+        rich {district: {tool_results, metrics, score}} files written by score_district.
+        Rows already in the store are kept. Imported rows are stamped
+        LEGACY_UPDATED_AT (stale), since a file's mtime is reset by every checkout.
+        Returns the number of rows imported.
+        """
+        path = os.path.abspath(data_file)
+        conn = self._connect()
+        if not os.path.exists(data_file) or conn.execute(
+                "SELECT 1 FROM legacy_imports WHERE path = ?", (path,)).fetchone():
+            return 0
+
+        with open(data_file, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+
+        rows = []
+        for district, value in legacy.items():
+            record = value if isinstance(value, dict) else {"score": value}
+            rows.append(_key(country, city, topic, district) + (
+                record.get("score"),
+                json.dumps(record.get("metrics") or {}, ensure_ascii=False),
+                json.dumps(record.get("tool_results") or [], ensure_ascii=False),
+                LEGACY_UPDATED_AT,
+            ))
+
+        with conn:
+            conn.executemany("""
+                INSERT INTO scores (country, city, topic, district, score, metrics, tool_results, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(country, city, topic, district) DO NOTHING
+            """, rows)
+            conn.execute("INSERT INTO legacy_imports (path, imported_at) VALUES (?, ?)", (path, time.time()))
+        print(f"📥 Imported {len(rows)} legacy scores from {data_file}")
+        return len(rows)
+
+    def import_tree(self, root="countries"):
+        """Imports every countries/<country>/<city>/<topic>_data.json file under root."""
+        total = 0
+        for country in sorted(os.listdir(root)):
+            country_dir = os.path.join(root, country)
+            if not os.path.isdir(country_dir):
+                continue
+            for city in sorted(os.listdir(country_dir)):
+                city_dir = os.path.join(country_dir, city)
+                if not os.path.isdir(city_dir):
+                    continue
+                for name in sorted(os.listdir(city_dir)):
+                    if name.endswith("_data.json"):
+                        topic = name[:-len("_data.json")]
+                        total += self.import_json_file(os.path.join(city_dir, name), country, city, topic)
+        return total
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the process-wide ScoreStore at DEFAULT_DB_PATH."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ScoreStore()
+        return _default_store
+
+
+if __name__ == "__main__":
+    imported = get_store().import_tree()
+    print(f"✅ Imported {imported} scores into {DEFAULT_DB_PATH}")
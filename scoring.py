@@ -0,0 +1,206 @@
+import re
+import json
+from openai import BadRequestError
+from topic_configs import TOPIC_CONFIG
+from tracing import span
+
+# ────────────────────────────────────────────────
+# Metric schema
+# ────────────────────────────────────────────────
+SCALE = ["very poor", "poor", "average", "good", "excellent"]
+
+SCORING_INSTRUCTIONS = """
+    INSTRUCTIONS:
+
+    1. Evaluate conditions at the DISTRICT LEVEL.
+    - Do NOT generalize from a single localized complaint.
+    - A single negative news article does NOT justify a "poor" rating.
+    - Only assign "poor" or "very poor" if there is repeated, systemic,
+        or district-wide evidence of persistent issues.
+
+    2. Government monitoring reports, routine clean-up reports, or inspection
+    activity indicate baseline functioning — NOT failure.
+
+    3. Positive civic activities (e.g., volunteer cleanups, upgrades,
+    improvements, proactive ordinances) indicate active governance and
+    should prevent overly negative scoring.
+
+    4. Be conservative with extreme ratings:
+    - Use "excellent" only if there is strong evidence of exceptional performance.
+    - Use "very poor" only if there is strong evidence of severe, systemic issues.
+
+    5. Treat interventions like new rules, fines, or regulations as **evidence of active management**,
+    not automatically as negative conditions.
+
+    Use ONLY the following scale for every metric:
+    "very poor", "poor", "average", "good", "excellent"
+"""
+
+
+def topic_metrics(topic):
+    """
+    Returns [(metric_name, group)] for a topic, parsed from the
+    "- metric_name (...)" lines of TOPIC_CONFIG[topic]['metrics'].
+    """
+    metrics = []
+    for group, text in TOPIC_CONFIG.get(topic, {}).get("metrics", {}).items():
+        for match in re.finditer(r"^\s*-\s*([A-Za-z0-9_]+)", text, re.MULTILINE):
+            metrics.append((match.group(1), group))
+    return metrics
+
+
+def metric_schema(topic):
+    """Strict JSON schema for one district's metrics: every metric required, values limited to SCALE."""
+    names = [name for name, _ in topic_metrics(topic)]
+    return {
+        "type": "object",
+        "properties": {name: {"type": "string", "enum": SCALE} for name in names},
+        "required": names,
+        "additionalProperties": False,
+    }
+
+
+def batch_schema(topic, districts):
+    """Strict JSON schema for several districts: {district: metrics}."""
+    return {
+        "type": "object",
+        "properties": {district: metric_schema(topic) for district in districts},
+        "required": list(districts),
+        "additionalProperties": False,
+    }
+
+
+def validate_metrics(metrics, topic):
+    """Keeps only known metrics with values on the scale (lower-cased)."""
+    names = {name for name, _ in topic_metrics(topic)}
+    valid = {}
+    if not isinstance(metrics, dict):
+        return valid
+    for name, value in metrics.items():
+        if name in names and isinstance(value, str) and value.lower() in SCALE:
+            valid[name] = value.lower()
+    return valid
+
+
+# ────────────────────────────────────────────────
+# Prompts
+# ────────────────────────────────────────────────
+
+def _sources_block(sources):
+    return "\n".join(f"{s['tool']}: {s['text']}" for s in sources) or "(no sources found)"
+
+
+def _metrics_block(topic):
+    config = TOPIC_CONFIG.get(topic).get('metrics')
+    return f"""
+    Metrics to include (fill with estimates if unknown):
+    Positive Metrics:
+    {config.get("positive")}
+    Negative Metrics:
+    {config.get("negative")}
+"""
+
+
+def build_scoring_prompt(district, city, country, topic, sources):
+    return f"""
+    You are an expert municipal urban policy analyst.
+
+    Your task is to evaluate district-level conditions using aggregated evidence,
+    not isolated anecdotes.
+
+    District: "{district}"
+    City: {city}
+    Country: {country}
+    Topic: "{topic}"
+
+    Sources:
+    {_sources_block(sources)}
+{SCORING_INSTRUCTIONS}{_metrics_block(topic)}
+    Return a single JSON object mapping each metric name to its rating.
+    Do NOT include explanations.
+    """
+
+
+def build_batch_scoring_prompt(evidence, city, country, topic):
+    """evidence is [(district, sources)]; each district is judged only on its own sources."""
+    blocks = "\n".join(
+        f"""
+    ### District: "{district}"
+    Sources:
+    {_sources_block(sources)}
+"""
+        for district, sources in evidence
+    )
+    return f"""
+    You are an expert municipal urban policy analyst.
+
+    Your task is to evaluate district-level conditions using aggregated evidence,
+    not isolated anecdotes. Several districts are listed below; rate each one
+    ONLY from the sources listed under it.
+
+    City: {city}
+    Country: {country}
+    Topic: "{topic}"
+{blocks}{SCORING_INSTRUCTIONS}{_metrics_block(topic)}
+    Return a single JSON object whose keys are the district names exactly as
+    written above, each mapping to an object of metric name -> rating.
+    Do NOT include explanations.
+    """
+
+
+# ────────────────────────────────────────────────
+# Direct structured-output calls
+# ────────────────────────────────────────────────
+
+def _parse_json(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):] if "{" in text else text
+    return json.loads(text)
+
+
+def _invoke_structured(llm, prompt, schema, name):
+    """
+    Calls the model with a strict json_schema response format. Providers that
+    reject response_format (a 400 bad request) fall back to the plain prompt,
+    which asks for JSON too. Returns {} when the reply is not a JSON object.
+    """
+    response_format = {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+    with span("llm.structured", schema=name) as llm_span:
+        try:
+            content = llm.bind(response_format=response_format).invoke(prompt).content
+        except BadRequestError as e:
+            print(f"⚠️ Structured output not accepted ({e}), retrying with plain JSON prompt")
+            llm_span.count("structured_fallbacks")
+            content = llm.invoke(prompt).content
+    try:
+        result = _parse_json(content)
+    except (json.JSONDecodeError, TypeError):
+        print("Could not load json:", content)
+        return {}
+    if not isinstance(result, dict):
+        print("Expected a JSON object, got:", content)
+        return {}
+    return result
+
+
+def score_evidence(llm, district, city, country, topic, sources):
+    """Scores one district from its sources with one LLM call. Returns validated metrics."""
+    prompt = build_scoring_prompt(district, city, country, topic, sources)
+    metrics = _invoke_structured(llm, prompt, metric_schema(topic), "district_metrics")
+    return validate_metrics(metrics, topic)
+
+
+def score_evidence_batch(llm, evidence, city, country, topic):
+    """
+    Scores several districts in one LLM call.
+    evidence is [(district, sources)]; returns {district: validated metrics}.
+    """
+    if len(evidence) == 1:
+        district, sources = evidence[0]
+        return {district: score_evidence(llm, district, city, country, topic, sources)}
+    districts = [district for district, _ in evidence]
+    prompt = build_batch_scoring_prompt(evidence, city, country, topic)
+    result = _invoke_structured(llm, prompt, batch_schema(topic, districts), "districts_metrics")
+    return {district: validate_metrics(result.get(district), topic) for district in districts}
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from tracing import count
+
+# ────────────────────────────────────────────────
+# Defaults
+# ────────────────────────────────────────────────
+CACHE_DIR = ".cache"
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "search_cache.sqlite3")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+# How long a result stays valid, per tool. News moves fast, encyclopedias don't.
+TOOL_TTLS = {
+    "serper": 3 * DAY,
+    "duckduckgo": 6 * HOUR,
+    "wikipedia": 30 * DAY,
+}
+DEFAULT_TTL = DAY
+
+
+def normalize_query(query):
+    """NFKC-normalizes, lowercases and collapses whitespace so trivially different queries share an entry."""
+    query = unicodedata.normalize("NFKC", query)
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class SearchCache:
+    """
+    Disk-backed search result cache keyed by (tool, normalized query, locale).
+    Entries expire after the tool's TTL and the file is kept under max_bytes
+    by evicting least-recently-used entries.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttls=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(TOOL_TTLS, **(ttls or {}))
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_results (
+                    key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    locale TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_search_results_accessed ON search_results (accessed_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(tool, query, locale=""):
+        raw = json.dumps([tool, normalize_query(query), locale], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, hit):
+        count("search_cache_hits" if hit else "search_cache_misses")
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, tool, query, locale=""):
+        """Returns the cached result or None if missing or expired."""
+        key = self.make_key(tool, query, locale)
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT value, created_at FROM search_results WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttls.get(tool, DEFAULT_TTL):
+            self._count(False)
+            return None
+        with conn:
+            conn.execute("UPDATE search_results SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(True)
+        return json.loads(row[0])
+
+    def put(self, tool, query, value, locale=""):
+        key = self.make_key(tool, query, locale)
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                INSERT INTO search_results (key, tool, query, locale, value, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value, size = excluded.size,
+                    created_at = excluded.created_at, accessed_at = excluded.accessed_at
+            """, (key, tool, normalize_query(query), locale, encoded, len(encoded.encode("utf-8")), now, now))
+        self._evict()
+
+    def _evict(self):
+        """Drops expired entries, then least-recently-used ones until under max_bytes."""
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            for tool, ttl in self.ttls.items():
+                conn.execute("DELETE FROM search_results WHERE tool = ? AND created_at < ?", (tool, now - ttl))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM search_results").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in conn.execute("SELECT key, size FROM search_results ORDER BY accessed_at").fetchall():
+                conn.execute("DELETE FROM search_results WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def get_or_compute(self, tool, query, func, locale=""):
+        """Returns the cached result for the query, calling func() and caching its result on a miss."""
+        value = self.get(tool, query, locale)
+        if value is not None:
+            return value
+        value = func()
+        self.put(tool, query, value, locale)
+        return value
+
+    async def aget_or_compute(self, tool, query, make_call, locale=""):
+        """Async get_or_compute(): awaits make_call() on a miss (the SQLite lookups stay synchronous)."""
+        value = self.get(tool, query, locale)
+        if value is not None:
+            return value
+        value = await make_call()
+        self.put(tool, query, value, locale)
+        return value
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        row = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_results").fetchone()
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": row[0],
+            "bytes": row[1],
+        }
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM search_results")
@@ -0,0 +1,272 @@
+import sys
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracing import count
+
+# ────────────────────────────────────────────────
+# Defaults
+# ────────────────────────────────────────────────
+# (requests per second, burst size) allowed for each host
+HOST_RATES = {
+    "google.serper.dev": (5.0, 10),
+    "duckduckgo.com": (1.0, 2),
+    "wikipedia.org": (5.0, 10),
+}
+DEFAULT_RATE = (2.0, 4)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Exceptions raised by non-requests backends (ddgs) that mean "slow down and retry"
+RETRYABLE_EXCEPTION_NAMES = {"RatelimitException", "TimeoutException"}
+
+
+class TokenBucket:
+    """Thread-safe token bucket. acquire() blocks until a token is available."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Takes a token and returns 0, or returns the seconds to wait before trying again."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while (wait := self.try_acquire()) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """Like acquire(), but waits with asyncio.sleep so the event loop keeps running."""
+        while (wait := self.try_acquire()) > 0:
+            await asyncio.sleep(wait)
+
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(exc):
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUSES
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in RETRY_STATUSES
+        if isinstance(exc, httpx.TransportError):
+            return True
+    return type(exc).__name__ in RETRYABLE_EXCEPTION_NAMES
+
+
+# ────────────────────────────────────────────────
+# Search client
+# ────────────────────────────────────────────────
+
+class SearchClient:
+    """
+    Shared client for every search backend.
+    - one pooled keep-alive requests.Session for HTTP backends
+    - a token bucket per host
+    - exponential backoff (with jitter) on 429/5xx and connection errors
+    - identical in-flight calls are coalesced into a single network call
+    Every sync method has an async counterpart prefixed with "a". The async HTTP
+    methods use a pooled httpx.AsyncClient (one per event loop) and never block a
+    thread. Non-HTTP backends (ddgs, the wikipedia package) are blocking libraries
+    with their own connections, so acall() runs them in a worker thread while rate
+    limiting, backoff and coalescing stay on the event loop.
+    """
+
+    def __init__(self, timeout=20, max_retries=3, backoff_base=1.0, pool_size=16, host_rates=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.host_rates = dict(HOST_RATES, **(host_rates or {}))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.pool_size = pool_size
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+        self._ainflight = weakref.WeakKeyDictionary()  # event loop -> {key: Task}
+
+    def _bucket(self, host):
+        with self._buckets_lock:
+            if host not in self._buckets:
+                rate, capacity = self.host_rates.get(host, DEFAULT_RATE)
+                self._buckets[host] = TokenBucket(rate, capacity)
+            return self._buckets[host]
+
+    def _with_retries(self, host, func):
+        bucket = self._bucket(host)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            count(f"calls.{host}")
+            try:
+                return func()
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                count("retries")
+                delay = _retry_after(e) or self.backoff_base * (2 ** attempt)
+                delay += random.uniform(0, self.backoff_base)
+                print(f"⏳ {host} call failed ({e}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def _coalesced(self, key, func):
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    # ── sync interface ──────────────────────────
+
+    def call(self, host, key, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) for a non-HTTP backend with rate limiting, retries and coalescing."""
+        return self._coalesced((host, key), lambda: self._with_retries(host, lambda: func(*args, **kwargs)))
+
+    def post_json(self, url, payload, headers=None):
+        """POSTs a JSON payload through the pooled session and returns the decoded JSON response."""
+        host = urlparse(url).hostname
+        body = json.dumps(payload, sort_keys=True)
+
+        def send():
+            response = self.session.post(url, headers=headers, data=body, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return self._coalesced(("POST", url, body), lambda: self._with_retries(host, send))
+
+    def get_json(self, url, params=None, headers=None):
+        """GETs url through the pooled session and returns the decoded JSON response."""
+        host = urlparse(url).hostname
+        key = ("GET", url, json.dumps(params or {}, sort_keys=True))
+
+        def send():
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return self._coalesced(key, lambda: self._with_retries(host, send))
+
+    # ── asyncio interface ───────────────────────
+
+    def _async_client(self):
+        import httpx
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            client = self._async_clients[loop] = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        return client
+
+    async def _awith_retries(self, host, make_call):
+        bucket = self._bucket(host)
+        for attempt in range(self.max_retries + 1):
+            await bucket.aacquire()
+            count(f"calls.{host}")
+            try:
+                return await make_call()
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                count("retries")
+                delay = _retry_after(e) or self.backoff_base * (2 ** attempt)
+                delay += random.uniform(0, self.backoff_base)
+                print(f"⏳ {host} call failed ({e}), retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+    async def _acoalesced(self, key, make_call):
+        inflight = self._ainflight.setdefault(asyncio.get_running_loop(), {})
+        task = inflight.get(key)
+        if task is None:
+            task = inflight[key] = asyncio.ensure_future(make_call())
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        # shield: one cancelled waiter must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    async def acall(self, host, key, func, *args, **kwargs):
+        """Async call(): func runs in a worker thread, waits and retries happen on the event loop."""
+        return await self._acoalesced(
+            (host, key), lambda: self._awith_retries(host, lambda: asyncio.to_thread(func, *args, **kwargs)))
+
+    async def apost_json(self, url, payload, headers=None):
+        """Async post_json() through the pooled httpx.AsyncClient."""
+        host = urlparse(url).hostname
+        body = json.dumps(payload, sort_keys=True)
+
+        async def send():
+            response = await self._async_client().post(url, headers=headers, content=body)
+            response.raise_for_status()
+            return response.json()
+
+        return await self._acoalesced(("POST", url, body), lambda: self._awith_retries(host, send))
+
+    async def aget_json(self, url, params=None, headers=None):
+        """Async get_json() through the pooled httpx.AsyncClient."""
+        host = urlparse(url).hostname
+        key = ("GET", url, json.dumps(params or {}, sort_keys=True))
+
+        async def send():
+            response = await self._async_client().get(url, params=params, headers=headers)
+            response.raise_for_status()
+            return response.json()
+
+        return await self._acoalesced(key, lambda: self._awith_retries(host, send))
+
+    async def aclose(self):
+        """Closes the httpx.AsyncClient of the running event loop."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        self.session.close()
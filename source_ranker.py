@@ -0,0 +1,144 @@
+import re
+import unicodedata
+from collections import deque
+from functools import lru_cache
+
+# ────────────────────────────────────────────────
+# Relevance signals
+# ────────────────────────────────────────────────
+DATA_KEYWORDS = ["統計", "數據", "報告", "年", "資料", "table", "statistics"]
+GOV_MARKERS = [".gov"]
+
+DISTRICT_WEIGHT = 0.4
+KEYWORD_WEIGHT = 0.2
+DATA_WEIGHT = 0.05
+DATA_CAP = 0.15
+GOV_WEIGHT = 0.1
+
+DEFAULT_TOP_K = 12
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_MIN_SCORE = 0.2
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick multi-pattern matcher.
+    Finds every pattern occurring in a text in a single pass, instead of one
+    substring scan per pattern. Matching is case-insensitive.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(p.lower() for p in patterns if p))
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text):
+        """Returns the set of patterns that occur in text."""
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found |= self.output[state]
+        return {self.patterns[i] for i in found}
+
+
+@lru_cache(maxsize=64)
+def _matcher(district, topic_keywords):
+    return KeywordMatcher((district,) + topic_keywords + tuple(DATA_KEYWORDS) + tuple(GOV_MARKERS))
+
+
+def relevance(text, topic_keywords, district):
+    """
+    Scores one snippet from 0 to 1 for how useful it is for scoring the district:
+    district mention, topic keyword hits, data/report wording and government sources.
+    """
+    found = _matcher(district, tuple(topic_keywords)).find(text)
+    score = DISTRICT_WEIGHT if district.lower() in found else 0.0
+    score += KEYWORD_WEIGHT * len(found & {kw.lower() for kw in topic_keywords} - {district.lower()})
+    data_hits = len(found & {kw.lower() for kw in DATA_KEYWORDS})
+    score += min(data_hits * DATA_WEIGHT, DATA_CAP)
+    if found & set(GOV_MARKERS):
+        score += GOV_WEIGHT
+    return min(score, 1.0)
+
+
+# ────────────────────────────────────────────────
+# Pre-ranking
+# ────────────────────────────────────────────────
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+def mentions_district(text, district):
+    """True if the snippet names the district (case, width and punctuation insensitive)."""
+    return bool(district) and _normalize(district) in _normalize(text or "")
+
+
+def estimate_tokens(text):
+    """Rough token count: CJK characters are about one token each, other text about four characters per token."""
+    cjk = sum(1 for char in text if "　" <= char <= "鿿" or "가" <= char <= "힯")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def rank_sources(sources, district, topic_keywords, top_k=DEFAULT_TOP_K,
+                 token_budget=DEFAULT_TOKEN_BUDGET, min_score=DEFAULT_MIN_SCORE):
+    """
+    Deterministic pre-ranking of retrieved snippets before the scoring prompt.
+    Drops empty and duplicate snippets (including ones contained in a longer
+    snippet) and those below min_score, then keeps the best top_k that fit in
+    token_budget. Each kept source gets a "relevance" field.
+    """
+    candidates = []
+    for source in sources:
+        text = (source.get("text") or "").strip()
+        normalized = _normalize(text)
+        if normalized:
+            candidates.append((relevance(text, topic_keywords, district), normalized, source))
+
+    # Longest first so contained snippets are recognised as duplicates
+    candidates.sort(key=lambda c: len(c[1]), reverse=True)
+    unique = []
+    for score, normalized, source in candidates:
+        if score < min_score or any(normalized in kept for _, kept, _ in unique):
+            continue
+        unique.append((score, normalized, source))
+
+    unique.sort(key=lambda c: c[0], reverse=True)
+    ranked, used = [], 0
+    for score, _, source in unique:
+        if len(ranked) >= top_k:
+            break
+        cost = estimate_tokens(source["text"])
+        if used + cost > token_budget:
+            continue
+        used += cost
+        ranked.append(dict(source, relevance=round(score, 2)))
+    return ranked
@@ -0,0 +1,246 @@
+import os
+import json
+import math
+from geometry import geometry_exists, geometry_mtime, load_city_geojson, read_index
+from score_store import get_store
+
+NODE_CAPACITY = 16
+
+
+def index_file_for(geo_file):
+    """countries/<country>/<city>/map.geojson -> countries/<country>/<city>/map.rtree.json"""
+    root, _ = os.path.splitext(geo_file)
+    return f"{root}.rtree.json"
+
+
+def _union(boxes):
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+def _contains(bbox, x, y):
+    return bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]
+
+
+# ────────────────────────────────────────────────
+# STR-packed R-tree
+# ────────────────────────────────────────────────
+
+def str_pack(boxes, capacity=NODE_CAPACITY):
+    """
+    Sort-Tile-Recursive bulk load.
+    boxes is a list of [minx, miny, maxx, maxy]; returns the tree as a list of
+    levels from the leaves up. Each node is [bbox, child indices into the level
+    below] (the leaf level's children index into boxes).
+    """
+    levels = []
+    items = list(enumerate(boxes))
+    while True:
+        slices = max(1, math.ceil(math.sqrt(math.ceil(len(items) / capacity))))
+        items.sort(key=lambda item: (item[1][0] + item[1][2]) / 2)
+        slab_size = slices * capacity
+        nodes = []
+        for s in range(0, len(items), slab_size):
+            slab = sorted(items[s:s + slab_size], key=lambda item: (item[1][1] + item[1][3]) / 2)
+            for n in range(0, len(slab), capacity):
+                group = slab[n:n + capacity]
+                nodes.append([_union([box for _, box in group]), [i for i, _ in group]])
+        levels.append(nodes)
+        if len(nodes) <= 1:
+            return levels
+        items = [(i, node[0]) for i, node in enumerate(nodes)]
+
+
+def str_query(levels, boxes, x, y):
+    """Returns the indices of the packed boxes whose bbox contains (x, y)."""
+    if not levels or not levels[-1]:
+        return []
+    candidates = [i for i, node in enumerate(levels[-1]) if _contains(node[0], x, y)]
+    for depth in range(len(levels) - 1, -1, -1):
+        level = levels[depth]
+        below = levels[depth - 1] if depth > 0 else None
+        next_candidates = []
+        for i in candidates:
+            for child in level[i][1]:
+                if _contains(below[child][0] if below is not None else boxes[child], x, y):
+                    next_candidates.append(child)
+        candidates = next_candidates
+    return candidates
+
+
+# ────────────────────────────────────────────────
+# Point in polygon
+# ────────────────────────────────────────────────
+
+def _point_in_ring(x, y, ring):
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _point_in_polygon(x, y, polygon):
+    """polygon is [outer, hole, hole, ...]"""
+    if not _point_in_ring(x, y, polygon[0]):
+        return False
+    return not any(_point_in_ring(x, y, hole) for hole in polygon[1:])
+
+
+# ────────────────────────────────────────────────
+# Per-city index
+# ────────────────────────────────────────────────
+
+def build_city_index(geo_file):
+    """
+    Builds and persists an STR R-tree over every polygon of a city.
+    Leaves are individual polygons (a MultiPolygon district contributes one per part).
+    """
+    geojson_data = load_city_geojson(geo_file)
+    entries = []
+    for feature_index, feature in enumerate(geojson_data.get("features", [])):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            continue
+        for part, polygon in enumerate(polygons):
+            if polygon and polygon[0]:
+                xs = [p[0] for p in polygon[0]]
+                ys = [p[1] for p in polygon[0]]
+                entries.append({"feature": feature_index, "part": part, "bbox": [min(xs), min(ys), max(xs), max(ys)]})
+
+    tree = str_pack([entry["bbox"] for entry in entries])
+    index = {
+        "node_capacity": NODE_CAPACITY,
+        "districts": [entry["district"] for entry in read_index(geo_file)],
+        "entries": entries,
+        "levels": tree,
+    }
+    path = index_file_for(geo_file)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    return path
+
+
+def ensure_city_index(geo_file):
+    """Builds the city's R-tree unless an up-to-date one is already persisted."""
+    path = index_file_for(geo_file)
+    if geometry_exists(geo_file) and (
+            not os.path.exists(path) or os.path.getmtime(path) < geometry_mtime(geo_file)):
+        build_city_index(geo_file)
+    return path
+
+
+class CityIndex:
+    """Loaded R-tree for one city plus the polygons needed for exact point-in-polygon tests."""
+
+    def __init__(self, city, geo_file):
+        self.city = city
+        with open(ensure_city_index(geo_file), encoding="utf-8") as f:
+            index = json.load(f)
+        self.districts = index["districts"]
+        self.entries = index["entries"]
+        self.levels = index["levels"]
+        self.boxes = [entry["bbox"] for entry in self.entries]
+        self.bbox = self.levels[-1][0][0] if self.levels and self.levels[-1] else None
+
+        features = load_city_geojson(geo_file).get("features", [])
+        self.polygons = []
+        for entry in self.entries:
+            geometry = features[entry["feature"]]["geometry"]
+            coords = geometry["coordinates"]
+            self.polygons.append(coords if geometry["type"] == "Polygon" else coords[entry["part"]])
+
+    def lookup(self, lon, lat):
+        """Returns the district containing (lon, lat), or None."""
+        for i in str_query(self.levels, self.boxes, lon, lat):
+            if _point_in_polygon(lon, lat, self.polygons[i]):
+                return self.districts[self.entries[i]["feature"]]
+        return None
+
+
+# ────────────────────────────────────────────────
+# Country index
+# ────────────────────────────────────────────────
+
+class CountryIndex:
+    """
+    Point-to-district lookups across every city of a country.
+    A small STR tree over city bounding boxes routes each point to the
+    candidate cities, whose own R-trees resolve the district.
+    """
+
+    def __init__(self, country, topic=None):
+        self.country = country
+        self.topic = topic
+        self.cities = []
+        country_dir = os.path.join("countries", country)
+        for city in sorted(os.listdir(country_dir)) if os.path.isdir(country_dir) else []:
+            geo_file = os.path.join(country_dir, city, "map.geojson")
+            if geometry_exists(geo_file):
+                city_index = CityIndex(city, geo_file)
+                if city_index.bbox:
+                    self.cities.append(city_index)
+        self.boxes = [c.bbox for c in self.cities]
+        self.levels = str_pack(self.boxes)
+        self._scores = {}
+
+    def _score(self, city, district):
+        if self.topic is None:
+            return None
+        if city not in self._scores:
+            self._scores[city] = get_store().get_scores(self.country, city, self.topic)
+        return self._scores[city].get(district)
+
+    def lookup(self, points):
+        """
+        Resolves a batch of (lat, lon) points.
+        Returns one (city, district, score) tuple per point, or None where no district contains it.
+        """
+        self._scores = {}  # re-read scores once per batch
+        results = []
+        for lat, lon in points:
+            match = None
+            for i in str_query(self.levels, self.boxes, lon, lat) if self.cities else []:
+                district = self.cities[i].lookup(lon, lat)
+                if district is not None:
+                    match = (self.cities[i].city, district, self._score(self.cities[i].city, district))
+                    break
+            results.append(match)
+        return results
+
+
+_country_indexes = {}
+
+def get_country_index(country, topic=None):
+    """Returns a process-wide CountryIndex, rebuilt when a city's geometry is added or changed."""
+    country_dir = os.path.join("countries", country)
+    signature = tuple(
+        (city, geometry_mtime(os.path.join(country_dir, city, "map.geojson")))
+        for city in (sorted(os.listdir(country_dir)) if os.path.isdir(country_dir) else [])
+        if geometry_exists(os.path.join(country_dir, city, "map.geojson"))
+    )
+    cached = _country_indexes.get((country, topic))
+    if cached is None or cached[0] != signature:
+        cached = (signature, CountryIndex(country, topic))
+        _country_indexes[(country, topic)] = cached
+    return cached[1]
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python spatial_index.py <Country> <topic> < points.csv   (lat,lon per line)")
+        sys.exit(1)
+    country_index = CountryIndex(sys.argv[1], sys.argv[2])
+    points = [tuple(float(v) for v in line.split(",")[:2]) for line in sys.stdin if line.strip()]
+    for (lat, lon), match in zip(points, country_index.lookup(points)):
+        city, district, score = match or ("", "", None)
+        print(f"{lat},{lon},{city},{district},{'' if score is None else score}")
@@ -0,0 +1,51 @@
+import json
+import numpy as np
+from aggregation import aggregate, metric_weights, metrics_matrix, rescore, score_metrics, NEUTRAL_SCORE
+from score_store import ScoreStore
+from scoring import topic_metrics
+
+TOPIC = "cleanliness-dirtiness"
+
+
+def all_metrics(label):
+    return {name: label for name, _ in topic_metrics(TOPIC)}
+
+
+def test_all_excellent_scores_one():
+    assert score_metrics(all_metrics("excellent"), TOPIC) == 1.0
+    assert score_metrics(all_metrics("very poor"), TOPIC) == 0.0
+
+
+def test_aggregate_weights_polarity_and_unknowns():
+    names = ["a", "b", "c"]
+    values = metrics_matrix([{"a": "excellent", "b": "poor", "c": "not a label"}, {}], names)
+    weights = np.array([3.0, 1.0, 1.0])
+    # c is unknown and left out: (3 * 1.0 + 1 * 0.25) / 4
+    scores = aggregate(values, weights, np.ones(3))
+    assert scores[0] == 0.81
+    assert scores[1] == NEUTRAL_SCORE
+    # polarity -1 counts b as 1 - 0.25
+    assert aggregate(values, weights, np.array([1.0, -1.0, 1.0]))[0] == 0.94
+
+
+def test_metric_weights_overrides():
+    names, weights, polarity = metric_weights(TOPIC, weights={"odor_issues": 2}, polarity={"odor_issues": -1})
+    i = names.index("odor_issues")
+    assert weights[i] == 2 and polarity[i] == -1
+    assert (np.delete(polarity, i) == 1).all()
+
+
+def test_rescore_keeps_scores_of_rows_without_metrics(tmp_path):
+    store = ScoreStore(path=str(tmp_path / "scores.sqlite3"))
+    legacy_file = tmp_path / f"{TOPIC}_data.json"
+    legacy_file.write_text(json.dumps({"Legacy District": 0.83}), encoding="utf-8")
+    store.import_json_file(str(legacy_file), "Taiwan", "Taipei", TOPIC)
+    store.upsert("Taiwan", "Taipei", TOPIC, "Scored District",
+                 {"tool_results": [], "metrics": all_metrics("good"), "score": 0.1})
+
+    results = rescore("Taiwan", TOPIC, store=store)
+
+    assert results == {("Taipei", "Scored District"): 0.75}
+    scores = store.get_scores("Taiwan", "Taipei", TOPIC)
+    assert scores["Legacy District"] == 0.83
+    assert scores["Scored District"] == 0.75
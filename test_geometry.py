@@ -0,0 +1,51 @@
+from geometry import build_topology, load_city_geojson, read_index, to_geojson, write_compact
+
+
+def square(x0, y0, size=1.0):
+    return [[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]
+
+
+def city(*rings):
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature",
+         "properties": {"type": "relation", "id": i, "tags": {"name": f"區{i}", "name:en": f"District {i}", "wikidata": "Q1"}},
+         "geometry": {"type": "Polygon", "coordinates": [ring]}}
+        for i, ring in enumerate(rings)
+    ]}
+
+
+def ring_points(feature):
+    return {tuple(round(c, 7) for c in point) for point in feature["geometry"]["coordinates"][0]}
+
+
+def test_shared_border_is_stored_once():
+    arcs, features = build_topology(city(square(121.0, 25.0), square(122.0, 25.0)))
+    left, right = (feature["polygons"][0][0] for feature in features)
+    shared = {ref if ref >= 0 else ~ref for ref in left} & {ref if ref >= 0 else ~ref for ref in right}
+    assert len(shared) == 1
+    assert len(arcs) == 3
+    # The two districts walk the shared border in opposite directions
+    (arc,) = shared
+    assert (arc in left) != (arc in right)
+
+
+def test_topology_round_trip():
+    data = city(square(121.0, 25.0), square(122.0, 25.0))
+    restored = to_geojson(*build_topology(data))
+    for original, feature in zip(data["features"], restored["features"]):
+        assert ring_points(feature) == ring_points(original)
+
+
+def test_compact_file_round_trip(tmp_path):
+    geo_file = str(tmp_path / "map.geojson")
+    data = city(square(121.5123456, 25.0345678, 0.01), square(121.5223456, 25.0345678, 0.01))
+    write_compact(data, geo_file)
+
+    assert [entry["district"] for entry in read_index(geo_file)] == ["District 0", "District 1"]
+    restored = load_city_geojson(geo_file)
+    assert len(restored["features"]) == 2
+    for original, feature in zip(data["features"], restored["features"]):
+        assert ring_points(feature) == ring_points(original)
+        # Only the properties the map layers read are kept
+        assert feature["properties"]["tags"] == {"name": original["properties"]["tags"]["name"],
+                                                 "name:en": original["properties"]["tags"]["name:en"]}
@@ -0,0 +1,45 @@
+from jobs import JobQueue
+
+TOPIC = "cleanliness-dirtiness"
+
+
+def test_enqueue_reuses_active_job(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    first = queue.enqueue("Taiwan", "Taipei", TOPIC, "Da'an")
+    assert queue.enqueue("Taiwan", "Taipei", TOPIC, "Da'an") == first
+    assert queue.enqueue_many("Taiwan", "Taipei", TOPIC, ["Da'an", "Xinyi"])[0] == first
+    assert queue.active_counts() == {"queued": 2, "running": 0}
+
+
+def test_claim_complete_and_fail(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    done_id, failed_id = queue.enqueue_many("Taiwan", "Taipei", TOPIC, ["A", "B"], retrieval_mode="fast")
+
+    job = queue.claim("worker-1")
+    assert (job["id"], job["district"], job["retrieval_mode"]) == (done_id, "A", "fast")
+    assert [row["worker"] for row in queue.running_jobs()] == ["worker-1"]
+    assert queue.claim("worker-2")["id"] == failed_id
+    assert queue.claim("worker-3") is None
+    assert queue.active_counts([("Taiwan", "Taipei", TOPIC)]) == {"queued": 0, "running": 2}
+
+    queue.complete(done_id, 0.75)
+    queue.fail(failed_id, RuntimeError("no sources"))
+    finished = {job["id"]: job for job in queue.finished_since(0)}
+    assert (finished[done_id]["status"], finished[done_id]["score"]) == ("done", 0.75)
+    assert (finished[failed_id]["status"], finished[failed_id]["error"]) == ("failed", "no sources")
+    assert queue.active_districts("Taiwan", "Taipei", TOPIC) == set()
+
+    # A finished district can be queued again
+    assert queue.enqueue("Taiwan", "Taipei", TOPIC, "A") not in (done_id, failed_id)
+
+
+def test_requeue_stale_running_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.enqueue("Taiwan", "Taipei", TOPIC, "A")
+    queue.claim("worker-1")
+
+    assert queue.requeue_stale(max_age=60) == 0
+    assert queue.requeue_stale(max_age=-1) == 1
+    assert queue.active_counts() == {"queued": 1, "running": 0}
+    assert queue.claim("worker-2")["id"] == job_id
+    assert [row["worker"] for row in queue.running_jobs()] == ["worker-2"]
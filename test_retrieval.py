@@ -0,0 +1,23 @@
+import time
+from retrieval import cap_plan, fan_out
+
+PLAN = [("Serper", "a"), ("DuckDuckGo", "a"), ("Serper", "b"), ("DuckDuckGo", "b"), ("Wikipedia", "w")]
+
+
+def test_cap_plan_keeps_every_tool_in_order():
+    assert cap_plan(PLAN, 3) == [("Serper", "a"), ("DuckDuckGo", "a"), ("Wikipedia", "w")]
+    assert cap_plan(PLAN, 4) == [("Serper", "a"), ("DuckDuckGo", "a"), ("Serper", "b"), ("Wikipedia", "w")]
+    assert cap_plan(PLAN, 10) == PLAN
+
+
+def test_fan_out_reports_abandoned_searches_only():
+    abandoned = []
+    tools = {tool: (lambda query: f"{query} result") for tool, _ in PLAN}
+    fan_out(PLAN, tools, on_abandon=lambda reason, count: abandoned.append(reason))
+    assert abandoned == []
+
+    def slow(query):
+        time.sleep(0.5)
+        return "late"
+    fan_out(PLAN, {tool: slow for tool, _ in PLAN}, timeout=0.05, on_abandon=lambda reason, count: abandoned.append(reason))
+    assert abandoned == ["deadline"]
@@ -0,0 +1,46 @@
+import json
+from score_store import ScoreStore, DAY, LEGACY_UPDATED_AT, freshness_label
+
+TOPIC = "cleanliness-dirtiness"
+NOW = 1_700_000_000.0
+
+
+def test_upsert_replaces_record(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.sqlite3"))
+    store.upsert("Taiwan", "Taipei", TOPIC, "Da'an", {"score": 0.4, "metrics": {"litter": "poor"}, "updated_at": NOW})
+    store.upsert("Taiwan", "Taipei", TOPIC, "Da'an", {"score": 0.7, "tool_results": ["snippet"], "updated_at": NOW + 1})
+
+    # Country names are stored lower-cased, so either spelling reads the row
+    assert store.get("taiwan", "Taipei", TOPIC, "Da'an") == {
+        "tool_results": ["snippet"], "metrics": {}, "score": 0.7, "updated_at": NOW + 1,
+    }
+    assert store.get_scores("Taiwan", "Taipei", TOPIC) == {"Da'an": 0.7}
+    assert store.get("Taiwan", "Taipei", TOPIC, "Xinyi") is None
+
+
+def test_stale_districts_oldest_first(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.sqlite3"))
+    for district, age_days in [("A", 40), ("B", 5), ("C", 90)]:
+        store.upsert("Taiwan", "Taipei", TOPIC, district, {"score": 0.5, "updated_at": NOW - age_days * DAY})
+    store.upsert("Taiwan", "Taipei", TOPIC, "Unscored", {"score": None, "updated_at": NOW - 90 * DAY})
+
+    assert store.stale_districts("Taiwan", "Taipei", TOPIC, ttl_days=30, now=NOW) == ["C", "A"]
+    assert store.stale_districts("Taiwan", "Taipei", TOPIC, ttl_days=100, now=NOW) == []
+    assert store.get_updated_at("Taiwan", "Taipei", TOPIC) == {
+        "A": NOW - 40 * DAY, "B": NOW - 5 * DAY, "C": NOW - 90 * DAY,
+    }
+
+
+def test_legacy_import_is_stale_and_runs_once(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.sqlite3"))
+    data_file = tmp_path / f"{TOPIC}_data.json"
+    data_file.write_text(json.dumps({"A": 0.3, "B": {"score": 0.6, "metrics": {"litter": "good"}}}), encoding="utf-8")
+    store.upsert("Taiwan", "Taipei", TOPIC, "B", {"score": 0.9, "updated_at": NOW})
+
+    assert store.import_json_file(str(data_file), "Taiwan", "Taipei", TOPIC) == 2
+    assert store.import_json_file(str(data_file), "Taiwan", "Taipei", TOPIC) == 0
+    # Existing rows win; imported rows have no trustworthy age and count as stale
+    assert store.get_scores("Taiwan", "Taipei", TOPIC) == {"A": 0.3, "B": 0.9}
+    assert store.get("Taiwan", "Taipei", TOPIC, "A")["updated_at"] == LEGACY_UPDATED_AT
+    assert store.stale_districts("Taiwan", "Taipei", TOPIC, ttl_days=30, now=NOW) == ["A"]
+    assert freshness_label(LEGACY_UPDATED_AT, now=NOW) == "imported, age unknown"
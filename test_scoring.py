@@ -0,0 +1,60 @@
+import httpx
+import pytest
+from openai import BadRequestError
+from scoring import score_evidence_batch, topic_metrics
+
+TOPIC = "cleanliness-dirtiness"
+
+
+class Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """Answers every call with `content`; raises `structured_error` when response_format is bound."""
+
+    def __init__(self, content, structured_error=None):
+        self.content = content
+        self.structured_error = structured_error
+        self.calls = []
+
+    def bind(self, **kwargs):
+        llm = self
+
+        class Bound:
+            def invoke(self, prompt):
+                llm.calls.append("structured")
+                if llm.structured_error is not None:
+                    raise llm.structured_error
+                return Reply(llm.content)
+        return Bound()
+
+    def invoke(self, prompt):
+        self.calls.append("plain")
+        return Reply(self.content)
+
+
+def bad_request():
+    request = httpx.Request("POST", "https://openrouter.ai/api/v1/chat/completions")
+    response = httpx.Response(400, request=request)
+    return BadRequestError("response_format is not supported", response=response, body=None)
+
+
+def test_non_object_reply_scores_nothing():
+    evidence = [("A", []), ("B", [])]
+    assert score_evidence_batch(FakeLLM('["excellent"]'), evidence, "City", "Country", TOPIC) == {"A": {}, "B": {}}
+    assert score_evidence_batch(FakeLLM('{"A": "good", "B": null}'), evidence, "City", "Country", TOPIC) == {"A": {}, "B": {}}
+
+
+def test_only_bad_requests_fall_back_to_plain_prompt():
+    name = topic_metrics(TOPIC)[0][0]
+    evidence = [("A", []), ("B", [])]
+    llm = FakeLLM('{"A": {"%s": "Good"}}' % name, structured_error=bad_request())
+    assert score_evidence_batch(llm, evidence, "City", "Country", TOPIC) == {"A": {name: "good"}, "B": {}}
+    assert llm.calls == ["structured", "plain"]
+
+    llm = FakeLLM("{}", structured_error=TimeoutError("read timed out"))
+    with pytest.raises(TimeoutError):
+        score_evidence_batch(llm, evidence, "City", "Country", TOPIC)
+    assert llm.calls == ["structured"]
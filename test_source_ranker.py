@@ -0,0 +1,50 @@
+import random
+import pytest
+from source_ranker import KeywordMatcher, mentions_district, rank_sources, relevance
+
+KEYWORDS = ["cleanliness", "illegal dumping", "垃圾清運"]
+
+
+def test_keyword_matcher_matches_substring_search():
+    patterns = ["he", "she", "his", "hers", "清潔", "清潔隊", "a", "aa"]
+    matcher = KeywordMatcher(patterns)
+    rng = random.Random(3)
+    alphabet = "ahers清潔隊 "
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert matcher.find(text) == {p for p in patterns if p in text}
+
+
+def test_keyword_matcher_is_case_insensitive():
+    assert KeywordMatcher(["Da'an District", "Cleanliness"]).find("DA'AN district CLEANLINESS report") == \
+        {"da'an district", "cleanliness"}
+
+
+def test_relevance_signals():
+    assert relevance("Weather today", KEYWORDS, "Da'an District") == 0.0
+    assert relevance("Da'an District cleanliness", KEYWORDS, "Da'an District") == pytest.approx(0.6)
+    assert relevance("Da'an District 垃圾清運 統計 (epa.gov.tw)", KEYWORDS, "Da'an District") == pytest.approx(0.75)
+
+
+def test_mentions_district_ignores_case_width_and_punctuation():
+    assert mentions_district("ＤＡ'ＡＮ　DISTRICT office", "Da'an District")
+    assert not mentions_district("Daan Park", "Xinyi District")
+
+
+def test_rank_sources_dedupes_filters_and_orders():
+    sources = [
+        {"tool": "Serper", "text": "Da'an District cleanliness inspection"},
+        {"tool": "DuckDuckGo", "text": "Da'an District cleanliness inspection statistics 2023"},
+        {"tool": "Wikipedia", "text": "Da'an District illegal dumping fines cleanliness"},
+        {"tool": "Serper", "text": "Unrelated weather report"},
+        {"tool": "Serper", "text": "   "},
+    ]
+    ranked = rank_sources(sources, "Da'an District", KEYWORDS)
+    assert [s["tool"] for s in ranked] == ["Wikipedia", "DuckDuckGo"]
+    assert ranked[0]["relevance"] >= ranked[1]["relevance"]
+
+
+def test_rank_sources_respects_top_k_and_token_budget():
+    sources = [{"tool": "Serper", "text": f"Da'an District cleanliness report {i} " + "x" * 200} for i in range(10)]
+    assert len(rank_sources(sources, "Da'an District", KEYWORDS, top_k=3)) == 3
+    assert len(rank_sources(sources, "Da'an District", KEYWORDS, token_budget=120)) == 2
@@ -0,0 +1,44 @@
+import random
+from geometry import write_compact
+from spatial_index import CityIndex, str_pack, str_query
+
+
+def test_str_query_matches_brute_force():
+    rng = random.Random(7)
+    boxes = []
+    for _ in range(1000):
+        x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+        boxes.append([x, y, x + rng.uniform(0.1, 5), y + rng.uniform(0.1, 5)])
+    levels = str_pack(boxes)
+    assert len(levels[-1]) == 1
+    for _ in range(200):
+        x, y = rng.uniform(0, 105), rng.uniform(0, 105)
+        expected = {i for i, b in enumerate(boxes) if b[0] <= x <= b[2] and b[1] <= y <= b[3]}
+        assert set(str_query(levels, boxes, x, y)) == expected
+
+
+def district(osm_id, name, polygons):
+    return {"type": "Feature",
+            "properties": {"type": "relation", "id": osm_id, "tags": {"name": name, "name:en": name}},
+            "geometry": {"type": "MultiPolygon", "coordinates": polygons}}
+
+
+def ring(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def test_city_index_lookup(tmp_path):
+    geo_file = str(tmp_path / "map.geojson")
+    write_compact({"type": "FeatureCollection", "features": [
+        # Outer district with a hole, and a second part further east
+        district(1, "Outer", [[ring(121.0, 25.0, 121.3, 25.3), ring(121.1, 25.1, 121.2, 25.2)],
+                           [ring(121.5, 25.0, 121.6, 25.1)]]),
+        district(2, "Inner", [[ring(121.1, 25.1, 121.2, 25.2)]]),
+    ]}, geo_file)
+
+    index = CityIndex("Test City", geo_file)
+    assert index.lookup(121.05, 25.05) == "Outer"
+    assert index.lookup(121.15, 25.15) == "Inner"
+    assert index.lookup(121.55, 25.05) == "Outer"
+    assert index.lookup(121.4, 25.05) is None
+    assert index.lookup(120.0, 24.0) is None
@@ -0,0 +1,348 @@
+import os
+import json
+import math
+import time
+import struct
+from folium.plugins import VectorGridProtobuf
+from geometry import pyramid_file_for_zoom, ensure_pyramid, geometry_exists
+from map_tool import make_colormap, load_annotated_features
+from score_store import get_store
+
+# ────────────────────────────────────────────────
+# Tile layout
+# ────────────────────────────────────────────────
+# Tiles are written under Streamlit's static folder so the browser can fetch
+# them directly (requires server.enableStaticServing, see .streamlit/config.toml).
+TILE_ROOT = os.path.join("static", "tiles")
+TILE_URL_ROOT = "/app/static/tiles"
+TILE_LAYER_NAME = "districts"
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+DEFAULT_MIN_ZOOM = 5
+DEFAULT_MAX_ZOOM = 11
+
+
+def tile_dir(country, topic):
+    return os.path.join(TILE_ROOT, country.lower(), topic)
+
+
+def tile_url(country, topic):
+    return f"{TILE_URL_ROOT}/{country.lower()}/{topic}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+def read_manifest(country, topic):
+    """Returns the tiles.json manifest for a country/topic, or None if no tiles were built."""
+    path = os.path.join(tile_dir(country, topic), "tiles.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ────────────────────────────────────────────────
+# Minimal Mapbox Vector Tile (v2) encoder
+# ────────────────────────────────────────────────
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number, payload):
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(number, values):
+    return _bytes_field(number, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return _bytes_field(1, value.encode("utf-8"))
+    return _field(3, 1) + struct.pack("<d", float(value))
+
+
+def _encode_polygon(rings):
+    """Encodes tile-space rings as MoveTo/LineTo/ClosePath commands with zigzag deltas."""
+    commands, cx, cy = [], 0, 0
+    for ring in rings:
+        x, y = ring[0]
+        commands += [(1 & 0x7) | (1 << 3), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        commands.append((2 & 0x7) | ((len(ring) - 1) << 3))
+        for x, y in ring[1:]:
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+        commands.append((7 & 0x7) | (1 << 3))
+    return commands
+
+
+def encode_tile(features):
+    """
+    Encodes [(properties, rings)] as a single-layer MVT tile.
+    rings are tile-space integer rings (exterior first, not closed).
+    """
+    keys, values = [], []
+    key_index, value_index = {}, {}
+    encoded_features = []
+    for feature_id, (properties, rings) in enumerate(features, 1):
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+            value_key = (type(value).__name__, value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(value)
+            tags += [key_index[key], value_index[value_key]]
+        body = (_field(1, 0) + _varint(feature_id)
+                + _packed_field(2, tags)
+                + _field(3, 0) + _varint(3)  # POLYGON
+                + _packed_field(4, _encode_polygon(rings)))
+        encoded_features.append(_bytes_field(2, body))
+
+    layer = (_field(15, 0) + _varint(2)
+             + _bytes_field(1, TILE_LAYER_NAME.encode("utf-8"))
+             + b"".join(encoded_features)
+             + b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys)
+             + b"".join(_bytes_field(4, _encode_value(v)) for v in values)
+             + _field(5, 0) + _varint(TILE_EXTENT))
+    return _bytes_field(3, layer)
+
+
+# ────────────────────────────────────────────────
+# Projection and clipping
+# ────────────────────────────────────────────────
+
+def _project(lon, lat, zoom):
+    """Web Mercator lon/lat -> global tile coordinates at zoom (1 unit = 1 tile)."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = (lon + 180.0) / 360.0 * n
+    y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2 * n
+    return x, y
+
+
+def _clip_ring(ring, lo, hi):
+    """Sutherland-Hodgman clip of a ring against the square [lo, hi]^2."""
+    def clip(points, inside, intersect):
+        out = []
+        for i, current in enumerate(points):
+            previous = points[i - 1]
+            if inside(current):
+                if not inside(previous):
+                    out.append(intersect(previous, current))
+                out.append(current)
+            elif inside(previous):
+                out.append(intersect(previous, current))
+        return out
+
+    def at_x(x):
+        return lambda a, b: (x, a[1] + (b[1] - a[1]) * (x - a[0]) / (b[0] - a[0]))
+
+    def at_y(y):
+        return lambda a, b: (a[0] + (b[0] - a[0]) * (y - a[1]) / (b[1] - a[1]), y)
+
+    for inside, intersect in (
+        (lambda p: p[0] >= lo, at_x(lo)),
+        (lambda p: p[0] <= hi, at_x(hi)),
+        (lambda p: p[1] >= lo, at_y(lo)),
+        (lambda p: p[1] <= hi, at_y(hi)),
+    ):
+        if not ring:
+            break
+        ring = clip(ring, inside, intersect)
+    return ring
+
+
+def _signed_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _tile_rings(projected_polygon, tx, ty):
+    """Clips one projected polygon to tile (tx, ty) and returns integer rings with MVT winding."""
+    lo, hi = -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER
+    rings = []
+    for ring_index, ring in enumerate(projected_polygon):
+        local = [((x - tx) * TILE_EXTENT, (y - ty) * TILE_EXTENT) for x, y in ring]
+        clipped = _clip_ring(local, lo, hi)
+        points = []
+        for x, y in clipped:
+            point = (int(round(x)), int(round(y)))
+            if not points or points[-1] != point:
+                points.append(point)
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        if len(points) < 3 or _signed_area(points) == 0:
+            if ring_index == 0:
+                return []
+            continue
+        # MVT: exterior rings have positive area in tile space, holes negative
+        if (_signed_area(points) > 0) != (ring_index == 0):
+            points.reverse()
+        rings.append(points)
+    return rings
+
+
+# ────────────────────────────────────────────────
+# Tile building
+# ────────────────────────────────────────────────
+
+def _city_geo_files(country, cities=None):
+    country_dir = os.path.join("countries", country)
+    if not os.path.isdir(country_dir):
+        return []
+    names = cities if cities is not None else sorted(os.listdir(country_dir))
+    geo_files = []
+    for city in names:
+        geo_file = os.path.join(country_dir, city, "map.geojson")
+        if geometry_exists(geo_file):
+            geo_files.append((city, geo_file))
+    return geo_files
+
+
+def build_tiles(country, topic, cities=None, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM):
+    """
+    Builds a z/x/y.pbf vector tile pyramid of every cached city geometry in a
+    country, with each district's current score and fill color baked into
+    its properties. Each zoom uses the matching simplified geometry level.
+    Returns the manifest written to tiles.json.
+    """
+    started = time.time()
+    colormap = make_colormap()
+    store = get_store()
+    out_dir = tile_dir(country, topic)
+    geo_files = _city_geo_files(country, cities)
+
+    tiles_written = 0
+    bounds = [180.0, 90.0, -180.0, -90.0]
+    for zoom in range(min_zoom, max_zoom + 1):
+        tiles = {}
+        for city, geo_file in geo_files:
+            ensure_pyramid(geo_file)
+            scores = store.get_scores(country, city, topic)
+            for feature in load_annotated_features(pyramid_file_for_zoom(geo_file, zoom)):
+                geometry = feature["geometry"]
+                if geometry["type"] == "Polygon":
+                    polygons = [geometry["coordinates"]]
+                elif geometry["type"] == "MultiPolygon":
+                    polygons = geometry["coordinates"]
+                else:
+                    continue
+                district = feature["properties"]["district"]
+                score = scores.get(district)
+                properties = {
+                    "district": district,
+                    "city": city,
+                    "layer_id": f"{city}_{topic}",
+                    "score": score,
+                    "fill": colormap(score)[:7] if score is not None else "#dddddd",
+                }
+                for polygon in polygons:
+                    if not polygon or not polygon[0]:
+                        continue
+                    for lon, lat, *_ in polygon[0]:
+                        bounds = [min(bounds[0], lon), min(bounds[1], lat), max(bounds[2], lon), max(bounds[3], lat)]
+                    projected = [[_project(lon, lat, zoom) for lon, lat, *_ in ring] for ring in polygon]
+                    xs = [x for x, _ in projected[0]]
+                    ys = [y for _, y in projected[0]]
+                    for tx in range(int(min(xs)), int(max(xs)) + 1):
+                        for ty in range(int(min(ys)), int(max(ys)) + 1):
+                            rings = _tile_rings(projected, tx, ty)
+                            if rings:
+                                tiles.setdefault((tx, ty), []).append((properties, rings))
+
+        for (tx, ty), features in tiles.items():
+            path = os.path.join(out_dir, str(zoom), str(tx), f"{ty}.pbf")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(encode_tile(features))
+        tiles_written += len(tiles)
+        print(f"🧱 z{zoom}: {len(tiles)} tiles")
+
+    manifest = {
+        "country": country,
+        "topic": topic,
+        "cities": [city for city, _ in geo_files],
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "bounds": bounds,
+        "tiles": tiles_written,
+        "built_at": time.time(),
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "tiles.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"✅ Built {tiles_written} tiles for {country} / {topic} in {time.time() - started:.1f}s")
+    return manifest
+
+
+# ────────────────────────────────────────────────
+# Map rendering
+# ────────────────────────────────────────────────
+
+def add_tile_layer(map_object, country, topic, is_visible=True):
+    """
+    Adds a country-wide vector tile layer built by build_tiles.
+    The browser only fetches the tiles in view; colors come from the baked "fill" property.
+    Returns False if no tiles have been built for the country/topic.
+    """
+    manifest = read_manifest(country, topic)
+    if manifest is None:
+        print(f"Warning: no tiles built for {country} / {topic}")
+        return False
+
+    options = """{
+        "maxNativeZoom": %d,
+        "minNativeZoom": %d,
+        "interactive": true,
+        "vectorTileLayerStyles": {
+            "%s": function(properties) {
+                return {
+                    "fill": true,
+                    "fillColor": properties.fill,
+                    "fillOpacity": properties.score === undefined ? 0.4 : 0.75,
+                    "color": "black",
+                    "weight": 1
+                };
+            }
+        }
+    }""" % (manifest["max_zoom"], manifest["min_zoom"], TILE_LAYER_NAME)
+
+    VectorGridProtobuf(
+        tile_url(country, topic),
+        name=f"{country}_{topic}_tiles",
+        options=options,
+        show=is_visible,
+    ).add_to(map_object)
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python tiles.py <Country> <topic> [min_zoom] [max_zoom]")
+        sys.exit(1)
+    build_tiles(
+        sys.argv[1], sys.argv[2],
+        min_zoom=int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_MIN_ZOOM,
+        max_zoom=int(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_MAX_ZOOM,
+    )
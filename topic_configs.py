@@ -0,0 +1,80 @@
+# ttl_days: how long a district's score stays fresh before it is re-scored
+# weights: per-metric weight in the overall score (default 1)
+# polarity: per-metric 1 or -1 (-1 counts as 1 - value); defaults to 1, since every
+#           metric is rated on the same quality scale. Use -1 only for a metric
+#           whose prompt asks for a severity rating (see aggregation.py)
+TOPIC_CONFIG = {
+    "cleanliness-dirtiness": {
+        'ttl_days': 30,
+        'keywords': [
+            # positive / neutral
+            "cleanliness", # English
+            "public sanitation", # English
+            "environmental hygiene", # English
+            "waste collection", # English
+            "sweeping", # English
+            "sanitation management", # English
+            "sanitation crews", # English
+            "recycling", # English
+            "整潔", # Chinese
+            "公共場所衛生", # Chinese
+            "環境衛生", # Chinese
+            "垃圾清運", # Chinese
+            "清掃", # Chinese
+            "衛生管理", # Chinese
+            "清潔隊", # Chinese
+            "資源回收", # Chinese
+            "清潔", # Japanese
+            "公衆衛生", # Japanese
+            "環境衛生", # Japanese
+            "ごみ収集", # Japanese
+            "掃除", # Japanese
+            "衛生管理", # Japanese
+            "清掃員", # Japanese
+            "資源回収", # Japanese
+
+            # negative / filthiness
+            "dirtiness", # English
+            "trash accumulation", # English
+            "illegal dumping", # English
+            "pollution", # English
+            "hygiene issues", # English
+            "bad smell", # English
+            "insufficient cleaning", # English
+            "messy environment", # English
+            "髒亂", # Chinese
+            "垃圾堆積", # Chinese
+            "違規棄置", # Chinese
+            "污染", # Chinese
+            "衛生問題", # Chinese
+            "臭味", # Chinese
+            "清潔不足", # Chinese
+            "環境髒亂", # Chinese
+            "不潔", # Japanese
+            "ごみの蓄積", # Japanese
+            "不法投棄", # Japanese
+            "汚染", # Japanese
+            "衛生問題", # Japanese
+            "悪臭", # Japanese
+            "清掃不足", # Japanese
+            "不衛生な環境" # Japanese
+        ],
+        'weights': {},
+        'polarity': {},
+        'metrics': {
+            'positive': """
+- overall_cleanliness (very poor, poor, average, good, excellent)
+- street_cleanliness (very poor, poor, average, good, excellent)
+- waste_management (very poor, poor, average, good, excellent)
+- public_area_cleanliness (very poor, poor, average, good, excellent)
+- park_cleanliness (very poor, poor, average, good, excellent)
+- illegal_dumping_incidents (very poor, poor, average, good, excellent)
+""",
+            'negative': """
+- odor_issues (very poor, poor, average, good, excellent)
+- sanitation_compliance (very poor, poor, average, good, excellent; how well local rules and inspections are followed)
+- community_engagement (very poor, poor, average, good, excellent; participation in clean-up or awareness activities)
+"""
+        }
+    },
+}
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# ────────────────────────────────────────────────
+# Export settings
+# ────────────────────────────────────────────────
+# Finished traces are appended as one JSON object per line to TRACE_FILE
+# (default below; "" disables export)
+DEFAULT_TRACE_FILE = os.path.join(".cache", "traces.jsonl")
+TRACE_FILE_MAX_BYTES = 16 * 1024 * 1024  # rotated to <file>.1 beyond this
+RECENT_TRACES = 50
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_recent = deque(maxlen=RECENT_TRACES)
+_export_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed stage. Holds attributes, counters (calls, tokens, cache hits)
+    and child spans. Spans with no parent are traces: they are kept in memory
+    for the app and appended to trace_file() when they finish.
+    """
+
+    def __init__(self, name, parent=None, attrs=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.attrs = dict(attrs or {})
+        self.counters = {}
+        self.children = []
+        self.started_at = time.time()
+        self.duration = None
+        self.error = None
+        self._lock = threading.Lock()
+        if parent is not None:
+            with parent._lock:
+                parent.children.append(self)
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def totals(self):
+        """Counters summed over this span and all its descendants."""
+        totals = dict(self.counters)
+        for child in list(self.children):
+            for key, value in child.totals().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def to_dict(self):
+        data = {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.counters:
+            data["counters"] = dict(self.counters)
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict() for child in list(self.children)]
+        return data
+
+    @classmethod
+    def from_dict(cls, data, parent=None):
+        """Rebuilds a finished span tree from to_dict() output (e.g. a line of the trace file)."""
+        s = cls(data["name"], parent=parent, attrs=data.get("attrs"))
+        s.trace_id = data.get("trace_id", s.trace_id)
+        s.started_at = data.get("started_at", s.started_at)
+        s.duration = None if data.get("duration_ms") is None else data["duration_ms"] / 1000
+        s.counters = dict(data.get("counters", {}))
+        s.error = data.get("error")
+        for child in data.get("children", []):
+            cls.from_dict(child, parent=s)
+        return s
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times the block as a child of the current span (or as a new trace)."""
+    parent = _current.get()
+    s = Span(name, parent, attrs)
+    token = _current.set(s)
+    started = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.duration = time.perf_counter() - started
+        _current.reset(token)
+        if parent is None:
+            _finish_trace(s)
+
+
+def traced(name=None):
+    """Decorator form of span(); the span is named after the function by default."""
+    def decorate(func):
+        @wraps(func)
+        def run(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return run
+    return decorate
+
+
+def count(key, n=1):
+    """Adds n to a counter on the current span; a no-op outside any span."""
+    s = _current.get()
+    if s is not None:
+        s.count(key, n)
+
+
+def annotate(**attrs):
+    s = _current.get()
+    if s is not None:
+        s.set(**attrs)
+
+
+def bind(func):
+    """
+    Returns func bound to the current span, for work handed to thread pools
+    (context variables do not follow submit()). Safe to call from many threads.
+    """
+    parent = _current.get()
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def record_token_usage(llm_output):
+    """Counts prompt/completion tokens from a chat model's llm_output["token_usage"]."""
+    usage = (llm_output or {}).get("token_usage") or {}
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        if usage.get(key):
+            count(key, usage[key])
+
+
+# ────────────────────────────────────────────────
+# Export & summaries
+# ────────────────────────────────────────────────
+
+def trace_file():
+    """
+    Path of the JSONL trace sink, or "" when export is off. Read on each use,
+    since modules import tracing before the app has loaded .env.
+    """
+    return os.getenv("TRACE_FILE", DEFAULT_TRACE_FILE)
+
+
+def _finish_trace(s):
+    _recent.append(s)
+    path = trace_file()
+    if not path:
+        return
+    line = json.dumps(s.to_dict(), ensure_ascii=False, default=str)
+    with _export_lock:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > TRACE_FILE_MAX_BYTES:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write trace to {path}: {e}")
+
+
+def _tail_lines(path, limit, block=64 * 1024):
+    """The last limit lines of a file, read backwards from its end."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b""
+        while end > 0 and data.count(b"\n") <= limit:
+            start = max(0, end - block)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    return [line.decode("utf-8", "replace") for line in data.splitlines()[-limit:]]
+
+
+def read_traces(path=None, limit=RECENT_TRACES):
+    """
+    The last limit traces exported to the trace file (by any process, e.g. the
+    job workers), newest first. Unreadable lines are skipped.
+    """
+    path = trace_file() if path is None else path
+    if not path or not os.path.exists(path):
+        return []
+    traces = []
+    for line in _tail_lines(path, limit):
+        try:
+            traces.append(Span.from_dict(json.loads(line)))
+        except (ValueError, KeyError, TypeError):
+            continue  # e.g. a line another process is still writing
+    return traces[::-1]
+
+
+def recent_traces(limit=RECENT_TRACES):
+    """
+    Most recent finished traces, newest first: this process's own plus the ones
+    other processes exported to the trace file.
+    """
+    traces = {s.trace_id: s for s in read_traces(limit=limit)}
+    traces.update({s.trace_id: s for s in _recent})
+    return sorted(traces.values(), key=lambda s: s.started_at, reverse=True)[:limit]
+
+
+def flatten(s, depth=0):
+    """Rows of {stage, depth, ms, counters...} for a span tree, depth-first."""
+    row = {"stage": "  " * depth + s.name, "ms": None if s.duration is None else round(s.duration * 1000, 1)}
+    row.update(s.counters)
+    if s.error:
+        row["error"] = s.error
+    rows = [row]
+    for child in list(s.children):
+        rows.extend(flatten(child, depth + 1))
+    return rows
+
+
+def stage_summary(traces):
+    """Per span name: count, total and max milliseconds, summed over the given traces."""
+    summary = {}
+
+    def visit(s):
+        entry = summary.setdefault(s.name, {"stage": s.name, "spans": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = (s.duration or 0.0) * 1000
+        entry["spans"] += 1
+        entry["total_ms"] = round(entry["total_ms"] + ms, 1)
+        entry["max_ms"] = round(max(entry["max_ms"], ms), 1)
+        for child in list(s.children):
+            visit(child)
+
+    for trace in traces:
+        visit(trace)
+    return sorted(summary.values(), key=lambda e: e["total_ms"], reverse=True)